@@ -1,22 +1,164 @@
 """
 Modular agent implementations for the LangGraph workflow.
 """
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Literal, Optional
 import json, re
+from functools import lru_cache
 from pathlib import Path
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langsmith import traceable
+from pydantic import BaseModel, Field
 
-# Load tone samples
+from integrations.llm_cache import cache_for, cache_key, llm_identity
+from integrations.metrics import record_cache, record_usage
+from integrations.rate_limiter import get_rate_limiter
+from integrations.tracing import traced
+from agents.intent_classifier import classify_fast, learn_intent
+from agents.review_gate import run_gate
+from agents.json_stream import PartialJSONFields
+from memory.sent_index import estimate_tokens
+
+# Tone samples, loaded on first use (TONE_SAMPLES stays available as a module attribute)
 TONE_SAMPLES_PATH = Path(__file__).parent.parent.parent / "data" / "tone_samples.json"
-with open(TONE_SAMPLES_PATH, "r", encoding="utf-8") as f:
-    TONE_SAMPLES = json.load(f)
+
+@lru_cache(maxsize=1)
+def get_tone_samples() -> Dict[str, str]:
+    with open(TONE_SAMPLES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def __getattr__(name: str):
+    if name == "TONE_SAMPLES":
+        return get_tone_samples()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Default sender name
 DEFAULT_SENDER_NAME = "Manasa"
 
-@traceable(run_type="llm")
+# ===========================
+# LLM call helpers
+# ===========================
+# Every LLM-backed agent renders its prompt and goes through these helpers, so
+# the response cache (integrations/llm_cache.py) can be switched on per agent,
+# token usage / cache hits are reported to integrations/metrics.py and every
+# call is admitted (and retried) by integrations/rate_limiter.py.
+def _admission(llm, prompt_value):
+    """(rate limiter, model, estimated tokens) for one call."""
+    limiter = get_rate_limiter()
+    return limiter, llm_identity(llm)["model"], limiter.estimate(prompt_value.to_string(), llm)
+
+def _message_text(message) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
+
+def _cache_slot(agent: str, prompt_value, llm):
+    cache = cache_for(agent)
+    if cache is None:
+        return None, None
+    ident = llm_identity(llm)
+    return cache, cache_key(prompt_value.to_string(), ident["model"], ident["temperature"])
+
+def _cache_get(cache, key, agent: str) -> Optional[str]:
+    if cache is None:
+        return None
+    raw = cache.get(key, agent)
+    record_cache(raw is not None)
+    return raw
+
+async def _acache_get(cache, key, agent: str) -> Optional[str]:
+    # Disk lookups run in a worker thread so the pipeline loop never waits on SQLite.
+    if cache is None:
+        return None
+    raw = await cache.aget(key, agent)
+    record_cache(raw is not None)
+    return raw
+
+def _invoke_llm(agent: str, chat_prompt, llm, inputs: Dict[str, Any]) -> str:
+    prompt_value = chat_prompt.invoke(inputs)
+    cache, key = _cache_slot(agent, prompt_value, llm)
+    raw = _cache_get(cache, key, agent)
+    if raw is None:
+        limiter, model, tokens = _admission(llm, prompt_value)
+        message = limiter.call(model, tokens, lambda: llm.invoke(prompt_value))
+        record_usage(message)
+        raw = _message_text(message)
+        if cache:
+            cache.set(key, raw)
+    return raw
+
+async def _ainvoke_llm(agent: str, chat_prompt, llm, inputs: Dict[str, Any]) -> str:
+    prompt_value = chat_prompt.invoke(inputs)
+    cache, key = _cache_slot(agent, prompt_value, llm)
+    raw = await _acache_get(cache, key, agent)
+    if raw is None:
+        limiter, model, tokens = _admission(llm, prompt_value)
+        message = await limiter.acall(model, tokens, lambda: llm.ainvoke(prompt_value))
+        record_usage(message)
+        raw = _message_text(message)
+        if cache:
+            cache.set(key, raw)
+    return raw
+
+def _stream_fields(on_partial: Callable[[Dict[str, str]], None]) -> Callable[[str], None]:
+    """
+    on_partial receives deltas: {"subject"/"body": text appended since the last
+    call}. An empty string means the field (re)starts, e.g. when the cascade
+    drafts again with the strong model, and the consumer should clear it.
+    """
+    fields = PartialJSONFields(("subject", "body"))
+
+    def on_text(chunk: str) -> None:
+        deltas = fields.feed(chunk)
+        if fields.started:
+            on_partial({key: "" for key in fields.started})
+        deltas = {key: text for key, text in deltas.items() if text}
+        if deltas:
+            on_partial(deltas)
+    return on_text
+
+def _stream_llm(agent: str, chat_prompt, llm, inputs: Dict[str, Any], on_text: Callable[[str], None]) -> str:
+    prompt_value = chat_prompt.invoke(inputs)
+    cache, key = _cache_slot(agent, prompt_value, llm)
+    raw = _cache_get(cache, key, agent)
+    if raw is not None:
+        on_text(raw)
+        return raw
+    total = None
+    limiter, model, tokens = _admission(llm, prompt_value)
+    for chunk in limiter.stream(model, tokens, lambda: llm.stream(prompt_value)):
+        total = chunk if total is None else total + chunk
+        on_text(_message_text(chunk))
+    limiter.settle(model, tokens, total)
+    record_usage(total)
+    raw = _message_text(total) if total is not None else ""
+    if cache:
+        cache.set(key, raw)
+    return raw
+
+async def _astream_llm(agent: str, chat_prompt, llm, inputs: Dict[str, Any], on_text: Callable[[str], None]) -> str:
+    prompt_value = chat_prompt.invoke(inputs)
+    cache, key = _cache_slot(agent, prompt_value, llm)
+    raw = await _acache_get(cache, key, agent)
+    if raw is not None:
+        on_text(raw)
+        return raw
+    total = None
+    limiter, model, tokens = _admission(llm, prompt_value)
+    async for chunk in limiter.astream(model, tokens, lambda: llm.astream(prompt_value)):
+        total = chunk if total is None else total + chunk
+        on_text(_message_text(chunk))
+    limiter.settle(model, tokens, total)
+    record_usage(total)
+    raw = _message_text(total) if total is not None else ""
+    if cache:
+        cache.set(key, raw)
+    return raw
+
+# Tracing (integrations/tracing.py): run_type="llm" marks agents that always
+# call the model, "chain" those whose LLM call can be skipped (local intent
+# fast path, review gate, suggested edits), "parser"/"tool" the local steps.
+# router_agent is a few dict lookups and is not traced.
+@traced(run_type="parser")
 def input_parser_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     messages = state.get("messages", [])
     if not messages:
@@ -47,8 +189,9 @@ def input_parser_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     }
     return {"parsed": parsed}
 
-@traceable(run_type="llm")
-def intent_detection_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+INTENT_LABELS = {"outreach","follow-up","apology","internal_update","ask_for_meeting","introduction","promotion","other"}
+
+def _intent_prompt(state: Dict[str, Any]):
     parsed = state.get("parsed", {})
     prompt = parsed.get("prompt_text", "")
     system = (
@@ -60,20 +203,62 @@ def intent_detection_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
         ("system", system),
         ("user", "{text}")
     ])
-    chain = chat_prompt | llm | StrOutputParser()
-    decision = chain.invoke({"text": prompt}).strip().lower()
-    known = {"outreach","follow-up","apology","internal_update","ask_for_meeting","introduction","promotion","other"}
-    if decision not in known:
+    return chat_prompt, {"text": prompt}
+
+def _intent_output(raw: str) -> Dict[str, Any]:
+    decision = raw.strip().lower()
+    if decision not in INTENT_LABELS:
         decision = "other"
     return {"intent": decision}
 
-@traceable(run_type="llm")
+# Counts of intents answered locally vs. by the LLM, and LLM labels learned locally
+INTENT_PATH_STATS = {"local": 0, "llm": 0, "learned": 0}
+
+def _fast_intent(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    text = state.get("parsed", {}).get("prompt_text", "")
+    hit = classify_fast(text)
+    if hit is None:
+        return None
+    INTENT_PATH_STATS["local"] += 1
+    label, confidence = hit
+    return {"intent": label, "intent_source": "local", "intent_confidence": round(confidence, 3)}
+
+def _llm_intent(state: Dict[str, Any], raw: str, learn: bool) -> Dict[str, Any]:
+    output = _intent_output(raw)
+    # Only a valid label from a fast-path fallback is learned, not "other" substituted for junk.
+    if learn and raw.strip().lower() in INTENT_LABELS:
+        if learn_intent(state.get("parsed", {}).get("prompt_text", ""), output["intent"]):
+            INTENT_PATH_STATS["learned"] += 1
+    return {**output, "intent_source": "llm"}
+
+@traced(run_type="chain")
+def intent_detection_agent(state: Dict[str, Any], llm, use_fast_path: bool = True) -> Dict[str, Any]:
+    if use_fast_path:
+        fast = _fast_intent(state)
+        if fast:
+            return fast
+    INTENT_PATH_STATS["llm"] += 1
+    chat_prompt, inputs = _intent_prompt(state)
+    return _llm_intent(state, _invoke_llm("intent_detection", chat_prompt, llm, inputs), learn=use_fast_path)
+
+@traced(run_type="chain")
+async def aintent_detection_agent(state: Dict[str, Any], llm, use_fast_path: bool = True) -> Dict[str, Any]:
+    if use_fast_path:
+        fast = _fast_intent(state)
+        if fast:
+            return fast
+    INTENT_PATH_STATS["llm"] += 1
+    chat_prompt, inputs = _intent_prompt(state)
+    return _llm_intent(state, await _ainvoke_llm("intent_detection", chat_prompt, llm, inputs), learn=use_fast_path)
+
+@traced(run_type="tool")
 def tone_stylist_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     parsed = state.get("parsed") or {}
     prefer = parsed.get("preferred_tone") or state.get("user_profile", {}).get("preferred_tone", "formal")
     
-    tone = prefer if prefer in TONE_SAMPLES else "formal"
-    tone_instructions = TONE_SAMPLES.get(tone, TONE_SAMPLES["formal"])
+    samples = get_tone_samples()
+    tone = prefer if prefer in samples else "formal"
+    tone_instructions = samples.get(tone, samples["formal"])
     
     examples = {
        "formal": "Example: Hi Emma,\nI hope this message finds you well. I am writing to invite you to our upcoming meeting. Please confirm your availability. Best regards, Manasa.",
@@ -85,8 +270,13 @@ def tone_stylist_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     
     return {"tone": tone, "tone_instructions": tone_instructions}
 
-@traceable(run_type="llm")
-def draft_writer_agent(state: Dict[str, Any], llm, max_output_tokens: int = 512) -> Dict[str, Any]:
+def _format_style_examples(examples: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        f"Example {i}:\nSubject: {ex.get('subject', '')}\n{ex.get('body', '')}"
+        for i, ex in enumerate(examples, 1)
+    )
+
+def _draft_prompt(state: Dict[str, Any]):
     parsed = state.get("parsed", {})
     intent = state.get("intent", "other")
     tone_info = state.get("tone_instructions", "")
@@ -104,15 +294,20 @@ def draft_writer_agent(state: Dict[str, Any], llm, max_output_tokens: int = 512)
         "Constraints: {constraints}\n\n"
         "Return a JSON object exactly with fields: subject, body. Always ensure sender name is 'Manasa'."
     )
+    style_examples = state.get("style_examples") or []
+    if style_examples:
+        template += (
+            "\n\nStyle Examples (past emails by this sender; match their voice, not their content):\n"
+            "{style_examples}"
+        )
     chat_prompt = ChatPromptTemplate.from_messages([
         ("system", system),
         ("user", template)
     ])
-    chain = chat_prompt | llm | StrOutputParser()
     profile_summary = f"{user_profile.get('company','')}"
     recipient = parsed.get("recipient_name") or ""
     constraints = parsed.get("constraints") or {}
-    raw = chain.invoke({
+    inputs = {
         "prompt": parsed.get("prompt_text", ""),
         "intent": intent,
         "tone_instructions": tone_info,
@@ -120,26 +315,59 @@ def draft_writer_agent(state: Dict[str, Any], llm, max_output_tokens: int = 512)
         "profile_company": profile_summary,
         "recipient": recipient,
         "constraints": str(constraints)
-    })
+    }
+    if style_examples:
+        inputs["style_examples"] = _format_style_examples(style_examples)
+    return chat_prompt, inputs
+
+def _draft_output(state: Dict[str, Any], raw: str) -> Dict[str, Any]:
+    """`draft_parse` is "fallback" when the reply was not JSON (cascade mode escalates on it)."""
+    parsed = state.get("parsed", {})
     try:
         parsed_json = json.loads(raw)
         subject = parsed_json.get("subject", "")
         body = parsed_json.get("body", "")
+        parse = "json"
     except Exception:
         body = raw
         subject = (parsed.get("prompt_text", "")[:60] + "...") if parsed.get("prompt_text") else "New Email"
-    return {"draft": {"subject": subject.strip(), "body": body.strip()}}
+        parse = "fallback"
+    return {"draft": {"subject": subject.strip(), "body": body.strip()}, "draft_parse": parse}
 
-@traceable(run_type="llm")
-def personalization_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    draft = state.get("draft", {})
-    profile = state.get("user_profile", {})
+@traced(run_type="llm")
+def draft_writer_agent(
+    state: Dict[str, Any],
+    llm,
+    max_output_tokens: int = 512,
+    on_partial: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Dict[str, Any]:
+    """`on_partial` streams the draft and receives the text added to "subject"/"body" (see _stream_fields)."""
+    chat_prompt, inputs = _draft_prompt(state)
+    if on_partial:
+        raw = _stream_llm("draft_writer", chat_prompt, llm, inputs, _stream_fields(on_partial))
+    else:
+        raw = _invoke_llm("draft_writer", chat_prompt, llm, inputs)
+    return _draft_output(state, raw)
+
+@traced(run_type="llm")
+async def adraft_writer_agent(
+    state: Dict[str, Any],
+    llm,
+    max_output_tokens: int = 512,
+    on_partial: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Dict[str, Any]:
+    chat_prompt, inputs = _draft_prompt(state)
+    if on_partial:
+        raw = await _astream_llm("draft_writer", chat_prompt, llm, inputs, _stream_fields(on_partial))
+    else:
+        raw = await _ainvoke_llm("draft_writer", chat_prompt, llm, inputs)
+    return _draft_output(state, raw)
+
+def _personalize(subject: str, body: str, profile: Dict[str, Any]) -> Dict[str, str]:
+    """Fills the sender slots and makes sure the email is signed."""
     default_signature = profile.get("signature", "Best regards,")
     sender_name = DEFAULT_SENDER_NAME
 
-    body = draft.get("body", "") or ""
-    subject = draft.get("subject", "") or ""
-
     body = (
         body.replace("{{sender_name}}", sender_name)
             .replace("{sender_name}", sender_name)
@@ -165,10 +393,125 @@ def personalization_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         if sender_name.lower() not in body_lower:
             body = body.strip() + f"\n{sender_name}"
 
-    return {"personalized_draft": {"subject": subject.strip(), "body": body.strip()}}
+    return {"subject": subject.strip(), "body": body.strip()}
+
+@traced(run_type="tool")
+def personalization_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    draft = state.get("draft", {})
+    profile = state.get("user_profile", {})
+    return {"personalized_draft": _personalize(draft.get("subject", "") or "", draft.get("body", "") or "", profile)}
+
+# ===========================
+# Fan-out personalization (one template, many recipients)
+# ===========================
+# Recipient slots in a fan-out template. The review gate treats {{name}} and
+# {{recipient...}} as leftovers, so templates use these names instead.
+RECIPIENT_SLOT = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+RECIPIENT_SLOTS = ("first_name", "full_name", "role", "company")
+# Used when a recipient row has no value for a slot; the recipient is then
+# flagged for the LLM touch-up.
+SLOT_FALLBACKS = {"first_name": "there"}
+TEMPLATE_GREETING = re.compile(r"^(\s*(?:dear|hi|hello|hey)\b)[^\n,!{]*([,!])", re.I)
+
+def ensure_greeting_slot(body: str) -> str:
+    """Addresses a template's greeting line to {{first_name}} if it names nobody in particular."""
+    first = body.split("\n", 1)[0]
+    if RECIPIENT_SLOT.search(first):
+        return body
+    return TEMPLATE_GREETING.sub(r"\1 {{first_name}}\2", body, count=1)
+
+def _compile_slots(text: str) -> List[str]:
+    """[literal, slot, literal, slot, ..., literal] so rendering is a single join."""
+    return RECIPIENT_SLOT.split(text)
+
+def _render_slots(parts: List[str], values: Dict[str, str], missing: set) -> str:
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            out.append(part)
+            continue
+        value = values.get(part.lower())
+        if not value:
+            missing.add(part.lower())
+            value = SLOT_FALLBACKS.get(part.lower(), "")
+        out.append(value)
+    return "".join(out)
+
+def recipient_values(recipient: Dict[str, Any]) -> Dict[str, str]:
+    """Slot values for one recipient row; full_name and first_name are derived from name."""
+    values = {str(k).strip().lower(): str(v).strip() for k, v in recipient.items() if v is not None}
+    if values.get("name"):
+        values.setdefault("full_name", values["name"])
+        if not values.get("first_name"):
+            values["first_name"] = values["name"].split()[0]
+    return values
+
+@traced(run_type="tool")
+def personalize_recipients(state: Dict[str, Any], recipients: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Vectorized personalization_agent: sender slots and signature are handled
+    once on the template (state["draft"]), which is then split into literal
+    and slot segments once and rendered per recipient with a single join.
+    Each result lists the slots the recipient had no value for in "missing".
+    """
+    draft = state.get("draft", {})
+    template = _personalize(draft.get("subject", "") or "", ensure_greeting_slot(draft.get("body", "") or ""),
+                            state.get("user_profile", {}))
+    subject_parts, body_parts = _compile_slots(template["subject"]), _compile_slots(template["body"])
+    results = []
+    for recipient in recipients:
+        values, missing = recipient_values(recipient), set()
+        results.append({
+            "personalized_draft": {
+                "subject": _render_slots(subject_parts, values, missing),
+                "body": _render_slots(body_parts, values, missing),
+            },
+            "missing": sorted(missing),
+        })
+    return results
+
+def _touch_up_prompt(state: Dict[str, Any]):
+    draft = state.get("personalized_draft", {})
+    system = ("You are an email editor. Adapt this email to the single recipient described below, using the notes "
+              "and filling any gaps naturally. Keep the message, tone and length otherwise unchanged. "
+              "Output JSON with keys: subject, body.")
+    template = "Recipient: {recipient}\nNotes: {notes}\n\nEmail Subject: {subject}\n\nEmail Body:\n{body}"
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        ("user", template)
+    ])
+    recipient = state.get("recipient") or {}
+    inputs = {
+        "recipient": ", ".join(f"{k}: {v}" for k, v in recipient.items() if v and k != "notes"),
+        "notes": recipient.get("notes") or "; ".join(state.get("flags") or []) or "-",
+        "subject": draft.get("subject", ""),
+        "body": draft.get("body", ""),
+    }
+    return chat_prompt, inputs
+
+def _touch_up_output(state: Dict[str, Any], raw: str) -> Dict[str, Any]:
+    current = state.get("personalized_draft", {})
+    try:
+        parsed = json.loads(raw)
+        draft = {"subject": parsed.get("subject") or current.get("subject", ""), "body": parsed.get("body") or ""}
+    except Exception:
+        draft = {"subject": current.get("subject", ""), "body": raw}
+    if not draft["body"].strip():
+        return {"personalized_draft": current}
+    return {"personalized_draft": {"subject": draft["subject"].strip(), "body": draft["body"].strip()}}
+
+@traced(run_type="llm")
+def touch_up_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+    """LLM pass over one rendered fan-out email (state["recipient"], state["flags"])."""
+    chat_prompt, inputs = _touch_up_prompt(state)
+    return _touch_up_output(state, _invoke_llm("touch_up", chat_prompt, llm, inputs))
+
+@traced(run_type="llm")
+async def atouch_up_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+    chat_prompt, inputs = _touch_up_prompt(state)
+    return _touch_up_output(state, await _ainvoke_llm("touch_up", chat_prompt, llm, inputs))
 
-@traceable(run_type="llm")
-def review_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+def _review_prompt(state: Dict[str, Any]):
     draft = state.get("personalized_draft", {})
     tone = state.get("tone", "formal")
     system = ("You are an email reviewer. Check the email for grammar, clarity, and adherence to the requested tone. "
@@ -178,23 +521,301 @@ def review_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
         ("system", system),
         ("user", template)
     ])
-    chain = chat_prompt | llm | StrOutputParser()
-    raw = chain.invoke({
+    inputs = {
         "tone": tone,
         "subject": draft.get("subject", ""),
         "body": draft.get("body", "")
-    })
+    }
+    return chat_prompt, inputs
+
+def _review_output(state: Dict[str, Any], raw: str) -> Dict[str, Any]:
+    draft = state.get("personalized_draft", {})
     try:
         parsed = json.loads(raw)
     except Exception:
         parsed = {"ok": True, "issues": [], "suggested_edits": draft.get("body", "")}
     return {"review": parsed}
 
-@traceable(run_type="llm")
-def router_agent(state):
+def _review_gate(state: Dict[str, Any]) -> Dict[str, Any]:
+    draft = state.get("personalized_draft", {})
+    tone = state.get("tone", "formal")
+    samples = get_tone_samples()
+    return run_gate(
+        draft,
+        tone_rules=samples.get(tone, samples["formal"]),
+        constraints=(state.get("parsed") or {}).get("constraints") or {},
+        signature=state.get("user_profile", {}).get("signature", ""),
+    )
+
+def _gate_review(state: Dict[str, Any], gate: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Local verdict for clear passes and clear failures; None means ask the LLM."""
+    body = state.get("personalized_draft", {}).get("body", "")
+    if gate["verdict"] == "pass":
+        return {"review": {"ok": True, "issues": [], "suggested_edits": body, "source": "gate", "gate": gate}}
+    if gate["verdict"] == "fail":
+        return {"review": {"ok": False, "issues": gate["issues"], "suggested_edits": "", "source": "gate", "gate": gate}}
+    return None
+
+@traced(run_type="chain")
+def review_agent(state: Dict[str, Any], llm, use_gate: bool = True) -> Dict[str, Any]:
+    gate = _review_gate(state) if use_gate else None
+    local = _gate_review(state, gate) if gate else None
+    if local:
+        return local
+    chat_prompt, inputs = _review_prompt(state)
+    res = _review_output(state, _invoke_llm("review", chat_prompt, llm, inputs))
+    if gate:
+        res["review"]["gate"] = gate
+    return res
+
+@traced(run_type="chain")
+async def areview_agent(state: Dict[str, Any], llm, use_gate: bool = True) -> Dict[str, Any]:
+    gate = _review_gate(state) if use_gate else None
+    local = _gate_review(state, gate) if gate else None
+    if local:
+        return local
+    chat_prompt, inputs = _review_prompt(state)
+    res = _review_output(state, await _ainvoke_llm("review", chat_prompt, llm, inputs))
+    if gate:
+        res["review"]["gate"] = gate
+    return res
+
+# ===========================
+# Rewrite (targeted edits after a failed review)
+# ===========================
+# A failed review is fixed by editing the existing draft, not by drafting again:
+# a full-body `suggested_edits` from the reviewer is applied as is (no LLM call),
+# otherwise only the listed issues and the current email go to the LLM as a
+# small edit request. REWRITE_STATS compares the tokens used with what a full
+# draft_writer_agent call would have cost.
+REWRITE_MODES = ("targeted", "edit_only", "redraft")
+REWRITE_STATS = {"suggested_edits": 0, "targeted_edit": 0, "redraft": 0, "tokens_used": 0, "tokens_saved": 0}
+
+# suggested_edits shorter than this share of the current body is treated as a
+# note about the draft rather than a replacement body.
+SUGGESTED_EDITS_MIN_RATIO = 0.5
+
+def _rewrite_prompt(state: Dict[str, Any], issues: List[str]):
+    draft = state.get("personalized_draft") or state.get("draft") or {}
+    system = ("You are an email editor. Fix only the listed issues in the email and keep everything else "
+              "unchanged. Output JSON with keys: subject, body.")
+    template = "Issues to fix:\n{issues}\n\nEmail Subject: {subject}\n\nEmail Body:\n{body}"
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        ("user", template)
+    ])
+    inputs = {
+        "issues": "\n".join(f"- {issue}" for issue in issues) or "- Improve clarity and tone.",
+        "subject": draft.get("subject", ""),
+        "body": draft.get("body", ""),
+    }
+    return chat_prompt, inputs
+
+def _applicable_suggestion(state: Dict[str, Any]) -> Optional[str]:
+    """The reviewer's suggested_edits when it is a full replacement body."""
+    review = state.get("review") or {}
+    body = (state.get("personalized_draft") or {}).get("body", "")
+    suggestion = (review.get("suggested_edits") or "").strip()
+    if not suggestion or suggestion == body.strip():
+        return None
+    if len(suggestion) < SUGGESTED_EDITS_MIN_RATIO * len(body):
+        return None
+    return suggestion
+
+def _redraft_cost(state: Dict[str, Any]) -> int:
+    """Estimated tokens of a full draft_writer_agent call for this state."""
+    chat_prompt, inputs = _draft_prompt(state)
+    draft = state.get("personalized_draft") or {}
+    return estimate_tokens(chat_prompt.invoke(inputs).to_string()) + estimate_tokens(json.dumps(draft))
+
+def _rewrite_plan(state: Dict[str, Any], mode: str):
+    """(issues, suggestion) for the requested mode; mode="redraft" keeps the old behaviour."""
+    if mode not in REWRITE_MODES:
+        raise ValueError(f"mode must be one of {REWRITE_MODES}")
+    review = state.get("review") or {}
+    issues = [str(issue) for issue in review.get("issues") or []]
+    suggestion = _applicable_suggestion(state) if mode == "targeted" else None
+    if mode != "redraft" and suggestion is None:
+        note = (review.get("suggested_edits") or "").strip()
+        if note and note != (state.get("personalized_draft") or {}).get("body", "").strip():
+            issues.append(note)
+    return issues, suggestion
+
+def _rewrite_output(state: Dict[str, Any], kind: str, draft: Dict[str, str], used: int) -> Dict[str, Any]:
+    saved = max(_redraft_cost(state) - used, 0) if kind != "redraft" else 0
+    REWRITE_STATS[kind] += 1
+    REWRITE_STATS["tokens_used"] += used
+    REWRITE_STATS["tokens_saved"] += saved
+    totals = state.get("rewrite_stats") or {"rewrites": 0, "tokens_used": 0, "tokens_saved": 0}
+    return {
+        "draft": draft,
+        "rewrite": {"mode": kind, "issues": state.get("issues") or [], "tokens_used": used, "tokens_saved": saved},
+        "rewrite_stats": {
+            "rewrites": totals["rewrites"] + 1,
+            "tokens_used": totals["tokens_used"] + used,
+            "tokens_saved": totals["tokens_saved"] + saved,
+        },
+    }
+
+@traced(run_type="chain")
+def rewrite_agent(state: Dict[str, Any], llm, mode: str = "targeted") -> Dict[str, Any]:
+    """
+    Revises the draft after a failed review. mode="targeted" applies a full-body
+    suggested_edits directly and otherwise sends a small edit request;
+    "edit_only" always sends the edit request; "redraft" calls draft_writer_agent.
+    """
+    issues, suggestion = _rewrite_plan(state, mode)
+    if suggestion is not None:
+        subject = (state.get("personalized_draft") or {}).get("subject", "")
+        return _rewrite_output(state, "suggested_edits", {"subject": subject, "body": suggestion}, 0)
+    if mode == "redraft":
+        chat_prompt, inputs = _draft_prompt(state)
+        raw = _invoke_llm("draft_writer", chat_prompt, llm, inputs)
+        used = estimate_tokens(chat_prompt.invoke(inputs).to_string()) + estimate_tokens(raw)
+        return _rewrite_output(state, "redraft", _draft_output(state, raw)["draft"], used)
+    chat_prompt, inputs = _rewrite_prompt(state, issues)
+    raw = _invoke_llm("rewrite", chat_prompt, llm, inputs)
+    used = estimate_tokens(chat_prompt.invoke(inputs).to_string()) + estimate_tokens(raw)
+    return _rewrite_output(state, "targeted_edit", _draft_output(state, raw)["draft"], used)
+
+@traced(run_type="chain")
+async def arewrite_agent(state: Dict[str, Any], llm, mode: str = "targeted") -> Dict[str, Any]:
+    issues, suggestion = _rewrite_plan(state, mode)
+    if suggestion is not None:
+        subject = (state.get("personalized_draft") or {}).get("subject", "")
+        return _rewrite_output(state, "suggested_edits", {"subject": subject, "body": suggestion}, 0)
+    if mode == "redraft":
+        chat_prompt, inputs = _draft_prompt(state)
+        raw = await _ainvoke_llm("draft_writer", chat_prompt, llm, inputs)
+        used = estimate_tokens(chat_prompt.invoke(inputs).to_string()) + estimate_tokens(raw)
+        return _rewrite_output(state, "redraft", _draft_output(state, raw)["draft"], used)
+    chat_prompt, inputs = _rewrite_prompt(state, issues)
+    raw = await _ainvoke_llm("rewrite", chat_prompt, llm, inputs)
+    used = estimate_tokens(chat_prompt.invoke(inputs).to_string()) + estimate_tokens(raw)
+    return _rewrite_output(state, "targeted_edit", _draft_output(state, raw)["draft"], used)
+
+# ===========================
+# Fused generation (single structured call)
+# ===========================
+class FusedReview(BaseModel):
+    ok: bool
+    issues: List[str] = Field(default_factory=list)
+    suggested_edits: str = ""
+
+class FusedEmail(BaseModel):
+    intent: Literal["outreach", "follow-up", "apology", "internal_update",
+                    "ask_for_meeting", "introduction", "promotion", "other"]
+    subject: str
+    body: str
+    review: FusedReview
+
+def _fused_prompt(state: Dict[str, Any]):
+    _, inputs = _draft_prompt(state)
+    system = (
+        "You are an expert email writer and reviewer. In one pass: classify the user's intent into one of "
+        "outreach, follow-up, apology, internal_update, ask_for_meeting, introduction, promotion, other; "
+        "write a concise, well-structured email following the tone instructions; then review your own draft "
+        "for grammar, clarity and tone. Return the intent, subject, body and review "
+        "(ok, issues, suggested_edits)."
+    )
+    template = (
+        "User Prompt: {prompt}\n\n"
+        "Tone Instructions: {tone_instructions}\n"
+        "Sender Profile: name: {sender_name}, company: {profile_company}\n"
+        "Recipient: {recipient}\n"
+        "Constraints: {constraints}\n\n"
+        "Return a JSON object with fields: intent, subject, body, review (ok, issues, suggested_edits). "
+        "Always ensure sender name is 'Manasa'."
+    )
+    if "style_examples" in inputs:
+        template += (
+            "\n\nStyle Examples (past emails by this sender; match their voice, not their content):\n"
+            "{style_examples}"
+        )
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        ("user", template)
+    ])
+    inputs.pop("intent", None)
+    return chat_prompt, inputs
+
+def _structured_runnable(llm):
+    """Native structured output when the model supports it, else None (JSON prompt + validation)."""
+    try:
+        return llm.with_structured_output(FusedEmail, include_raw=True)
+    except NotImplementedError:
+        return None
+
+def _structured_result(result: Dict[str, Any]) -> "FusedEmail":
+    record_usage(result.get("raw"))
+    if result.get("parsing_error") is not None:
+        raise result["parsing_error"]
+    return result["parsed"]
+
+def _parse_fused(raw: str) -> FusedEmail:
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").split("\n", 1)[-1]
+    return FusedEmail.model_validate_json(text)
+
+def _fused_output(result: FusedEmail) -> Dict[str, Any]:
+    review = result.review.model_dump()
+    review["source"] = "fused"
+    return {
+        "intent": result.intent,
+        "intent_source": "fused",
+        "draft": {"subject": result.subject.strip(), "body": result.body.strip()},
+        "review": review,
+    }
+
+def _fused_call(state: Dict[str, Any], llm):
+    chat_prompt, inputs = _fused_prompt(state)
+    prompt_value = chat_prompt.invoke(inputs)
+    cache, key = _cache_slot("fused_generation", prompt_value, llm)
+    return prompt_value, _structured_runnable(llm), cache, key
+
+@traced(run_type="llm")
+def fused_generation_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+    """
+    Intent detection, drafting and self-review in one schema-validated call.
+    Returns the same state keys as the three separate agents; invalid output
+    raises instead of silently degrading.
+    """
+    prompt_value, structured, cache, key = _fused_call(state, llm)
+    cached = _cache_get(cache, key, "fused_generation")
+    if cached is not None:
+        return _fused_output(FusedEmail.model_validate_json(cached))
+    limiter, model, tokens = _admission(llm, prompt_value)
+    if structured is not None:
+        result = _structured_result(limiter.call(model, tokens, lambda: structured.invoke(prompt_value)))
+    else:
+        message = limiter.call(model, tokens, lambda: llm.invoke(prompt_value))
+        record_usage(message)
+        result = _parse_fused(_message_text(message))
+    if cache:
+        cache.set(key, result.model_dump_json())
+    return _fused_output(result)
+
+@traced(run_type="llm")
+async def afused_generation_agent(state: Dict[str, Any], llm) -> Dict[str, Any]:
+    prompt_value, structured, cache, key = _fused_call(state, llm)
+    cached = await _acache_get(cache, key, "fused_generation")
+    if cached is not None:
+        return _fused_output(FusedEmail.model_validate_json(cached))
+    limiter, model, tokens = _admission(llm, prompt_value)
+    if structured is not None:
+        result = _structured_result(await limiter.acall(model, tokens, lambda: structured.ainvoke(prompt_value)))
+    else:
+        message = await limiter.acall(model, tokens, lambda: llm.ainvoke(prompt_value))
+        record_usage(message)
+        result = _parse_fused(_message_text(message))
+    if cache:
+        cache.set(key, result.model_dump_json())
+    return _fused_output(result)
+
+def router_agent(state, max_retries: int = 3):
     review = state.get("review", {})
     retry_count = state.get("retry_count", 0)
-    max_retries = 3
 
     if not review:
         return {"route": "done"}
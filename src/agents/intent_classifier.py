@@ -0,0 +1,252 @@
+"""
+Local fast-path intent classifier.
+
+Combines keyword rules with a small multinomial naive-Bayes model trained on
+labelled prompts (data/intent_samples.json) and the user's stored
+sent_examples. When the combined confidence clears a threshold the label is
+returned locally in microseconds; otherwise intent_detection_agent falls back
+to the LLM, and the LLM's label is fed back with learn_intent() so similar
+prompts can take the fast path next time (INTENT_ONLINE_LEARNING=0 keeps the
+model static). Learning only sharpens the naive-Bayes half of the score, so a
+prompt no keyword rule matches still goes to the LLM. Learned prompts live in
+memory only; a restart retrains from the seed samples and sent_examples.
+
+Offline evaluation (from src/):
+    python -m agents.intent_classifier --eval prompts.jsonl [--threshold 0.75] [--use-labels]
+
+Each line of prompts.jsonl is a prompt string or {"prompt": ..., "intent": ...}.
+Without --use-labels the reference label comes from the LLM classifier.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+INTENT_SAMPLES_PATH = Path(__file__).parent.parent.parent / "data" / "intent_samples.json"
+DEFAULT_THRESHOLD = 0.75
+
+# Weight of the keyword rules vs. the naive-Bayes posterior in the final score.
+# A prompt needs both signals to agree to reach the default threshold.
+RULE_WEIGHT = 0.4
+
+KEYWORD_RULES: Dict[str, List[str]] = {
+    "outreach": [r"\bcold email\b", r"\breach(?:ing)? out\b", r"\bpartnership\b", r"\bprospect",
+                 r"\bcollaborat", r"\bpitch\b"],
+    "follow-up": [r"\bfollow(?:ing)?[- ]?up\b", r"\bcircl(?:e|ing) back\b", r"\bchecking in\b",
+                  r"\breminder\b", r"\bas discussed\b", r"\bafter (?:our|the|my) (?:meeting|call|interview|demo)\b"],
+    "apology": [r"\bapolog", r"\bsorry\b", r"\bregret\b", r"\bmy mistake\b"],
+    "internal_update": [r"\bstatus update\b", r"\b(?:weekly|team|project) update\b", r"\bupdate the team\b",
+                        r"\bprogress report\b", r"\ball[- ]staff\b", r"\binternal announcement\b"],
+    "ask_for_meeting": [r"\bschedule (?:a|some) (?:meeting|call|time)\b", r"\bset up a (?:meeting|call)\b",
+                        r"\bbook (?:a|some) (?:time|meeting|call)\b", r"\bavailab(?:le|ility) for a (?:call|meeting)\b",
+                        r"\brequest a (?:\w+ )?meeting\b", r"\bfind a time\b"],
+    "introduction": [r"\bintroduc", r"\bconnect (?:you|my \w+) with\b"],
+    "promotion": [r"\bpromot", r"\bdiscount\b", r"\bsale\b", r"\bspecial offer\b", r"\bnewsletter\b",
+                  r"\blaunch\b"],
+}
+_COMPILED_RULES = {label: [re.compile(p, re.I) for p in pats] for label, pats in KEYWORD_RULES.items()}
+_TOKEN = re.compile(r"[a-z][a-z'-]+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+def rule_hits(text: str) -> Dict[str, int]:
+    hits = {}
+    for label, patterns in _COMPILED_RULES.items():
+        n = sum(1 for p in patterns if p.search(text))
+        if n:
+            hits[label] = n
+    return hits
+
+class IntentClassifier:
+    """Keyword rules + multinomial naive Bayes with Laplace smoothing."""
+
+    def __init__(self, labels: Iterable[str]):
+        self.labels = list(labels)
+        self.word_counts: Dict[str, Counter] = {label: Counter() for label in self.labels}
+        self.totals: Dict[str, int] = {label: 0 for label in self.labels}
+        self.doc_counts: Dict[str, int] = {label: 0 for label in self.labels}
+        self.vocab: set = set()
+        self._lock = threading.Lock()
+
+    def fit(self, samples: Iterable[Tuple[str, str]]) -> "IntentClassifier":
+        for text, label in samples:
+            self.update(text, label)
+        return self
+
+    def update(self, text: str, label: str) -> bool:
+        """Adds one labelled prompt to the counts; returns False for unknown labels or empty text."""
+        tokens = tokenize(text)
+        if label not in self.word_counts or not tokens:
+            return False
+        with self._lock:
+            self.word_counts[label].update(tokens)
+            self.totals[label] += len(tokens)
+            self.doc_counts[label] += 1
+            self.vocab.update(tokens)
+        return True
+
+    def posterior(self, text: str) -> Dict[str, float]:
+        tokens = [t for t in tokenize(text) if t in self.vocab]
+        n_docs = sum(self.doc_counts.values()) or 1
+        vocab_size = len(self.vocab) or 1
+        log_probs = {}
+        for label in self.labels:
+            prior = (self.doc_counts[label] + 1) / (n_docs + len(self.labels))
+            denom = self.totals[label] + vocab_size
+            counts = self.word_counts[label]
+            log_probs[label] = math.log(prior) + sum(math.log((counts[t] + 1) / denom) for t in tokens)
+        top = max(log_probs.values())
+        exp = {label: math.exp(lp - top) for label, lp in log_probs.items()}
+        z = sum(exp.values())
+        return {label: v / z for label, v in exp.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Returns (label, confidence in [0, 1])."""
+        post = self.posterior(text)
+        hits = rule_hits(text)
+        total_hits = sum(hits.values())
+        scores = {
+            label: RULE_WEIGHT * (hits.get(label, 0) / total_hits if total_hits else 0.0)
+            + (1 - RULE_WEIGHT) * post[label]
+            for label in self.labels
+        }
+        label = max(scores, key=scores.get)
+        return label, scores[label]
+
+# ===========================
+# Training data
+# ===========================
+def load_seed_samples(path: Path = INTENT_SAMPLES_PATH) -> List[Tuple[str, str]]:
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(text, label) for label, texts in data.items() for text in texts]
+
+def samples_from_sent_examples(sent_examples: Iterable[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    Uses stored sent emails as extra training text. Examples saved with an
+    "intent" are used as-is; unlabelled ones are kept only when the keyword
+    rules point to a single label.
+    """
+    samples = []
+    for example in sent_examples or []:
+        if not isinstance(example, dict):
+            continue
+        text = f"{example.get('subject', '')} {example.get('body', '')}".strip()
+        if not text:
+            continue
+        label = example.get("intent")
+        if not label:
+            hits = rule_hits(text)
+            if len(hits) != 1:
+                continue
+            label = next(iter(hits))
+        samples.append((text, label))
+    return samples
+
+def _stored_sent_examples() -> List[Dict[str, Any]]:
+    try:
+        from memory.json_memory import get_profile
+        return get_profile("default").get("sent_examples", [])
+    except Exception:
+        return []
+
+_CLASSIFIER: Optional[IntentClassifier] = None
+_CLASSIFIER_LOCK = threading.Lock()
+
+def get_intent_classifier() -> IntentClassifier:
+    global _CLASSIFIER
+    with _CLASSIFIER_LOCK:
+        if _CLASSIFIER is None:
+            from agents.agents import INTENT_LABELS
+            samples = load_seed_samples() + samples_from_sent_examples(_stored_sent_examples())
+            _CLASSIFIER = IntentClassifier(sorted(INTENT_LABELS)).fit(samples)
+        return _CLASSIFIER
+
+def online_learning_enabled() -> bool:
+    return os.environ.get("INTENT_ONLINE_LEARNING", "1") != "0"
+
+def learn_intent(text: str, label: str) -> bool:
+    """Feeds an accepted LLM label back into the local model; returns True when it was learned."""
+    if not text or not online_learning_enabled():
+        return False
+    return get_intent_classifier().update(text, label)
+
+def fast_path_threshold() -> float:
+    return float(os.environ.get("INTENT_FAST_PATH_THRESHOLD", str(DEFAULT_THRESHOLD)))
+
+def classify_fast(text: str, threshold: Optional[float] = None) -> Optional[Tuple[str, float]]:
+    """Returns (label, confidence) when the local model is confident enough, else None."""
+    if not text:
+        return None
+    label, confidence = get_intent_classifier().predict(text)
+    if confidence >= (fast_path_threshold() if threshold is None else threshold):
+        return label, confidence
+    return None
+
+# ===========================
+# Offline evaluation
+# ===========================
+def evaluate(items: List[Dict[str, Any]], threshold: float, llm=None) -> Dict[str, Any]:
+    from agents.agents import intent_detection_agent
+
+    clf = get_intent_classifier()
+    correct = fast = fast_correct = 0
+    for item in items:
+        predicted, confidence = clf.predict(item["prompt"])
+        reference = item.get("intent")
+        if reference is None:
+            state = {"parsed": {"prompt_text": item["prompt"]}}
+            reference = intent_detection_agent(state, llm, use_fast_path=False)["intent"]
+        correct += predicted == reference
+        if confidence >= threshold:
+            fast += 1
+            fast_correct += predicted == reference
+    n = len(items) or 1
+    return {
+        "items": len(items),
+        "threshold": threshold,
+        "local_accuracy": round(correct / n, 4),
+        "fast_path_hit_rate": round(fast / n, 4),
+        "fast_path_accuracy": round(fast_correct / fast, 4) if fast else None,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate the local intent classifier against LLM labels.")
+    parser.add_argument("--eval", required=True, help="JSONL file of prompts")
+    parser.add_argument("--threshold", type=float, default=None, help="fast-path confidence threshold")
+    parser.add_argument("--use-labels", action="store_true", help="use 'intent' fields instead of calling the LLM")
+    args = parser.parse_args(argv)
+
+    items = []
+    with open(args.eval, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not args.use_labels:
+                item.pop("intent", None)
+            items.append(item)
+
+    llm = None
+    if not args.use_labels:
+        from integrations.llm_client import make_openai_llm
+        from integrations.model_routing import get_model_router
+        llm = make_openai_llm(model=get_model_router().model_for("intent_detection"), temperature=0.0)
+    threshold = fast_path_threshold() if args.threshold is None else args.threshold
+    print(json.dumps(evaluate(items, threshold, llm), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
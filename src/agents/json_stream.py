@@ -0,0 +1,157 @@
+"""
+Incremental extraction of string fields from a JSON object that is still
+being streamed, e.g. '{"subject": "Quick foll' -> {"subject": "Quick foll"}.
+
+Used to show the draft's subject and body while draft_writer_agent is still
+generating. The finished output is still parsed with json.loads by the agent.
+
+The scanner keeps its position, nesting depth, string/escape state and each
+field's decoded prefix between chunks, so every chunk is processed once.
+feed() returns only the text each field gained, so a consumer that appends
+those deltas spends time linear in the length of the draft. Only keys of the
+top-level object are captured.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Plain string content up to the next quote or backslash.
+_PLAIN = re.compile(r'[^"\\]+')
+_WHITESPACE = " \t\r\n"
+
+class PartialJSONFields:
+    """Feed streamed chunks; `fields` holds the best current value of each wanted key."""
+
+    def __init__(self, keys: Iterable[str] = ("subject", "body")):
+        self.keys = tuple(keys)
+        # Keys whose value string opened during the last feed().
+        self.started: List[str] = []
+        self._parts: Dict[str, List[str]] = {}
+        # Text not consumed yet: only ever an incomplete escape at the end of a chunk.
+        self._pending = ""
+        self._depth = 0
+        self._in_string = False
+        # Role of the string being read: a wanted key's value, a possible key, or skipped.
+        self._value_key: Optional[str] = None
+        self._candidate: Optional[List[str]] = None
+        self._candidate_len = 0
+        self._max_key_len = max((len(key) for key in self.keys), default=0)
+        # A just-closed string (possible key) and the key whose value comes next.
+        self._last_string: Optional[str] = None
+        self._next_value_of: Optional[str] = None
+        self._deltas: Dict[str, List[str]] = {}
+
+    def feed(self, chunk: str) -> Dict[str, str]:
+        """Adds a chunk; returns the text each wanted field gained (empty when nothing changed)."""
+        text = self._pending + chunk
+        self._pending = ""
+        self.started = []
+        self._deltas = {}
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_string:
+                m = _PLAIN.match(text, i)
+                if m:
+                    self._string_text(m.group())
+                    i = m.end()
+                    continue
+                if text[i] == '"':
+                    self._close_string()
+                    i += 1
+                    continue
+                consumed = self._escape(text, i)
+                if consumed == 0:
+                    # An escape cut by the chunk boundary: wait for the rest of it.
+                    self._pending = text[i:]
+                    break
+                i += consumed
+                continue
+            ch = text[i]
+            i += 1
+            if ch == '"':
+                self._open_string()
+            elif ch == ":":
+                self._next_value_of, self._last_string = self._last_string, None
+            elif ch not in _WHITESPACE:
+                if ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                self._last_string = self._next_value_of = None
+        return {key: "".join(parts) for key, parts in self._deltas.items()}
+
+    @property
+    def fields(self) -> Dict[str, str]:
+        out = {}
+        for key, parts in self._parts.items():
+            if len(parts) > 1:
+                parts[:] = ["".join(parts)]
+            out[key] = parts[0] if parts else ""
+        return out
+
+    def _escape(self, text: str, i: int) -> int:
+        """Decodes the escape at text[i]; returns the characters consumed, 0 if it is incomplete."""
+        n = len(text)
+        if i + 1 >= n:
+            return 0
+        esc = text[i + 1]
+        if esc != "u":
+            self._string_text(_ESCAPES.get(esc, esc))
+            return 2
+        if i + 6 > n:
+            return 0
+        try:
+            code = int(text[i + 2:i + 6], 16)
+        except ValueError:
+            return 6
+        if 0xD800 <= code <= 0xDBFF:
+            # A high surrogate: combine it with the low surrogate escape that should follow.
+            rest = text[i + 6:i + 12]
+            if len(rest) < 6 and "\\u".startswith(rest[:2]):
+                return 0
+            if rest[:2] == "\\u":
+                try:
+                    low = int(rest[2:6], 16)
+                except ValueError:
+                    low = 0
+                if 0xDC00 <= low <= 0xDFFF:
+                    self._string_text(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    return 12
+        self._string_text(chr(code))
+        return 6
+
+    def _open_string(self) -> None:
+        self._in_string = True
+        key, self._next_value_of = self._next_value_of, None
+        if key is not None:
+            # A value; only the first occurrence of a wanted key is tracked.
+            if key in self.keys and key not in self._parts:
+                self._value_key = key
+                self._parts[key] = []
+                self._deltas[key] = []
+                self.started.append(key)
+            return
+        # Only strings directly inside the top-level object can be its keys.
+        if self._depth == 1:
+            self._candidate, self._candidate_len = [], 0
+
+    def _string_text(self, text: str) -> None:
+        if self._value_key is not None:
+            self._parts[self._value_key].append(text)
+            self._deltas.setdefault(self._value_key, []).append(text)
+        elif self._candidate is not None:
+            self._candidate_len += len(text)
+            # Longer than any wanted key: cannot be one, stop collecting it.
+            if self._candidate_len > self._max_key_len:
+                self._candidate = None
+            else:
+                self._candidate.append(text)
+
+    def _close_string(self) -> None:
+        self._in_string = False
+        if self._candidate is not None:
+            self._last_string = "".join(self._candidate)
+        else:
+            self._last_string = None
+        self._value_key = None
+        self._candidate = None
@@ -0,0 +1,116 @@
+"""
+Deterministic pre-review gate.
+
+Cheap local checks that run before review_agent's LLM call:
+  - a signature / closing is present
+  - the length matches constraints["length"]
+  - contractions fit the tone rules in data/tone_samples.json
+  - no leftover {sender_name} / {signature} placeholders
+  - the email opens with a greeting
+
+Drafts that pass every check skip the LLM review. Drafts with a single soft
+failure are "borderline" and escalate to the LLM; drafts with a hard failure
+(leftover template placeholders) or REVIEW_GATE_FAIL_AT soft failures are
+rejected locally. GATE_STATS / gate_stats() report the skip rate so the
+thresholds can be tuned.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Word-count ranges for the length constraint parsed by input_parser_agent.
+LENGTH_RANGES: Dict[str, Tuple[int, int]] = {
+    "short": (15, 130),
+    "medium": (60, 260),
+    "long": (180, 1200),
+}
+# Used when the prompt sets no length.
+DEFAULT_LENGTH_RANGE = (15, 600)
+# Tolerance around an explicit "N words" constraint.
+WORD_TARGET_TOLERANCE = 0.35
+
+CLOSING_PATTERNS = ["best regards", "warm regards", "kind regards", "regards,", "sincerely", "cheers",
+                    "thanks,", "thank you,", "best,"]
+GREETING = re.compile(r"^(dear|hi|hello|hey|good (morning|afternoon|evening)|greetings)\b", re.I)
+# Assertive emails may open with just the recipient's name, e.g. "Emma,"
+NAME_GREETING = re.compile(r"^[A-Z][\w.'-]*(?: [A-Z][\w.'-]*){0,3}[,!]$")
+BRACE_PLACEHOLDER = re.compile(r"\{\{?\s*(sender_name|signature|recipient\w*|name)\s*\}?\}", re.I)
+BRACKET_PLACEHOLDER = re.compile(r"\[(?:[^\]]*\b(?:name|date|company|owner)\b[^\]]*)\]", re.I)
+CONTRACTION = re.compile(r"\b\w+(?:n't|'re|'ll|'ve|'m|'d)\b|\b(?:it|that|there|what|he|she|let)'s\b", re.I)
+
+GATE_STATS = {"pass": 0, "borderline": 0, "fail": 0}
+
+def fail_at() -> int:
+    return int(os.environ.get("REVIEW_GATE_FAIL_AT", "2"))
+
+def gate_stats() -> Dict[str, Any]:
+    total = sum(GATE_STATS.values())
+    skipped = GATE_STATS["pass"] + GATE_STATS["fail"]
+    return {**GATE_STATS, "total": total, "skip_rate": skipped / total if total else 0.0}
+
+def contractions_allowed(tone_rules: str) -> bool:
+    return "avoid contractions" not in (tone_rules or "").lower()
+
+def length_range(constraints: Dict[str, Any]) -> Tuple[int, int]:
+    length = str((constraints or {}).get("length") or "").strip().lower()
+    if length in LENGTH_RANGES:
+        return LENGTH_RANGES[length]
+    m = re.match(r"(\d+)\s*words", length)
+    if m:
+        target = int(m.group(1))
+        return int(target * (1 - WORD_TARGET_TOLERANCE)), int(target * (1 + WORD_TARGET_TOLERANCE)) + 1
+    return DEFAULT_LENGTH_RANGE
+
+def run_gate(
+    draft: Dict[str, Any],
+    tone_rules: str = "",
+    constraints: Optional[Dict[str, Any]] = None,
+    signature: str = "",
+) -> Dict[str, Any]:
+    """Returns {"verdict": pass|borderline|fail, "checks": {...}, "issues": [...]}."""
+    subject = draft.get("subject", "") or ""
+    body = draft.get("body", "") or ""
+    lines = [line.strip() for line in body.splitlines() if line.strip()]
+    body_lower = body.lower()
+    issues: List[str] = []
+    hard = False
+
+    closings = CLOSING_PATTERNS + ([signature.splitlines()[0].strip().lower()] if signature.strip() else [])
+    checks = {"signature": any(c and c in body_lower for c in closings)}
+    if not checks["signature"]:
+        issues.append("No closing or signature found.")
+
+    low, high = length_range(constraints or {})
+    words = len(body.split())
+    checks["length"] = low <= words <= high
+    if not checks["length"]:
+        issues.append(f"Body is {words} words; expected {low}-{high}.")
+
+    found = CONTRACTION.findall(body)
+    checks["contractions"] = contractions_allowed(tone_rules) or not found
+    if not checks["contractions"]:
+        issues.append(f"Tone avoids contractions but found: {', '.join(sorted(set(found))[:5])}.")
+
+    placeholders = BRACE_PLACEHOLDER.findall(body + "\n" + subject)
+    brackets = BRACKET_PLACEHOLDER.findall(body + "\n" + subject)
+    checks["placeholders"] = not placeholders and not brackets
+    if placeholders:
+        hard = True
+        issues.append("Leftover template placeholders: " + ", ".join(sorted(set(placeholders))) + ".")
+    if brackets:
+        issues.append("Unfilled bracket placeholders: " + ", ".join(sorted(set(brackets))[:5]) + ".")
+
+    first = lines[0] if lines else ""
+    checks["greeting"] = bool(GREETING.match(first) or NAME_GREETING.match(first))
+    if not checks["greeting"]:
+        issues.append("Email does not open with a greeting.")
+
+    soft_failures = sum(1 for ok in checks.values() if not ok) - (1 if placeholders and not brackets else 0)
+    if hard or soft_failures >= fail_at():
+        verdict = "fail"
+    elif soft_failures:
+        verdict = "borderline"
+    else:
+        verdict = "pass"
+    GATE_STATS[verdict] += 1
+    return {"verdict": verdict, "checks": checks, "issues": issues}
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+bench_import.py
+
+Cold-start import benchmark. Imports each module in a fresh interpreter
+(without OPENAI_API_KEY) several times and reports the median import time,
+the slowest dependencies (-X importtime) and whether any heavy or app-only
+package (Streamlit, PyGithub, the OpenAI SDK, LangGraph) was pulled in.
+
+Usage (from src/):
+    python -m benchmarks.bench_import --runs 7
+    python -m benchmarks.bench_import --save-baseline main
+    python -m benchmarks.bench_import --compare main --strict
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_pipeline import compare, load_baseline, save_baseline
+
+SRC_DIR = Path(__file__).parent.parent
+
+MODULES = (
+    "agents.agents",
+    "agents.intent_classifier",
+    "agents.review_gate",
+    "integrations.llm_cache",
+    "integrations.llm_client",
+    "integrations.metrics",
+    "integrations.model_routing",
+    "integrations.rate_limiter",
+    "integrations.tracing",
+    "memory.json_memory",
+    "memory.stores",
+    "workflow.scheduler",
+    "workflow.checkpoints",
+    "workflow.langgraph_flow",
+    "workflow.batch",
+)
+# Packages the headless core must not import on its own.
+HEAVY = ("streamlit", "github", "openai", "langchain_openai", "langgraph")
+# Modules that are allowed to import some of the above.
+ALLOWED_HEAVY = {"workflow.checkpoints": ("langgraph",)}
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)
+    env["PYTHONWARNINGS"] = "ignore"
+    return env
+
+def probe(module: str, importtime: bool = False) -> Dict[str, Any]:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + [
+        "-c", PROBE.format(module=module, heavy=HEAVY)]
+    proc = subprocess.run(cmd, cwd=SRC_DIR, env=_env(), capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["import failed"])[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["slowest"] = slowest_imports(proc.stderr, module)
+    return result
+
+def slowest_imports(importtime_log: str, module: str, top: int = 5) -> List[Dict[str, Any]]:
+    """The module's direct dependencies by cumulative time, from -X importtime output."""
+    children: List[Dict[str, Any]] = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            # A top-level import is logged after its dependencies.
+            if name.strip() == module:
+                break
+            children = []
+        elif depth == 1:
+            children.append({"module": name.strip(), "ms": round(int(cumulative) / 1000, 1)})
+    return sorted(children, key=lambda r: r["ms"], reverse=True)[:top]
+
+def bench_module(module: str, runs: int) -> Dict[str, Any]:
+    # The first run warms the OS file cache and writes bytecode; it is not counted.
+    first = probe(module, importtime=True)
+    if "error" in first:
+        return first
+    times = []
+    for _ in range(runs):
+        result = probe(module)
+        if "error" in result:
+            return result
+        times.append(result["ms"])
+    times.sort()
+    heavy = [m for m in first["heavy"] if m not in ALLOWED_HEAVY.get(module, ())]
+    return {
+        "p50_ms": round(statistics.median(times), 1),
+        "mean_ms": round(statistics.fmean(times), 1),
+        "min_ms": round(times[0], 1),
+        "heavy_imports": heavy,
+        "slowest": first["slowest"],
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cold-start import time per module.")
+    parser.add_argument("modules", nargs="*", default=list(MODULES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", dest="json_out", help="Write the full report to this file.")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="Baseline name (or .json path) to compare against.")
+    parser.add_argument("--fail-over", type=float, default=0.25, help="Regression threshold as a fraction (exit 1).")
+    parser.add_argument("--strict", action="store_true", help="Exit 1 if a module imports a heavy package.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"  {'module':<28} {'p50 ms':>8} {'min ms':>8}  slowest dependency / heavy imports")
+    for module in args.modules:
+        r = results[module] = bench_module(module, args.runs)
+        if "error" in r:
+            print(f"  {module:<28} {'error':>8}           {r['error']}")
+            continue
+        slowest = r["slowest"][0] if r["slowest"] else {"module": "-", "ms": 0}
+        heavy = f"  HEAVY: {', '.join(r['heavy_imports'])}" if r["heavy_imports"] else ""
+        print(f"  {module:<28} {r['p50_ms']:>8} {r['min_ms']:>8}  {slowest['module']} ({slowest['ms']} ms){heavy}")
+
+    report = {
+        "created_at": time.time(),
+        "python": sys.version.split()[0],
+        "config": {"runs": args.runs},
+        "results": {"imports": results},
+    }
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        print(f"\nBaseline saved to {save_baseline(report, 'import-' + args.save_baseline)}")
+
+    status = 0
+    if args.strict and any(r.get("heavy_imports") or "error" in r for r in results.values()):
+        status = 1
+    if args.compare:
+        name = args.compare if args.compare.endswith(".json") else "import-" + args.compare
+        rows = compare(report, load_baseline(name), args.fail_over, min_delta_ms=2.0)
+        regressions = [r for r in rows if r["regression"]]
+        print(f"\nCompared with {args.compare}: {len(regressions)} regressions (> {args.fail_over:.0%} slower)")
+        for r in regressions:
+            print(f"  {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+        status = status or (1 if regressions else 0)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+bench_pipeline.py
+
+Offline benchmark suite. Runs run_email_workflow, the compiled email_planner
+graph, the individual agents and the profile stores against FakeChatOpenAI
+(integrations/fake_llm.py), so results only depend on our own code plus the
+configured fake latency. Reports throughput, p50/p95/p99 latency, allocations
+(tracemalloc) and profile-store I/O, and can save/compare baselines.
+
+Usage (from src/):
+    python -m benchmarks.bench_pipeline --iterations 200 --concurrency 16 --latency-ms 50 --jitter-ms 20
+    python -m benchmarks.bench_pipeline --save-baseline main
+    python -m benchmarks.bench_pipeline --compare main --fail-over 0.15
+
+Profiles, sent history, checkpoints and the response cache are redirected to a
+temporary directory, and the response cache is off unless --cache is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+SAMPLES_PATH = Path(__file__).parent.parent.parent / "data" / "intent_samples.json"
+PROFILES_PATH = Path(__file__).parent.parent / "memory" / "user_profiles.json"
+BENCHES = ("workflow", "fused", "graph", "agents", "store")
+
+# Metrics where a higher value is a regression; everything else compared is
+# throughput, where lower is worse.
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "alloc_kib_per_op", "bytes_written_per_op")
+
+# ===========================
+# Measurement helpers
+# ===========================
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+def summarize(latencies_s: List[float], wall_s: float) -> Dict[str, Any]:
+    values = sorted(latencies_s)
+    return {
+        "n": len(values),
+        "throughput_per_s": round(len(values) / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": round(_percentile(values, 0.5) * 1000, 3),
+        "p95_ms": round(_percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(values, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+    }
+
+def timed_loop(fn: Callable[[int], Any], n: int) -> Dict[str, Any]:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+def allocations(fn: Callable[[int], Any], n: int) -> Dict[str, Any]:
+    """Bytes and blocks allocated per call (tracemalloc, so run on a small sample)."""
+    if n <= 0:
+        return {}
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        for i in range(n):
+            fn(i)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    allocated = sum(stat.size_diff for stat in diff if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+    return {
+        "alloc_kib_per_op": round(allocated / 1024 / n, 2),
+        "alloc_blocks_per_op": round(blocks / n, 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def load_prompts() -> List[str]:
+    with open(SAMPLES_PATH, "r", encoding="utf-8") as f:
+        samples = json.load(f)
+    return [prompt for prompts in samples.values() for prompt in prompts]
+
+# ===========================
+# Benchmarks
+# ===========================
+def bench_workflow(prompts: List[str], llm, n: int, concurrency: int, alloc_n: int, mode: str) -> Dict[str, Any]:
+    from workflow.langgraph_flow import arun_email_workflow, run_email_workflow
+    from workflow.scheduler import run_sync
+
+    async def run_all() -> Dict[str, Any]:
+        gate = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def one(i: int) -> None:
+            async with gate:
+                t0 = time.perf_counter()
+                await arun_email_workflow(prompts[i % len(prompts)], llm=llm, mode=mode)
+                latencies.append(time.perf_counter() - t0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        return summarize(latencies, time.perf_counter() - start)
+
+    result = run_sync(run_all())
+    result["concurrency"] = concurrency
+    result.update(allocations(lambda i: run_email_workflow(prompts[i % len(prompts)], llm=llm, mode=mode), alloc_n))
+    return result
+
+def bench_graph(prompts: List[str], n: int, alloc_n: int) -> Dict[str, Any]:
+    from langchain_core.messages import HumanMessage
+    from workflow.langgraph_flow import email_planner
+
+    def one(i: int) -> None:
+        email_planner.invoke(
+            {"messages": [HumanMessage(content=prompts[i % len(prompts)])]},
+            config={"configurable": {"thread_id": f"bench-{i}"}},
+        )
+
+    result = timed_loop(one, n)
+    result.update(allocations(lambda i: one(n + i), alloc_n))
+    return result
+
+def bench_agents(prompts: List[str], llm, n: int, alloc_n: int) -> Dict[str, Any]:
+    from agents import agents as A
+    from agents.review_gate import run_gate
+
+    base = {"messages": [{"content": prompts[0]}], "user_profile": {"name": "Manasa", "signature": "Best regards,"}}
+    base.update(A.input_parser_agent(base))
+    base.update(A.tone_stylist_agent(base))
+    base["intent"] = "follow-up"
+    base.update(A.draft_writer_agent(base, llm))
+    base.update(A.personalization_agent(base))
+    draft = base["personalized_draft"]
+    failed = {**base, "review": {"ok": False, "issues": ["Too formal for the recipient."], "suggested_edits": ""}}
+
+    def prompt_state(i: int) -> Dict[str, Any]:
+        state = dict(base)
+        state["messages"] = [{"content": prompts[i % len(prompts)]}]
+        state.update(A.input_parser_agent(state))
+        return state
+
+    cases: Dict[str, Callable[[int], Any]] = {
+        "input_parser_agent": lambda i: A.input_parser_agent({"messages": [{"content": prompts[i % len(prompts)]}]}),
+        "intent_detection_agent[llm]": lambda i: A.intent_detection_agent(prompt_state(i), llm, use_fast_path=False),
+        "intent_detection_agent[fast]": lambda i: A.intent_detection_agent(prompt_state(i), llm),
+        "tone_stylist_agent": lambda i: A.tone_stylist_agent(base),
+        "draft_writer_agent": lambda i: A.draft_writer_agent(base, llm),
+        "personalization_agent": lambda i: A.personalization_agent(base),
+        "review_gate": lambda i: run_gate(draft, base.get("tone_instructions", ""), {}, "Manasa"),
+        "review_agent[llm]": lambda i: A.review_agent(base, llm, use_gate=False),
+        "fused_generation_agent": lambda i: A.fused_generation_agent(base, llm),
+        "rewrite_agent[targeted]": lambda i: A.rewrite_agent(failed, llm),
+        "rewrite_agent[redraft]": lambda i: A.rewrite_agent(failed, llm, mode="redraft"),
+        "router_agent": lambda i: A.router_agent(base),
+    }
+    out = {}
+    for name, fn in cases.items():
+        out[name] = timed_loop(fn, n)
+        out[name].update(allocations(fn, alloc_n))
+    return out
+
+def bench_store(tmp: Path, n: int) -> Dict[str, Any]:
+    """Per-operation cost and bytes written for the JSON and SQLite profile stores."""
+    from memory.stores import JSONProfileStore, SentArchive, SQLiteProfileStore
+
+    json_path = tmp / "store_bench.json"
+    shutil.copy(PROFILES_PATH, json_path)
+    stores = {
+        "json": (JSONProfileStore(json_path, archive=SentArchive(tmp / "json_archive.jsonl")), [json_path]),
+        "sqlite": (
+            SQLiteProfileStore(tmp / "store_bench.sqlite3", migrate_from=json_path,
+                               archive=SentArchive(tmp / "sqlite_archive.jsonl")),
+            [tmp / "store_bench.sqlite3", tmp / "store_bench.sqlite3-wal"],
+        ),
+    }
+    example = {"subject": "Benchmark subject", "body": "Hello,\n\nThis is a benchmark email body.\n\nBest regards,\nManasa",
+               "intent": "follow-up"}
+    out = {}
+    for name, (store, files) in stores.items():
+        def size() -> int:
+            return sum(p.stat().st_size for p in files if p.exists())
+
+        written = [0]
+
+        def tracked(op: Callable[[int], Any]) -> Callable[[int], Any]:
+            # JSON rewrites the whole file per write, so its file size is the
+            # bytes written; for SQLite this approximates by WAL growth.
+            def run(i: int) -> None:
+                before = size()
+                op(i)
+                written[0] += max(size() - before, 0) if name == "sqlite" else size()
+            return run
+
+        profile = store.get_profile("default", include_history=False)
+        ops = {
+            "get_profile[warm]": lambda i: store.get_profile("default", include_history=False),
+            "get_profile[history]": lambda i: store.get_profile("default"),
+            "upsert_profile": tracked(lambda i: store.upsert_profile("default", {**profile, "bench_rev": i})),
+            "append_sent_example": tracked(lambda i: store.append_sent_example("default", example)),
+            "upsert+get_profile": lambda i: (store.upsert_profile("default", {**profile, "bench_rev": -i}),
+                                                   store.get_profile("default", include_history=False)),
+        }
+        out[name] = {}
+        for op_name, fn in ops.items():
+            written[0] = 0
+            result = timed_loop(fn, n)
+            if written[0]:
+                result["bytes_written_per_op"] = round(written[0] / n)
+            out[name][op_name] = result
+        out[name]["file_bytes"] = size()
+    return out
+
+# ===========================
+# Baselines
+# ===========================
+def flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "/"))
+        elif isinstance(value, (int, float)) and key.endswith(LOWER_IS_BETTER + ("throughput_per_s",)):
+            flat[path] = float(value)
+    return flat
+
+def _ms_delta(path: str, old: float, new: float) -> float:
+    """Absolute per-operation time difference in ms (throughput converted to time per op)."""
+    if path.endswith("_ms"):
+        return abs(new - old)
+    if path.endswith("throughput_per_s") and old and new:
+        return abs(1000 / new - 1000 / old)
+    return float("inf")
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    fail_over: float,
+    min_delta_ms: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """
+    Relative change per metric; `regression` when worse by more than fail_over.
+    Timing changes smaller than min_delta_ms are treated as noise.
+    """
+    now, then = flatten(current["results"]), flatten(baseline["results"])
+    rows = []
+    for path, old in sorted(then.items()):
+        if path not in now or old == 0:
+            continue
+        change = (now[path] - old) / old
+        worse = change if path.endswith(LOWER_IS_BETTER) else -change
+        significant = _ms_delta(path, old, now[path]) >= min_delta_ms
+        rows.append({"metric": path, "baseline": old, "current": now[path],
+                     "change": round(change, 4), "regression": worse > fail_over and significant})
+    return rows
+
+def save_baseline(report: Dict[str, Any], name: str) -> Path:
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return path
+
+def load_baseline(name: str) -> Dict[str, Any]:
+    path = Path(name) if name.endswith(".json") else BASELINE_DIR / f"{name}.json"
+    return json.loads(path.read_text(encoding="utf-8"))
+
+# ===========================
+# CLI
+# ===========================
+def _print_rows(title: str, rows: Dict[str, Dict[str, Any]]) -> None:
+    print(f"\n{title}")
+    print(f"  {'case':<30} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'KiB/op':>8} {'B written/op':>13}")
+    for name, r in rows.items():
+        if not isinstance(r, dict):
+            continue
+        print(f"  {name:<30} {r.get('throughput_per_s', 0):>9} {r.get('p50_ms', 0):>9} {r.get('p95_ms', 0):>9} "
+              f"{r.get('p99_ms', 0):>9} {r.get('alloc_kib_per_op', '-'):>8} {r.get('bytes_written_per_op', '-'):>13}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks with a fake chat model.")
+    parser.add_argument("--bench", nargs="+", choices=BENCHES, default=list(BENCHES))
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="In-flight workflows for the workflow benches.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake LLM latency per call.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the fake latency.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--alloc-samples", type=int, default=10, help="Calls traced with tracemalloc per case (0 = skip).")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache enabled.")
+    parser.add_argument("--json", dest="json_out", help="Write the full report to this file.")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="Baseline name (or .json path) to compare against.")
+    parser.add_argument("--fail-over", type=float, default=0.2, help="Regression threshold as a fraction (exit 1).")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore timing changes below this.")
+    args = parser.parse_args(argv)
+
+    tmp = Path(tempfile.mkdtemp(prefix="email-bench-"))
+    # Must happen before the memory/LLM modules are imported: they read these at import.
+    os.environ["LLM_FAKE"] = "1"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["LLM_FAKE_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["LLM_FAKE_SEED"] = str(args.seed)
+    os.environ["PROFILE_DB_PATH"] = str(tmp / "profiles.sqlite3")
+    os.environ["SENT_ARCHIVE_PATH"] = str(tmp / "sent_archive.jsonl")
+    os.environ["LLM_CACHE_PATH"] = str(tmp / "llm_cache.sqlite3")
+    os.environ["CHECKPOINT_DB_PATH"] = str(tmp / "checkpoints.sqlite3")
+    # The fake model has no quota; keep the rate limiter out of the timings.
+    os.environ.setdefault("LLM_RATE_LIMIT", "0")
+    if not args.cache:
+        os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+    from integrations.fake_llm import FakeChatOpenAI
+
+    llm = FakeChatOpenAI.from_file(latency_s=args.latency_ms / 1000, jitter_s=args.jitter_ms / 1000, seed=args.seed)
+    prompts = load_prompts()
+    n, alloc_n = args.iterations, args.alloc_samples
+
+    results: Dict[str, Any] = {}
+    try:
+        if "workflow" in args.bench:
+            results["workflow"] = bench_workflow(prompts, llm, n, args.concurrency, alloc_n, "pipeline")
+        if "fused" in args.bench:
+            results["fused"] = bench_workflow(prompts, llm, n, args.concurrency, alloc_n, "fused")
+        if "graph" in args.bench:
+            results["graph"] = bench_graph(prompts, n, alloc_n)
+        if "agents" in args.bench:
+            results["agents"] = bench_agents(prompts, llm, n, alloc_n)
+        if "store" in args.bench:
+            results["store"] = bench_store(tmp, n)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "created_at": time.time(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_out", "save_baseline", "compare")},
+        "results": results,
+    }
+
+    _print_rows("Pipelines", {k: results[k] for k in ("workflow", "fused", "graph") if k in results})
+    if "agents" in results:
+        _print_rows("Agents", results["agents"])
+    for name, ops in results.get("store", {}).items():
+        _print_rows(f"Profile store ({name}, {ops['file_bytes']} bytes on disk)", ops)
+
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        print(f"\nBaseline saved to {save_baseline(report, args.save_baseline)}")
+
+    status = 0
+    if args.compare:
+        rows = compare(report, load_baseline(args.compare), args.fail_over, args.min_delta_ms)
+        regressions = [r for r in rows if r["regression"]]
+        print(f"\nCompared with {args.compare}: {len(rows)} metrics, {len(regressions)} regressions "
+              f"(> {args.fail_over:.0%} worse)")
+        for r in regressions:
+            print(f"  {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+        status = 1 if regressions else 0
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+bench_rerun.py
+
+What a Streamlit interaction costs. Drives ui/streamlit_app.py headlessly with
+streamlit.testing (AppTest) against the fake chat model and times whole
+script reruns:
+
+- idle:     plain reruns (widget changes) with nothing else running,
+- busy:     the same reruns while other pipelines keep the shared loop busy
+            (--load workflows in flight, as other sessions would),
+- generate: reruns that click "Generate email".
+
+The first rerun, which builds the cached resources, is reported on its own.
+
+Usage (from src/):
+    python -m benchmarks.bench_rerun --reruns 30 --load 8 --latency-ms 50
+    python -m benchmarks.bench_rerun --json rerun.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_pipeline import load_prompts, summarize
+
+APP_PATH = Path(__file__).parent.parent / "ui" / "streamlit_app.py"
+PROMPT_LABEL = "Describe intent"
+
+def _timed_reruns(at, n: int, before=None) -> Dict[str, Any]:
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for i in range(n):
+        if before:
+            before(at, i)
+        t0 = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - t0)
+        if at.exception:
+            raise RuntimeError(f"app raised: {at.exception[0].message}")
+    return summarize(latencies, time.perf_counter() - start)
+
+def _generate(prompts: List[str]):
+    def before(at, i: int) -> None:
+        next(t for t in at.text_area if t.label.startswith(PROMPT_LABEL)).input(prompts[i % len(prompts)])
+        next(b for b in at.button if b.label == "Generate email").click()
+    return before
+
+class BackgroundLoad:
+    """Keeps `concurrency` workflows in flight on the shared pipeline loop."""
+
+    def __init__(self, prompts: List[str], concurrency: int):
+        self.prompts, self.concurrency = prompts, concurrency
+        self.runs = 0
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _worker(self, offset: int) -> None:
+        from workflow.langgraph_flow import run_email_workflow
+        i = offset
+        while not self._stop.is_set():
+            run_email_workflow(self.prompts[i % len(self.prompts)])
+            self.runs += 1
+            i += self.concurrency
+
+    def __enter__(self) -> "BackgroundLoad":
+        from workflow.scheduler import in_flight
+        self._threads = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(self.concurrency)]
+        for thread in self._threads:
+            thread.start()
+        while self.concurrency and not in_flight():
+            time.sleep(0.001)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streamlit rerun latency, idle and under load.")
+    parser.add_argument("-n", "--reruns", type=int, default=20)
+    parser.add_argument("--generate", type=int, default=5, help="Timed reruns that generate an email.")
+    parser.add_argument("--load", type=int, default=8, help="Workflows kept in flight for the busy case.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake LLM latency per call.")
+    parser.add_argument("--json", dest="json_out", help="Write the report to this file.")
+    args = parser.parse_args(argv)
+
+    tmp = Path(tempfile.mkdtemp(prefix="email-rerun-"))
+    os.environ["LLM_FAKE"] = "1"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["PROFILE_DB_PATH"] = str(tmp / "profiles.sqlite3")
+    os.environ["SENT_ARCHIVE_PATH"] = str(tmp / "sent_archive.jsonl")
+    os.environ["LLM_CACHE_PATH"] = str(tmp / "llm_cache.sqlite3")
+    os.environ["CHECKPOINT_DB_PATH"] = str(tmp / "checkpoints.sqlite3")
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("LLM_RATE_LIMIT", "0")
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+    from streamlit.testing.v1 import AppTest
+
+    prompts = load_prompts()
+    results: Dict[str, Any] = {}
+    try:
+        at = AppTest.from_file(str(APP_PATH), default_timeout=120)
+        t0 = time.perf_counter()
+        at.run()
+        results["first"] = {"ms": round((time.perf_counter() - t0) * 1000, 3)}
+        results["idle"] = _timed_reruns(at, args.reruns)
+        with BackgroundLoad(prompts, args.load) as load:
+            results["busy"] = _timed_reruns(at, args.reruns)
+        results["busy"]["load"] = args.load
+        results["busy"]["background_runs"] = load.runs
+        results["generate"] = _timed_reruns(at, args.generate, _generate(prompts))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"\nStreamlit reruns (fake LLM latency {args.latency_ms} ms)")
+    print(f"  {'first run':<12} {results['first']['ms']:>9} ms")
+    for name in ("idle", "busy", "generate"):
+        r = results[name]
+        print(f"  {name:<12} p50 {r['p50_ms']:>9} ms   p95 {r['p95_ms']:>9} ms   n={r['n']}")
+    if args.json_out:
+        report = {"created_at": time.time(), "config": vars(args), "results": results}
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
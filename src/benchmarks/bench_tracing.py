@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+bench_tracing.py
+
+Overhead of agent tracing (integrations/tracing.py), offline:
+
+- per call: a trivial @traced function with tracing off, sampled out
+  (TRACE_SAMPLE_RATE=0) and exported locally, against the plain function,
+- per run:  run_email_workflow against the fake chat model with tracing off
+  and with local export at the given sample rate,
+- exporter: spans written, batches, background write time and drops.
+
+The local exporter writes to a temporary directory.
+
+Usage (from src/):
+    python -m benchmarks.bench_tracing
+    python -m benchmarks.bench_tracing --calls 200000 --runs 300 --sample-rate 0.1 --json tracing.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.bench_pipeline import load_prompts, summarize, timed_loop
+
+def _ns_per_call(fn: Callable[[int], Any], n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) * 1e9 / n
+
+def bench_calls(n: int) -> Dict[str, Any]:
+    from integrations.tracing import TracingConfig, reset_tracing, traced
+
+    def plain(i: int) -> Dict[str, int]:
+        return {"i": i}
+
+    wrapped = traced(run_type="tool", name="bench_noop")(plain)
+    results = {"plain_ns": round(_ns_per_call(plain, n), 1)}
+    for label, config in (
+        ("off", TracingConfig(exporter="off")),
+        ("sampled_out", TracingConfig(exporter="local", sample_rate=0.0)),
+        ("local", TracingConfig(exporter="local", sample_rate=1.0)),
+    ):
+        reset_tracing(config)
+        results[f"{label}_ns"] = round(_ns_per_call(wrapped, n), 1)
+        results[f"{label}_overhead_ns"] = round(results[f"{label}_ns"] - results["plain_ns"], 1)
+    return results
+
+def bench_workflow(prompts: List[str], llm, n: int, sample_rate: float) -> Dict[str, Any]:
+    from integrations.tracing import TracingConfig, reset_tracing
+    from workflow.langgraph_flow import run_email_workflow
+
+    def one(i: int) -> None:
+        run_email_workflow(prompts[i % len(prompts)], llm=llm)
+
+    results = {}
+    for label, config in (
+        ("off", TracingConfig(exporter="off")),
+        ("local", TracingConfig(exporter="local", sample_rate=sample_rate)),
+    ):
+        reset_tracing(config)
+        timed_loop(one, min(n, 20))  # warm-up
+        results[label] = timed_loop(one, n)
+    results["p50_overhead_ms"] = round(results["local"]["p50_ms"] - results["off"]["p50_ms"], 3)
+    results["mean_overhead_ms"] = round(results["local"]["mean_ms"] - results["off"]["mean_ms"], 3)
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Tracing overhead per call and per workflow run.")
+    parser.add_argument("--calls", type=int, default=100000, help="Calls of the traced no-op per case.")
+    parser.add_argument("--runs", type=int, default=200, help="Workflow runs per case.")
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="TRACE_SAMPLE_RATE for the local case.")
+    parser.add_argument("--json", dest="json_out", help="Write the report to this file.")
+    args = parser.parse_args(argv)
+
+    tmp = Path(tempfile.mkdtemp(prefix="email-tracing-"))
+    os.environ["LLM_FAKE"] = "1"
+    os.environ["PROFILE_DB_PATH"] = str(tmp / "profiles.sqlite3")
+    os.environ["SENT_ARCHIVE_PATH"] = str(tmp / "sent_archive.jsonl")
+    os.environ["LLM_CACHE_PATH"] = str(tmp / "llm_cache.sqlite3")
+    os.environ["CHECKPOINT_DB_PATH"] = str(tmp / "checkpoints.sqlite3")
+    os.environ["TRACE_PATH"] = str(tmp / "traces" / "spans.jsonl")
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("LLM_RATE_LIMIT", "0")
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+    from integrations.fake_llm import FakeChatOpenAI
+    from integrations.tracing import flush_traces, tracing_stats
+
+    results: Dict[str, Any] = {}
+    try:
+        results["calls"] = bench_calls(args.calls)
+        results["workflow"] = bench_workflow(load_prompts(), FakeChatOpenAI.from_file(), args.runs, args.sample_rate)
+        flush_traces()
+        results["exporter"] = tracing_stats()
+        results["exporter"]["file_bytes"] = sum(p.stat().st_size for p in (tmp / "traces").glob("spans.jsonl*"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    calls = results["calls"]
+    print("\nTraced call overhead (ns per call)")
+    print(f"  {'plain':<14} {calls['plain_ns']:>9}")
+    for label in ("off", "sampled_out", "local"):
+        print(f"  {label:<14} {calls[label + '_ns']:>9}  (+{calls[label + '_overhead_ns']})")
+    wf = results["workflow"]
+    print(f"\nWorkflow run (fake LLM, sample rate {args.sample_rate})")
+    for label in ("off", "local"):
+        print(f"  {label:<14} p50 {wf[label]['p50_ms']:>9} ms   mean {wf[label]['mean_ms']:>9} ms")
+    print(f"  overhead       p50 {wf['p50_overhead_ms']:+} ms   mean {wf['mean_overhead_ms']:+} ms")
+    ex = results["exporter"]
+    print(f"\nExporter: {ex['exported']} spans in {ex['batches']} batches, {ex['export_ms']:.1f} ms writing "
+          f"off-thread, {ex['dropped']} dropped, {ex['file_bytes']} bytes")
+    if args.json_out:
+        report = {"created_at": time.time(), "config": vars(args), "results": results}
+        Path(args.json_out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# integrations/fake_llm.py
+"""
+Deterministic offline stand-in for ChatOpenAI.
+
+FakeChatOpenAI replays recorded responses (data/fake_llm_responses.json by
+default) with a configurable latency and jitter, and reports estimated token
+usage the same way the real client does, so the workflow, the compiled graph,
+the benchmarks and the metrics can be exercised without network access.
+
+A recorded rule applies when its `match` substring appears in the rendered
+prompt; matching rules cycle through their `responses` in order.
+
+    llm = FakeChatOpenAI.from_file(latency_s=0.2, jitter_s=0.05, seed=7)
+
+Set LLM_FAKE=1 to make make_openai_llm() hand out this model instead of
+ChatOpenAI (LLM_FAKE_LATENCY_MS, LLM_FAKE_JITTER_MS, LLM_FAKE_RESPONSES).
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+RESPONSES_PATH = Path(__file__).parent.parent.parent / "data" / "fake_llm_responses.json"
+
+# Characters per streamed chunk (roughly a few tokens, like the real API).
+STREAM_CHUNK_CHARS = 12
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(m.content) for m in messages)
+
+def load_recorded_responses(path: Path = RESPONSES_PATH) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class FakeChatOpenAI(BaseChatModel):
+    rules: List[Dict[str, Any]]
+    default: str = "OK"
+    latency_s: float = 0.0
+    jitter_s: float = 0.0
+    seed: int = 0
+    model_name: str = "fake-gpt"
+    temperature: float = 0.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _rng: random.Random = PrivateAttr()
+    _cursor: Dict[int, int] = PrivateAttr(default_factory=dict)
+    calls: int = 0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @classmethod
+    def from_file(cls, path: Path = RESPONSES_PATH, **kwargs) -> "FakeChatOpenAI":
+        recorded = load_recorded_responses(path)
+        return cls(rules=recorded["rules"], default=recorded.get("default", "OK"), **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-openai"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    # ---------------------------
+    # Replay
+    # ---------------------------
+    def _reply(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            for i, rule in enumerate(self.rules):
+                if rule["match"] in prompt:
+                    responses = rule["responses"]
+                    n = self._cursor.get(i, 0)
+                    self._cursor[i] = n + 1
+                    return responses[n % len(responses)]
+            return self.default
+
+    def _delay(self) -> float:
+        if self.latency_s <= 0 and self.jitter_s <= 0:
+            return 0.0
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_s, self.jitter_s) if self.jitter_s else 0.0
+        return max(0.0, self.latency_s + jitter)
+
+    def _message(self, prompt: str, text: str) -> AIMessage:
+        prompt_tokens, completion_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": self.model_name},
+        )
+
+    def _chunks(self, prompt: str, text: str) -> Iterator[ChatGenerationChunk]:
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        for piece in pieces:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        # Usage arrives with the final (empty) chunk, as with stream_usage=True.
+        prompt_tokens, completion_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": self.model_name},
+        ))
+
+    # ---------------------------
+    # BaseChatModel hooks
+    # ---------------------------
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _prompt_text(messages)
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, self._reply(prompt)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _prompt_text(messages)
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, self._reply(prompt)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        time.sleep(self._delay())
+        for chunk in self._chunks(prompt, self._reply(prompt)):
+            if run_manager and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        await asyncio.sleep(self._delay())
+        for chunk in self._chunks(prompt, self._reply(prompt)):
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+# ===========================
+# Environment switch
+# ===========================
+def fake_enabled() -> bool:
+    return os.environ.get("LLM_FAKE", "0").lower() in ("1", "true", "yes")
+
+def fake_llm_from_env(model: str = "fake-gpt", temperature: float = 0.0) -> FakeChatOpenAI:
+    return FakeChatOpenAI.from_file(
+        Path(os.environ.get("LLM_FAKE_RESPONSES", str(RESPONSES_PATH))),
+        latency_s=float(os.environ.get("LLM_FAKE_LATENCY_MS", "0")) / 1000,
+        jitter_s=float(os.environ.get("LLM_FAKE_JITTER_MS", "0")) / 1000,
+        seed=int(os.environ.get("LLM_FAKE_SEED", "0")),
+        model_name=model,
+        temperature=temperature,
+    )
@@ -0,0 +1,229 @@
+# integrations/fake_openai_server.py
+"""
+Local stand-in for the OpenAI chat completions endpoint, for testing the rate
+limiter (integrations/rate_limiter.py) and the real ChatOpenAI/HTTP path
+offline.
+
+POST /v1/chat/completions answers with the recorded responses of
+integrations/fake_llm.py (streaming included) and enforces its own
+requests/tokens-per-minute limits: requests beyond them get a 429 with
+retry-after-ms / retry-after headers, like the real API. `fail_rate` and
+`error_rate` inject random 429s and 500s on top. GET /stats returns counters.
+
+Usage (from src/):
+    python -m integrations.fake_openai_server --port 8765 --rpm 60 --fail-rate 0.05 --latency-ms 150
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python -m workflow.batch prompts.jsonl
+
+    with FakeOpenAIServer(rpm=30) as server:   # in-process, on a free port
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from integrations.fake_llm import STREAM_CHUNK_CHARS, FakeChatOpenAI, RESPONSES_PATH, _estimate_tokens
+
+WINDOW_S = 60.0
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rpm: int = 0,
+        tpm: int = 0,
+        fail_rate: float = 0.0,
+        error_rate: float = 0.0,
+        latency_s: float = 0.0,
+        seed: int = 0,
+        responses_path=RESPONSES_PATH,
+    ):
+        self.rpm, self.tpm = rpm, tpm
+        self.fail_rate, self.error_rate = fail_rate, error_rate
+        self.latency_s = latency_s
+        self.model = FakeChatOpenAI.from_file(responses_path)
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "streamed": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # (timestamp, tokens) of admitted requests within the last minute
+        self._window: deque = deque()
+        self._ids = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ---------------------------
+    # Admission (server side)
+    # ---------------------------
+    def _admit(self, tokens: int) -> Tuple[int, float]:
+        """(status, retry-after seconds); 200 admits and records the request."""
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= WINDOW_S:
+                self._window.popleft()
+            if self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, 0.0
+            used = sum(t for _, t in self._window)
+            over_rpm = self.rpm and len(self._window) >= self.rpm
+            over_tpm = self.tpm and used + tokens > self.tpm
+            if over_rpm or over_tpm:
+                self.stats["throttled"] += 1
+                return 429, max(WINDOW_S - (now - self._window[0][0]), 0.05) if self._window else 1.0
+            if self._rng.random() < self.fail_rate:
+                self.stats["throttled"] += 1
+                return 429, 0.2
+            self._window.append((now, tokens))
+            self.stats["ok"] += 1
+            self._ids += 1
+            return 200, 0.0
+
+    def _completion_id(self) -> str:
+        with self._lock:
+            return f"chatcmpl-fake-{self._ids}"
+
+    # ---------------------------
+    # HTTP
+    # ---------------------------
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    with server._lock:
+                        self._json(200, dict(server.stats))
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                prompt = _messages_text(request.get("messages") or [])
+                prompt_tokens = _estimate_tokens(prompt)
+                status, wait_s = server._admit(prompt_tokens + int(request.get("max_tokens") or 0))
+                if status == 429:
+                    self._json(429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                               "param": None, "code": "rate_limit_exceeded"}},
+                               {"retry-after-ms": str(int(wait_s * 1000)), "retry-after": str(math.ceil(wait_s))})
+                    return
+                if status == 500:
+                    self._json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+                    return
+                if server.latency_s:
+                    time.sleep(server.latency_s)
+                text = server.model._reply(prompt)
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _estimate_tokens(text),
+                         "total_tokens": prompt_tokens + _estimate_tokens(text)}
+                model = request.get("model", "gpt-4o-mini")
+                if request.get("stream"):
+                    include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+                    self._stream(model, text, usage if include_usage else None)
+                    return
+                self._json(200, {
+                    "id": server._completion_id(), "object": "chat.completion", "created": int(time.time()),
+                    "model": model, "usage": usage,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                })
+
+            def _stream(self, model: str, text: str, usage: Optional[Dict[str, int]]) -> None:
+                with server._lock:
+                    server.stats["streamed"] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = {"id": server._completion_id(), "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": model}
+                events = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": text[i:i + STREAM_CHUNK_CHARS]},
+                                                "finish_reason": None}]}
+                          for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+                events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if usage:
+                    events.append({**base, "choices": [], "usage": usage})
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def _messages_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(p.get("text", "") for p in content if isinstance(p, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions endpoint with rate limits.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute before 429s (0 = unlimited)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with a random 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(args.host, args.port, args.rpm, args.tpm, args.fail_rate, args.error_rate,
+                              args.latency_ms / 1000)
+    print(f"Fake OpenAI endpoint on {server.base_url} (rpm={args.rpm}, tpm={args.tpm})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+if __name__ == "__main__":
+    main()
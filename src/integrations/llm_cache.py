@@ -0,0 +1,288 @@
+# integrations/llm_cache.py
+"""
+Persistent response cache for deterministic LLM calls.
+
+Entries are keyed on the normalized rendered prompt plus model and temperature.
+Hot entries live in an in-memory LRU; everything is also written to a SQLite
+file so repeated prompts are served across restarts. Entries expire after a
+TTL and the on-disk table is trimmed to a maximum size (least recently used
+first).
+
+Disk writes (new entries, last-access times of disk hits, expired rows) are
+queued and committed in batches by one background writer thread, and async
+callers look up the disk with aget(), which runs in a worker thread, so the
+shared pipeline loop never waits on SQLite.
+
+Configuration (environment):
+    LLM_CACHE_ENABLED      "0" disables the cache entirely (default "1")
+    LLM_CACHE_AGENTS       comma-separated agents that use it (default "intent_detection,review")
+    LLM_CACHE_PATH         SQLite file (default <repo>/.cache/llm_cache.sqlite3)
+    LLM_CACHE_TTL          seconds before an entry expires (default 7 days)
+    LLM_CACHE_MEMORY_ITEMS in-memory LRU size (default 512)
+    LLM_CACHE_DISK_ITEMS   max rows kept on disk (default 20000)
+"""
+import asyncio
+import atexit
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / ".cache" / "llm_cache.sqlite3"
+DEFAULT_CACHED_AGENTS = "intent_detection,review"
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    """Collapses whitespace so trivially different resends share an entry."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+def cache_key(rendered_prompt: str, model: str, temperature: Optional[float]) -> str:
+    payload = f"{model}\x1f{temperature}\x1f{normalize_prompt(rendered_prompt)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def llm_identity(llm) -> Dict[str, Any]:
+    """Best-effort (model, temperature) of a LangChain chat model."""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return {"model": str(model), "temperature": getattr(llm, "temperature", None)}
+
+class LLMCache:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_memory_items: int = 512,
+        max_disk_items: int = 20000,
+    ):
+        self.path = Path(path) if path else None
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self.last_error: Optional[str] = None
+        self._conn = None
+        # Queued for the writer thread: new rows, last-access times and expired keys.
+        self._pending_rows: Dict[str, Tuple[str, str, float, float]] = {}
+        self._pending_access: Dict[str, float] = {}
+        self._pending_deletes: Set[str] = set()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+            self._thread = threading.Thread(target=self._run, name="llm-cache-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # -----------------------------
+    # Counters
+    # -----------------------------
+    def _count(self, agent: str, name: str) -> None:
+        bucket = self.counters.setdefault(agent, {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0})
+        bucket[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_agent = {agent: dict(c) for agent, c in self.counters.items()}
+        hits = sum(c["hits"] for c in per_agent.values())
+        misses = sum(c["misses"] for c in per_agent.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "memory_items": len(self._memory),
+            "agents": per_agent,
+        }
+
+    # -----------------------------
+    # Lookup / store
+    # -----------------------------
+    def _get_memory(self, key: str, agent: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._count(agent, "hits")
+                    self._count(agent, "memory_hits")
+                    return value
+                del self._memory[key]
+            if self._conn is None:
+                self._count(agent, "misses")
+            return None
+
+    def _get_disk(self, key: str, agent: str, now: float) -> Optional[str]:
+        """A read only: the last-access update (or delete of an expired row) is queued for the writer."""
+        with self._lock:
+            pending = self._pending_rows.get(key)
+        if pending is not None:
+            row = (pending[1], pending[2])
+        else:
+            with self._db_lock:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+        with self._lock:
+            if row is not None:
+                value, created_at = row
+                if now - created_at <= self.ttl_seconds:
+                    self._pending_access[key] = now
+                    self._remember(key, value, created_at)
+                    self._count(agent, "hits")
+                    self._count(agent, "disk_hits")
+                    return value
+                self._pending_deletes.add(key)
+            self._count(agent, "misses")
+        return None
+
+    def get(self, key: str, agent: str = "default") -> Optional[str]:
+        now = time.time()
+        value = self._get_memory(key, agent, now)
+        if value is None and self._conn is not None:
+            value = self._get_disk(key, agent, now)
+        return value
+
+    async def aget(self, key: str, agent: str = "default") -> Optional[str]:
+        """get() for code on the event loop: memory hits return inline, disk lookups run in a thread."""
+        now = time.time()
+        value = self._get_memory(key, agent, now)
+        if value is None and self._conn is not None:
+            value = await asyncio.to_thread(self._get_disk, key, agent, now)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Stores in memory and queues the disk write; never blocks on SQLite."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._conn is None:
+                return
+            self._pending_rows[key] = (key, value, now, now)
+            self._pending_deletes.discard(key)
+        self._wake.set()
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    # -----------------------------
+    # Background writer
+    # -----------------------------
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(1.0)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                self.last_error = str(e)
+
+    def flush(self) -> int:
+        """Commits everything queued in one transaction; returns the number of new rows written."""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            rows: List[tuple] = list(self._pending_rows.values())
+            access = [(at, key) for key, at in self._pending_access.items()]
+            deletes = [(key,) for key in self._pending_deletes]
+            self._pending_rows, self._pending_access, self._pending_deletes = {}, {}, set()
+        if not (rows or access or deletes):
+            return 0
+        with self._db_lock:
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", deletes)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany("UPDATE llm_cache SET last_access = ? WHERE key = ?", access)
+            self._writes_since_trim += len(rows)
+            if self._writes_since_trim >= 100:
+                self._trim(time.time())
+            self._conn.commit()
+        return len(rows)
+
+    def _trim(self, now: float) -> None:
+        """Drops expired rows, then the least recently used ones over the size cap."""
+        self._writes_since_trim = 0
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_items,),
+        )
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        if not self._closed.is_set():
+            self._closed.set()
+            self._wake.set()
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self.counters.clear()
+            self._pending_rows, self._pending_access, self._pending_deletes = {}, {}, set()
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+# ===========================
+# Process-wide cache and per-agent switches
+# ===========================
+_CACHE: Optional[LLMCache] = None
+_CACHE_LOCK = threading.Lock()
+_AGENT_OVERRIDES: Dict[str, bool] = {}
+
+def get_llm_cache() -> LLMCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = LLMCache(
+                path=Path(os.environ.get("LLM_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+                ttl_seconds=float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+                max_memory_items=int(os.environ.get("LLM_CACHE_MEMORY_ITEMS", "512")),
+                max_disk_items=int(os.environ.get("LLM_CACHE_DISK_ITEMS", "20000")),
+            )
+        return _CACHE
+
+def _configured_agents() -> Set[str]:
+    raw = os.environ.get("LLM_CACHE_AGENTS", DEFAULT_CACHED_AGENTS)
+    return {name.strip() for name in raw.split(",") if name.strip()}
+
+def set_cache_enabled(agent: str, enabled: bool) -> None:
+    """Turns the cache on or off for one agent, overriding LLM_CACHE_AGENTS."""
+    _AGENT_OVERRIDES[agent] = enabled
+
+def cache_enabled(agent: str) -> bool:
+    if os.environ.get("LLM_CACHE_ENABLED", "1") == "0":
+        return False
+    if agent in _AGENT_OVERRIDES:
+        return _AGENT_OVERRIDES[agent]
+    return agent in _configured_agents()
+
+def cache_for(agent: str) -> Optional[LLMCache]:
+    return get_llm_cache() if cache_enabled(agent) else None
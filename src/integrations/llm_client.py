@@ -1,11 +1,67 @@
 # integrations/llm_client.py
 
+import asyncio
 import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import httpx
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
+# ===========================
+# Shared HTTP connection pools
+# ===========================
+# One keep-alive pool is shared by every cached client, so agents, requests
+# and Streamlit reruns reuse the same TLS connections to the API. Limits can
+# be tuned through the environment.
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+
+def http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(float(os.environ.get("LLM_HTTP_TIMEOUT", "60")), connect=10.0)
+
+_LOCK = threading.Lock()
+_HTTP_CLIENT: Optional[httpx.Client] = None
+# Async pools are bound to the event loop that opened their connections, so
+# they are kept per loop and dropped together with it.
+_ASYNC_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.Client:
+    global _HTTP_CLIENT
+    with _LOCK:
+        if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+            _HTTP_CLIENT = httpx.Client(limits=http_limits(), timeout=http_timeout())
+        return _HTTP_CLIENT
+
+def get_async_http_client(loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+    with _LOCK:
+        client = _ASYNC_HTTP_CLIENTS.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+            _ASYNC_HTTP_CLIENTS[loop] = client
+        return client
+
+# ===========================
+# Cached LLM clients
+# ===========================
+_LLM_CACHE: "Dict[Tuple[str, float], ChatOpenAI]" = {}
+_LOOP_LLM_CACHE: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, float], ChatOpenAI]]" = weakref.WeakKeyDictionary()
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
 def make_openai_llm(
     model: str = "gpt-4o-mini",
@@ -16,14 +72,62 @@ def make_openai_llm(
     - LangChain pipe operator (|)
     - LangGraph
     - PromptTemplates
+
+    Clients are cached per (model, temperature) and share one keep-alive HTTP
+    pool. When called inside a running event loop the client also gets that
+    loop's async pool, so `ainvoke` reuses connections too.
+
+    With LLM_FAKE=1 an offline FakeChatOpenAI (integrations/fake_llm.py) is
+    returned instead, e.g. for benchmarks.
+
+    langchain_openai (and the fake model) are imported on first call, which
+    keeps importing this module cheap.
     """
+    from integrations.fake_llm import fake_enabled, fake_llm_from_env
+
+    if fake_enabled():
+        with _LOCK:
+            key = ("fake:" + model, float(temperature))
+            llm = _LLM_CACHE.get(key)
+            if llm is None:
+                llm = _LLM_CACHE[key] = fake_llm_from_env(model, temperature)
+            return llm
 
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise EnvironmentError("OPENAI_API_KEY not set in environment.")
+    from langchain_openai import ChatOpenAI
 
-    return ChatOpenAI(
-        model=model,
-        temperature=temperature,
-        api_key=api_key,
-    )
+    key = (model, float(temperature))
+    loop = _running_loop()
+    http_client = get_http_client()
+    http_async_client = get_async_http_client(loop) if loop is not None else None
+
+    with _LOCK:
+        cache = _LLM_CACHE if loop is None else _LOOP_LLM_CACHE.setdefault(loop, {})
+        llm = cache.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                api_key=api_key,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                # Report token usage on streamed responses too (integrations/metrics.py)
+                stream_usage=True,
+                # integrations/rate_limiter.py retries with backoff and Retry-After
+                max_retries=0,
+            )
+            cache[key] = llm
+        return llm
+
+def reset_llm_clients() -> None:
+    """Drops cached clients and closes the shared sync pool (e.g. after a key rotation)."""
+    global _HTTP_CLIENT
+    with _LOCK:
+        _LLM_CACHE.clear()
+        _LOOP_LLM_CACHE.clear()
+        _ASYNC_HTTP_CLIENTS.clear()
+        if _HTTP_CLIENT is not None:
+            _HTTP_CLIENT.close()
+            _HTTP_CLIENT = None
@@ -0,0 +1,277 @@
+# integrations/metrics.py
+"""
+Per-agent latency, token, retry and cache instrumentation.
+
+Every pipeline step runs inside `step_metrics(name)` (see workflow/scheduler.py),
+which times it and collects what the LLM helpers in agents/agents.py report
+through record_usage / record_cache / record_retry / record_queue_wait. Finished steps are folded
+into a process-wide registry that exposes:
+
+- snapshot():        JSON-friendly dict with p50/p95/p99 latency per agent
+- prometheus_text(): Prometheus text exposition format
+- write_prometheus(path) / start_metrics_server(port) for scraping
+"""
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional
+
+from integrations.model_routing import cost_usd
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Latency samples kept per agent for percentile estimates.
+RESERVOIR_SIZE = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+@dataclass
+class StepRecord:
+    agent: str
+    elapsed_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    llm_calls: int = 0
+    queue_wait_ms: float = 0.0
+    cost_usd: float = 0.0
+    error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {
+            "elapsed_ms": round(self.elapsed_ms, 2),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_calls": self.llm_calls,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "queue_wait_ms": round(self.queue_wait_ms, 2),
+            "cost_usd": round(self.cost_usd, 6),
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
+
+@dataclass
+class AgentStats:
+    latencies: deque = field(default_factory=lambda: deque(maxlen=RESERVOIR_SIZE))
+    count: int = 0
+    latency_sum_s: float = 0.0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    queue_wait_s: float = 0.0
+    cost_usd: float = 0.0
+
+def quantile(sorted_values, q: float) -> float:
+    """Nearest-rank quantile of an already sorted sequence (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.agents: Dict[str, AgentStats] = {}
+
+    def observe(self, record: StepRecord) -> None:
+        with self._lock:
+            stats = self.agents.setdefault(record.agent, AgentStats())
+            stats.latencies.append(record.elapsed_ms / 1000.0)
+            stats.count += 1
+            stats.latency_sum_s += record.elapsed_ms / 1000.0
+            stats.errors += 1 if record.error else 0
+            stats.prompt_tokens += record.prompt_tokens
+            stats.completion_tokens += record.completion_tokens
+            stats.llm_calls += record.llm_calls
+            stats.retries += record.retries
+            stats.cache_hits += record.cache_hits
+            stats.cache_misses += record.cache_misses
+            stats.queue_wait_s += record.queue_wait_ms / 1000.0
+            stats.cost_usd += record.cost_usd
+
+    def reset(self) -> None:
+        with self._lock:
+            self.agents.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for agent, stats in self.agents.items():
+                values = sorted(stats.latencies)
+                out[agent] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "latency_ms": {f"p{int(q * 100)}": round(quantile(values, q) * 1000, 2) for q in QUANTILES},
+                    "latency_mean_ms": round(stats.latency_sum_s / stats.count * 1000, 2) if stats.count else 0.0,
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "llm_calls": stats.llm_calls,
+                    "retries": stats.retries,
+                    "cache_hits": stats.cache_hits,
+                    "cache_misses": stats.cache_misses,
+                    "queue_wait_ms": round(stats.queue_wait_s * 1000, 2),
+                    "cost_usd": round(stats.cost_usd, 6),
+                }
+            return {"generated_at": time.time(), "agents": out}
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()["agents"]
+        lines = [
+            "# HELP email_agent_latency_seconds Agent step wall time.",
+            "# TYPE email_agent_latency_seconds summary",
+        ]
+        with self._lock:
+            sums = {agent: stats.latency_sum_s for agent, stats in self.agents.items()}
+        for agent, s in snap.items():
+            for q in QUANTILES:
+                lines.append(
+                    f'email_agent_latency_seconds{{agent="{agent}",quantile="{q}"}} '
+                    f'{s["latency_ms"][f"p{int(q * 100)}"] / 1000:.6f}'
+                )
+            lines.append(f'email_agent_latency_seconds_sum{{agent="{agent}"}} {sums.get(agent, 0.0):.6f}')
+            lines.append(f'email_agent_latency_seconds_count{{agent="{agent}"}} {s["count"]}')
+        counters = [
+            ("email_agent_errors_total", "Failed agent steps.", lambda s: [("", s["errors"])]),
+            ("email_agent_tokens_total", "LLM tokens by kind.",
+             lambda s: [(',kind="prompt"', s["prompt_tokens"]), (',kind="completion"', s["completion_tokens"])]),
+            ("email_agent_llm_calls_total", "LLM calls made.", lambda s: [("", s["llm_calls"])]),
+            ("email_agent_retries_total", "LLM call retries.", lambda s: [("", s["retries"])]),
+            ("email_agent_cache_total", "Response cache lookups.",
+             lambda s: [(',result="hit"', s["cache_hits"]), (',result="miss"', s["cache_misses"])]),
+            ("email_agent_queue_wait_seconds_total", "Time spent waiting for the LLM rate limiter.",
+             lambda s: [("", s["queue_wait_ms"] / 1000)]),
+            ("email_agent_cost_usd_total", "Estimated LLM cost (integrations/model_routing.py prices).",
+             lambda s: [("", s["cost_usd"])]),
+        ]
+        for name, help_text, values in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for agent, s in snap.items():
+                for labels, value in values(s):
+                    lines.append(f'{name}{{agent="{agent}"{labels}}} {value}')
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# ===========================
+# Step context
+# ===========================
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("email_step_record", default=None)
+
+@contextmanager
+def step_metrics(agent: str, registry: MetricsRegistry = REGISTRY) -> Iterator[StepRecord]:
+    """Times one agent step and collects LLM usage reported while it runs."""
+    record = StepRecord(agent=agent)
+    token = _CURRENT.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as exc:
+        record.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        record.elapsed_ms = (time.perf_counter() - start) * 1000
+        _CURRENT.reset(token)
+        registry.observe(record)
+
+def current_step() -> Optional[StepRecord]:
+    return _CURRENT.get()
+
+def record_usage(message) -> None:
+    """Adds token usage from a LangChain AIMessage (usage_metadata) to the current step."""
+    record = _CURRENT.get()
+    if record is None:
+        return
+    record.llm_calls += 1
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = int(usage.get("input_tokens", 0) or 0)
+    completion_tokens = int(usage.get("output_tokens", 0) or 0)
+    record.prompt_tokens += prompt_tokens
+    record.completion_tokens += completion_tokens
+    model = (getattr(message, "response_metadata", None) or {}).get("model_name")
+    record.cost_usd += cost_usd(model, prompt_tokens, completion_tokens)
+
+def record_cache(hit: bool) -> None:
+    record = _CURRENT.get()
+    if record is None:
+        return
+    if hit:
+        record.cache_hits += 1
+    else:
+        record.cache_misses += 1
+
+def record_retry(n: int = 1) -> None:
+    record = _CURRENT.get()
+    if record is not None:
+        record.retries += n
+
+def record_queue_wait(seconds: float) -> None:
+    record = _CURRENT.get()
+    if record is not None:
+        record.queue_wait_ms += seconds * 1000
+
+def run_summary(flow) -> Dict[str, Any]:
+    """Totals over one run's flow entries."""
+    totals = {"elapsed_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0, "cache_hits": 0,
+              "queue_wait_ms": 0.0, "cost_usd": 0.0}
+    for entry in flow or []:
+        m = entry.get("metrics") or {}
+        for key in totals:
+            totals[key] += m.get(key, 0)
+    totals["elapsed_ms"] = round(totals["elapsed_ms"], 2)
+    totals["queue_wait_ms"] = round(totals["queue_wait_ms"], 2)
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    return totals
+
+# ===========================
+# Export
+# ===========================
+def write_prometheus(path: Path, registry: MetricsRegistry = REGISTRY) -> None:
+    """Writes the text exposition atomically (for node_exporter's textfile collector)."""
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(registry.prometheus_text(), encoding="utf-8")
+    tmp.replace(path)
+
+def write_snapshot(path: Path, registry: MetricsRegistry = REGISTRY) -> None:
+    Path(path).write_text(json.dumps(registry.snapshot(), indent=2), encoding="utf-8")
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> "ThreadingHTTPServer":
+    """Serves /metrics (Prometheus) and /metrics.json from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, ctype = registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
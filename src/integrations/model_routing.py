@@ -0,0 +1,173 @@
+# integrations/model_routing.py
+"""
+Per-agent model selection and the draft cascade.
+
+ModelRouter decides which model each agent uses, so classification and review
+can run on a cheaper model than drafting:
+
+    LLM_MODEL                 default model for every agent (gpt-4o-mini)
+    LLM_MODEL_<AGENT>         per agent, e.g. LLM_MODEL_DRAFT_WRITER=gpt-4o
+    LLM_MODELS                JSON, e.g. {"review": "gpt-4o-mini", "draft_writer": "gpt-4o"}
+    LLM_TEMPERATURE           sampling temperature for all agents (0.2)
+
+Agents: intent_detection, draft_writer, review, rewrite, fused_generation,
+touch_up.
+
+Cascade mode (LLM_CASCADE="fast,strong", e.g. "gpt-4o-mini,gpt-4o") drafts with
+the fast model first and redrafts with the strong one only when the review
+gate rejects the draft or its JSON could not be parsed (see
+cascade_escalation in workflow/langgraph_flow.py). Every run records whether
+it escalated and the latency / cost difference between the two drafts;
+CASCADE_STATS / cascade_stats() aggregate the escalation rate.
+
+MODEL_PRICES (USD per 1M input / output tokens, overridable with LLM_PRICES
+JSON) turns the token usage in integrations/metrics.py into cost_usd.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_MODEL = "gpt-4o-mini"
+AGENTS = ("intent_detection", "draft_writer", "review", "rewrite", "fused_generation", "touch_up")
+
+# USD per 1M tokens (input, output).
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+def _env_json(name: str) -> Dict[str, Any]:
+    try:
+        return json.loads(os.environ.get(name, "") or "{}")
+    except ValueError:
+        return {}
+
+def model_price(model: Optional[str]) -> Tuple[float, float]:
+    """Price of `model`, matching dated snapshots (gpt-4o-2024-08-06) by their longest known prefix."""
+    if not model:
+        return 0.0, 0.0
+    prices = {**MODEL_PRICES, **{k: tuple(v) for k, v in _env_json("LLM_PRICES").items()}}
+    for name in sorted(prices, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return prices[name]
+    return 0.0, 0.0
+
+def cost_usd(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = model_price(model)
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+# ===========================
+# Router
+# ===========================
+def _env_cascade() -> Optional[Tuple[str, str]]:
+    models = [m.strip() for m in os.environ.get("LLM_CASCADE", "").split(",") if m.strip()]
+    return (models[0], models[1]) if len(models) == 2 else None
+
+class ModelRouter:
+    def __init__(
+        self,
+        models: Optional[Dict[str, str]] = None,
+        default_model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        cascade: Optional[Tuple[str, str]] = None,
+    ):
+        self.default_model = default_model or os.environ.get("LLM_MODEL", DEFAULT_MODEL)
+        self.temperature = float(os.environ.get("LLM_TEMPERATURE", "0.2")) if temperature is None else temperature
+        env_models = {agent: os.environ[f"LLM_MODEL_{agent.upper()}"]
+                      for agent in AGENTS if os.environ.get(f"LLM_MODEL_{agent.upper()}")}
+        self.models = {**_env_json("LLM_MODELS"), **env_models, **(models or {})}
+        self.cascade = cascade if cascade is not None else _env_cascade()
+
+    def model_for(self, agent: str) -> str:
+        if self.cascade and agent == "draft_writer":
+            return self.cascade[0]
+        return self.models.get(agent, self.default_model)
+
+    def for_agent(self, agent: str):
+        """The chat model for `agent` (clients are cached by make_openai_llm)."""
+        from integrations.llm_client import make_openai_llm
+        return make_openai_llm(model=self.model_for(agent), temperature=self.temperature)
+
+    def strong_llm(self):
+        from integrations.llm_client import make_openai_llm
+        return make_openai_llm(model=self.cascade[1], temperature=self.temperature)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"models": {agent: self.model_for(agent) for agent in AGENTS}, "cascade": self.cascade}
+
+def llm_for(llm, agent: str):
+    """Resolves a ModelRouter to the agent's model; a plain chat model is used for every agent."""
+    return llm.for_agent(agent) if isinstance(llm, ModelRouter) else llm
+
+_ROUTER: Optional[ModelRouter] = None
+_LOCK = threading.Lock()
+
+def get_model_router() -> ModelRouter:
+    global _ROUTER
+    with _LOCK:
+        if _ROUTER is None:
+            _ROUTER = ModelRouter()
+        return _ROUTER
+
+# ===========================
+# Cascade bookkeeping
+# ===========================
+CASCADE_STATS = {"runs": 0, "escalated": 0, "gate_fail": 0, "json_fallback": 0,
+                 "extra_cost_usd": 0.0, "saved_cost_usd": 0.0, "extra_latency_ms": 0.0}
+
+def escalation_reason(state: Dict[str, Any]) -> Optional[str]:
+    """Why the fast draft should be redone with the strong model, or None to keep it."""
+    if state.get("draft_parse") == "fallback":
+        return "json_fallback"
+    gate = (state.get("review") or {}).get("gate") or {}
+    if gate.get("verdict") == "fail":
+        return "gate_fail"
+    return None
+
+def cascade_report(
+    router: ModelRouter,
+    reason: Optional[str],
+    fast: Dict[str, Any],
+    strong: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Per-run cascade record. `fast` / `strong` are the draft calls' metrics
+    (elapsed_ms, prompt_tokens, completion_tokens). Without an escalation,
+    saved_cost_usd is what the same draft would have cost on the strong model.
+    """
+    fast_model, strong_model = router.cascade
+    fast_cost = cost_usd(fast_model, fast.get("prompt_tokens", 0), fast.get("completion_tokens", 0))
+    report: Dict[str, Any] = {
+        "escalated": reason is not None,
+        "reason": reason,
+        "fast_model": fast_model,
+        "strong_model": strong_model,
+        "fast": {"latency_ms": round(fast.get("elapsed_ms", 0.0), 2), "cost_usd": round(fast_cost, 6)},
+    }
+    with _LOCK:
+        CASCADE_STATS["runs"] += 1
+        if strong is None:
+            saved = cost_usd(strong_model, fast.get("prompt_tokens", 0), fast.get("completion_tokens", 0)) - fast_cost
+            report["saved_cost_usd"] = round(saved, 6)
+            CASCADE_STATS["saved_cost_usd"] += saved
+            return report
+        strong_cost = cost_usd(strong_model, strong.get("prompt_tokens", 0), strong.get("completion_tokens", 0))
+        report["strong"] = {"latency_ms": round(strong.get("elapsed_ms", 0.0), 2), "cost_usd": round(strong_cost, 6)}
+        report["latency_diff_ms"] = round(strong.get("elapsed_ms", 0.0) - fast.get("elapsed_ms", 0.0), 2)
+        report["cost_diff_usd"] = round(strong_cost - fast_cost, 6)
+        CASCADE_STATS["escalated"] += 1
+        CASCADE_STATS[reason] = CASCADE_STATS.get(reason, 0) + 1
+        CASCADE_STATS["extra_cost_usd"] += strong_cost
+        CASCADE_STATS["extra_latency_ms"] += strong.get("elapsed_ms", 0.0)
+    return report
+
+def cascade_stats() -> Dict[str, Any]:
+    with _LOCK:
+        stats = dict(CASCADE_STATS)
+    stats["escalation_rate"] = stats["escalated"] / stats["runs"] if stats["runs"] else 0.0
+    return stats
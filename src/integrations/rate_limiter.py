@@ -0,0 +1,526 @@
+# integrations/rate_limiter.py
+"""
+Rate-limit-aware scheduling for every LLM call.
+
+All agent LLM calls go through get_rate_limiter() (see the LLM helpers in
+agents/agents.py). For each model it keeps a requests-per-minute and a
+tokens-per-minute bucket and admits calls one at a time in priority order:
+
+- Priority lanes: "interactive" (the Streamlit app) goes ahead of "default"
+  (the HTTP service, scripts), which goes ahead of "batch" (workflow.batch,
+  workflow.fanout). Select one with `with priority("batch"):`; the lane
+  follows the call into asyncio tasks and through run_sync.
+- Tokens are estimated before sending (prompt + expected completion) and
+  settled against the usage the API reports afterwards.
+- 429s, 5xx and connection errors are retried with full-jitter exponential
+  backoff, never sooner than the Retry-After / retry-after-ms header says. A
+  429 also pauses the model for every caller and halves its admitted rate,
+  which then recovers a little with each successful call.
+- Queue waits are reported per model and lane (snapshot(), prometheus_text())
+  and added to the current step's metrics (queue_wait_ms).
+
+Environment:
+    LLM_RATE_LIMIT              "0" disables admission control (retries still apply)
+    LLM_RPM / LLM_TPM           default limits per model (500 / 200000; 0 = unlimited)
+    LLM_LIMITS                  JSON per model, e.g. {"gpt-4o": {"rpm": 60, "tpm": 30000}}
+    LLM_MAX_RETRIES             retries per call (default 5)
+    LLM_BACKOFF_BASE            first backoff in seconds (default 0.5)
+    LLM_BACKOFF_MAX             backoff cap in seconds (default 30)
+    LLM_EXPECTED_OUTPUT_TOKENS  completion estimate if the model sets no max_tokens (default 400)
+
+Test it against integrations/fake_openai_server.py, which answers with 429s
+beyond its own RPM limit.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from integrations.metrics import QUANTILES, quantile, record_queue_wait, record_retry
+from memory.sent_index import estimate_tokens
+
+T = TypeVar("T")
+
+LANES = {"interactive": 0, "default": 1, "batch": 2}
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+                    "RemoteProtocolError"}
+# Lowest share of the configured rate the adaptive backoff goes down to.
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+# Waiters behind the head of the queue re-check at least this often.
+MAX_IDLE_WAIT = 1.0
+# Queue-wait samples kept per model and lane for percentiles.
+WAIT_SAMPLES = 1024
+
+_LANE: contextvars.ContextVar = contextvars.ContextVar("llm_priority_lane", default="default")
+
+@contextmanager
+def priority(lane: str) -> Iterator[None]:
+    """LLM calls made inside the block (and tasks started from it) use `lane`."""
+    if lane not in LANES:
+        raise ValueError(f"lane must be one of {tuple(LANES)}")
+    token = _LANE.set(lane)
+    try:
+        yield
+    finally:
+        _LANE.reset(token)
+
+def current_lane() -> str:
+    return _LANE.get()
+
+# ===========================
+# Retry classification
+# ===========================
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def is_retryable(exc: BaseException) -> bool:
+    # An exhausted quota is a 429 too, but waiting does not fix it.
+    if getattr(exc, "code", None) == "insufficient_quota":
+        return False
+    return _status(exc) in RETRY_STATUS or type(exc).__name__ in RETRY_EXCEPTIONS
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from the response's retry-after-ms / retry-after header, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    """Total tokens reported on an AIMessage (or a structured-output dict with "raw")."""
+    if isinstance(result, dict):
+        result = result.get("raw")
+    usage = getattr(result, "usage_metadata", None) or {}
+    total = usage.get("total_tokens") or (usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+    return int(total) if total else None
+
+# ===========================
+# Buckets and per-model queue
+# ===========================
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth; <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.unlimited = per_minute <= 0
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, factor: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, factor: float = 1.0) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill(now, factor)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / (self.rate * factor)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, used: float) -> None:
+        """Charges (or refunds, if negative) `used` units after the fact; the level may go into debt."""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level - used)
+
+@dataclass
+class _Waiter:
+    rank: int
+    seq: int
+    tokens: int
+    lane: str
+    wake: Callable[[], None]
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+@dataclass
+class ModelStats:
+    granted: int = 0
+    throttled: int = 0
+    retries: int = 0
+    failures: int = 0
+    tokens_estimated: int = 0
+    tokens_used: int = 0
+    waits: Dict[str, deque] = field(default_factory=dict)
+    wait_sum_s: Dict[str, float] = field(default_factory=dict)
+
+class ModelLimiter:
+    """Admission queue for one model: the best-ranked, oldest waiter goes first."""
+
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.stats = ModelStats()
+        self._heap: List[_Waiter] = []
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _enqueue(self, tokens: int, lane: str, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(LANES.get(lane, LANES["default"]), next(self._seq), tokens, lane, wake)
+        with self._lock:
+            heapq.heappush(self._heap, waiter)
+        return waiter
+
+    def _poll(self, waiter: _Waiter) -> Optional[float]:
+        """0 once admitted, else seconds to wait (None: until woken as the new head)."""
+        with self._lock:
+            if self._heap[0] is not waiter:
+                return None
+            now = time.monotonic()
+            delay = max(
+                self.paused_until - now,
+                self.requests.wait_time(1, now, self.factor),
+                self.tokens.wait_time(waiter.tokens, now, self.factor),
+            )
+            if delay > 0:
+                return delay
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            heapq.heappop(self._heap)
+            self.stats.granted += 1
+            self.stats.tokens_estimated += waiter.tokens
+            head = self._heap[0] if self._heap else None
+        if head is not None:
+            head.wake()
+        return 0.0
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter not in self._heap:
+                return
+            was_head = self._heap[0] is waiter
+            self._heap.remove(waiter)
+            heapq.heapify(self._heap)
+            head = self._heap[0] if was_head and self._heap else None
+        if head is not None:
+            head.wake()
+
+    def _wake_head(self) -> None:
+        with self._lock:
+            head = self._heap[0] if self._heap else None
+        if head is not None:
+            head.wake()
+
+    def _observe_wait(self, lane: str, seconds: float) -> None:
+        with self._lock:
+            self.stats.waits.setdefault(lane, deque(maxlen=WAIT_SAMPLES)).append(seconds)
+            self.stats.wait_sum_s[lane] = self.stats.wait_sum_s.get(lane, 0.0) + seconds
+        record_queue_wait(seconds)
+
+    def acquire(self, tokens: int, lane: str) -> float:
+        """Blocks until the call may be sent; returns the time spent queued."""
+        event = threading.Event()
+        waiter = self._enqueue(tokens, lane, event.set)
+        start = time.monotonic()
+        try:
+            while True:
+                delay = self._poll(waiter)
+                if delay == 0:
+                    break
+                event.wait(MAX_IDLE_WAIT if delay is None else min(delay, MAX_IDLE_WAIT))
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        waited = time.monotonic() - start
+        self._observe_wait(lane, waited)
+        return waited
+
+    async def aacquire(self, tokens: int, lane: str) -> float:
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake() -> None:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+        waiter = self._enqueue(tokens, lane, wake)
+        start = time.monotonic()
+        try:
+            while True:
+                delay = self._poll(waiter)
+                if delay == 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), MAX_IDLE_WAIT if delay is None else min(delay, MAX_IDLE_WAIT))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        waited = time.monotonic() - start
+        self._observe_wait(lane, waited)
+        return waited
+
+    def settle(self, estimated: int, used: Optional[int]) -> None:
+        if used is None:
+            return
+        with self._lock:
+            self.tokens.adjust(used - estimated)
+            self.stats.tokens_used += used
+
+    def on_throttled(self, pause_s: float) -> None:
+        with self._lock:
+            self.stats.throttled += 1
+            self.factor = max(MIN_RATE_FACTOR, self.factor * 0.5)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause_s)
+        self._wake_head()
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.factor = min(1.0, self.factor + RATE_RECOVERY_STEP)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            s = self.stats
+            waits = {}
+            for lane, samples in s.waits.items():
+                values = sorted(samples)
+                waits[lane] = {
+                    "count": len(values),
+                    "sum_ms": round(s.wait_sum_s.get(lane, 0.0) * 1000, 2),
+                    **{f"p{int(q * 100)}_ms": round(quantile(values, q) * 1000, 2) for q in QUANTILES},
+                }
+            return {
+                "queued": len(self._heap),
+                "granted": s.granted,
+                "throttled": s.throttled,
+                "retries": s.retries,
+                "failures": s.failures,
+                "rate_factor": round(self.factor, 3),
+                "tokens_estimated": s.tokens_estimated,
+                "tokens_used": s.tokens_used,
+                "queue_wait": waits,
+            }
+
+# ===========================
+# Scheduler
+# ===========================
+def _env_limits() -> Dict[str, Dict[str, float]]:
+    try:
+        return json.loads(os.environ.get("LLM_LIMITS", "") or "{}")
+    except ValueError:
+        return {}
+
+class RateLimiter:
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        env = os.environ.get
+        self.enabled = env("LLM_RATE_LIMIT", "1") != "0" if enabled is None else enabled
+        self.rpm = float(env("LLM_RPM", "500")) if rpm is None else rpm
+        self.tpm = float(env("LLM_TPM", "200000")) if tpm is None else tpm
+        self.limits = _env_limits() if limits is None else limits
+        self.max_retries = int(env("LLM_MAX_RETRIES", "5")) if max_retries is None else max_retries
+        self.backoff_base = float(env("LLM_BACKOFF_BASE", "0.5")) if backoff_base is None else backoff_base
+        self.backoff_max = float(env("LLM_BACKOFF_MAX", "30")) if backoff_max is None else backoff_max
+        self.expected_output = int(env("LLM_EXPECTED_OUTPUT_TOKENS", "400"))
+        self._random = random.Random(seed)
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> ModelLimiter:
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                conf = self.limits.get(model, {})
+                limiter = self._models[model] = ModelLimiter(
+                    model, float(conf.get("rpm", self.rpm)), float(conf.get("tpm", self.tpm)))
+            return limiter
+
+    def estimate(self, prompt_text: str, llm=None) -> int:
+        """Tokens to reserve: the prompt plus the completion the model may produce."""
+        max_tokens = getattr(llm, "max_tokens", None) or self.expected_output
+        return estimate_tokens(prompt_text) + int(max_tokens)
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """Full jitter, but never sooner than the server's Retry-After."""
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(exc) or 0.0)
+
+    def _retry_delay(self, limiter: ModelLimiter, attempt: int, exc: BaseException) -> Optional[float]:
+        """Seconds before the next attempt, or None if the error should propagate."""
+        if not is_retryable(exc) or attempt >= self.max_retries:
+            with limiter._lock:
+                limiter.stats.failures += 1
+            return None
+        delay = self.backoff(attempt, exc)
+        if _status(exc) == 429:
+            limiter.on_throttled(delay)
+        with limiter._lock:
+            limiter.stats.retries += 1
+        record_retry()
+        return delay
+
+    def call(self, model: str, tokens: int, fn: Callable[[], T]) -> T:
+        limiter = self.for_model(model)
+        for attempt in itertools.count():
+            if self.enabled:
+                limiter.acquire(tokens, current_lane())
+            try:
+                result = fn()
+            except Exception as exc:
+                delay = self._retry_delay(limiter, attempt, exc)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            limiter.on_success()
+            limiter.settle(tokens, _usage_tokens(result))
+            return result
+
+    async def acall(self, model: str, tokens: int, fn: Callable[[], Awaitable[T]]) -> T:
+        limiter = self.for_model(model)
+        for attempt in itertools.count():
+            if self.enabled:
+                await limiter.aacquire(tokens, current_lane())
+            try:
+                result = await fn()
+            except Exception as exc:
+                delay = self._retry_delay(limiter, attempt, exc)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            limiter.on_success()
+            limiter.settle(tokens, _usage_tokens(result))
+            return result
+
+    def stream(self, model: str, tokens: int, open_stream: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Retries only until the first chunk arrives; later errors would duplicate streamed text."""
+        limiter = self.for_model(model)
+        for attempt in itertools.count():
+            if self.enabled:
+                limiter.acquire(tokens, current_lane())
+            chunks = iter(open_stream())
+            try:
+                first = next(chunks)
+            except StopIteration:
+                return
+            except Exception as exc:
+                delay = self._retry_delay(limiter, attempt, exc)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            limiter.on_success()
+            yield first
+            yield from chunks
+            return
+
+    async def astream(self, model: str, tokens: int, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        limiter = self.for_model(model)
+        for attempt in itertools.count():
+            if self.enabled:
+                await limiter.aacquire(tokens, current_lane())
+            chunks = open_stream().__aiter__()
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as exc:
+                delay = self._retry_delay(limiter, attempt, exc)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            limiter.on_success()
+            yield first
+            async for chunk in chunks:
+                yield chunk
+            return
+
+    def settle(self, model: str, estimated: int, message: Any) -> None:
+        """Settles a streamed call once its final usage is known."""
+        self.for_model(model).settle(estimated, _usage_tokens(message))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            models = dict(self._models)
+        return {"enabled": self.enabled, "models": {name: m.snapshot() for name, m in models.items()}}
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()["models"]
+        lines = [
+            "# HELP email_llm_queue_wait_seconds Time LLM calls waited for the rate limiter.",
+            "# TYPE email_llm_queue_wait_seconds summary",
+        ]
+        for model, s in snap.items():
+            for lane, w in s["queue_wait"].items():
+                labels = f'model="{model}",lane="{lane}"'
+                for q in QUANTILES:
+                    lines.append(f'email_llm_queue_wait_seconds{{{labels},quantile="{q}"}} '
+                                 f'{w[f"p{int(q * 100)}_ms"] / 1000:.6f}')
+                lines.append(f"email_llm_queue_wait_seconds_sum{{{labels}}} {w['sum_ms'] / 1000:.6f}")
+                lines.append(f"email_llm_queue_wait_seconds_count{{{labels}}} {w['count']}")
+        for name, key, kind in (("email_llm_queued", "queued", "gauge"),
+                                ("email_llm_rate_factor", "rate_factor", "gauge"),
+                                ("email_llm_throttled_total", "throttled", "counter"),
+                                ("email_llm_retries_total", "retries", "counter"),
+                                ("email_llm_failures_total", "failures", "counter")):
+            lines.append(f"# TYPE {name} {kind}")
+            for model, s in snap.items():
+                lines.append(f'{name}{{model="{model}"}} {s[key]}')
+        return "\n".join(lines) + "\n"
+
+_LIMITER: Optional[RateLimiter] = None
+_LIMITER_LOCK = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = RateLimiter()
+        return _LIMITER
+
+def reset_rate_limiter(limiter: Optional[RateLimiter] = None) -> RateLimiter:
+    """Replaces the process-wide limiter (e.g. after changing the LLM_* settings)."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        _LIMITER = limiter or RateLimiter()
+        return _LIMITER
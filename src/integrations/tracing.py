@@ -0,0 +1,403 @@
+# integrations/tracing.py
+"""
+Sampled agent tracing with a local, batched exporter.
+
+@traced(run_type=...) replaces LangSmith's @traceable on the agents. A span
+is only recorded when its request is sampled and its agent passes its own
+sample rate; everything else calls the agent directly. Sampled spans go to:
+
+- "local":      a rotating JSONL file. The request thread only appends a dict
+                to an in-memory buffer; a background thread serializes and
+                writes it in batches. Works offline.
+- "langsmith":  LangSmith, through the original @traceable (imported lazily).
+- "both", or "off" (no tracing overhead beyond one config lookup).
+
+A request is a trace_request() block (arun_email_workflow, fan-out and tone
+variants open one); its spans share a trace_id and nest under a root span. An
+agent called outside any request is a request of its own.
+
+Environment:
+    TRACE_EXPORTER          off | local | langsmith | both (default: langsmith
+                            when LANGSMITH_TRACING / LANGCHAIN_TRACING_V2 is
+                            set, otherwise off)
+    TRACE_SAMPLE_RATE       share of requests traced (1.0)
+    TRACE_SAMPLE_RATES      JSON per-agent rates, e.g. {"input_parser_agent": 0.1}
+    TRACE_PATH              JSONL file (default <repo>/.cache/traces/spans.jsonl)
+    TRACE_MAX_BYTES         rotate after this size (10 MB), keeping TRACE_BACKUPS (5) files
+    TRACE_BATCH_SIZE        spans that trigger an early flush (256)
+    TRACE_FLUSH_INTERVAL    seconds between background flushes (1.0)
+    TRACE_BUFFER_MAX        spans buffered before new ones are dropped (10000)
+
+TRACE_STATS / tracing_stats() count recorded, sampled-out, exported and
+dropped spans plus the time spent writing batches; benchmarks/bench_tracing.py
+measures the per-call and per-run overhead.
+
+Usage (from src/):
+    TRACE_EXPORTER=local python -m workflow.batch prompts.jsonl
+    python -m integrations.tracing --tail 20
+"""
+import argparse
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from integrations.metrics import current_step
+
+DEFAULT_TRACE_PATH = Path(__file__).parent.parent.parent / ".cache" / "traces" / "spans.jsonl"
+EXPORTERS = ("off", "local", "langsmith", "both")
+RUN_TYPES = ("llm", "chain", "tool", "parser", "retriever", "embedding", "prompt")
+
+TRACE_STATS = {"spans": 0, "sampled_out": 0, "exported": 0, "dropped": 0, "batches": 0, "export_ms": 0.0}
+# Updated from request threads, the pipeline loop and the exporter thread.
+_STATS_LOCK = threading.Lock()
+
+def _count(**deltas: float) -> None:
+    with _STATS_LOCK:
+        for name, value in deltas.items():
+            TRACE_STATS[name] += value
+
+def _truthy_env(*names: str) -> bool:
+    return any(os.environ.get(name, "").lower() in ("1", "true", "yes") for name in names)
+
+# ===========================
+# Configuration
+# ===========================
+class TracingConfig:
+    def __init__(
+        self,
+        exporter: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        agent_rates: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = None,
+    ):
+        if exporter is None:
+            default = "langsmith" if _truthy_env("LANGSMITH_TRACING", "LANGCHAIN_TRACING_V2") else "off"
+            exporter = os.environ.get("TRACE_EXPORTER", default).lower()
+        if exporter not in EXPORTERS:
+            raise ValueError(f"TRACE_EXPORTER must be one of {EXPORTERS}")
+        self.exporter = exporter
+        self.enabled = exporter != "off"
+        self.local = exporter in ("local", "both")
+        self.langsmith = exporter in ("langsmith", "both")
+        self.sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0")) if sample_rate is None else sample_rate
+        if agent_rates is None:
+            try:
+                agent_rates = json.loads(os.environ.get("TRACE_SAMPLE_RATES", "") or "{}")
+            except ValueError:
+                agent_rates = {}
+        self.agent_rates = {name: float(rate) for name, rate in agent_rates.items()}
+        self._rng = random.Random(seed)
+
+    def sample_request(self) -> bool:
+        return self.sample_rate >= 1.0 or self._rng.random() < self.sample_rate
+
+    def sample_agent(self, name: str) -> bool:
+        rate = self.agent_rates.get(name, 1.0)
+        return rate >= 1.0 or self._rng.random() < rate
+
+_CONFIG: Optional[TracingConfig] = None
+_LOCK = threading.Lock()
+
+def get_tracing_config() -> TracingConfig:
+    global _CONFIG
+    if _CONFIG is None:
+        with _LOCK:
+            if _CONFIG is None:
+                _CONFIG = TracingConfig()
+    return _CONFIG
+
+def reset_tracing(config: Optional[TracingConfig] = None) -> TracingConfig:
+    """Replaces the process-wide config (e.g. after changing the TRACE_* settings); buffered spans are flushed."""
+    global _CONFIG, _EXPORTER
+    with _LOCK:
+        exporter, _EXPORTER = _EXPORTER, None
+        _CONFIG = config or TracingConfig()
+    if exporter is not None:
+        exporter.close()
+    return _CONFIG
+
+# ===========================
+# Local exporter
+# ===========================
+class LocalSpanExporter:
+    """Buffers spans in memory and appends them to a rotating JSONL file from a background thread."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        max_bytes: Optional[int] = None,
+        backups: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_buffer: Optional[int] = None,
+    ):
+        self.path = Path(path or os.environ.get("TRACE_PATH", str(DEFAULT_TRACE_PATH)))
+        self.max_bytes = max_bytes or int(os.environ.get("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.backups = int(os.environ.get("TRACE_BACKUPS", "5")) if backups is None else backups
+        self.batch_size = batch_size or int(os.environ.get("TRACE_BATCH_SIZE", "256"))
+        self.flush_interval = flush_interval or float(os.environ.get("TRACE_FLUSH_INTERVAL", "1.0"))
+        self.max_buffer = max_buffer or int(os.environ.get("TRACE_BUFFER_MAX", "10000"))
+        self._buffer: deque = deque()
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._size: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Dict[str, Any]) -> None:
+        """Called on the request thread: an append, nothing else."""
+        if len(self._buffer) >= self.max_buffer:
+            _count(dropped=1)
+            return
+        self._buffer.append(span)
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes everything buffered so far as one batch; returns the number of spans written."""
+        with self._write_lock:
+            batch: List[Dict[str, Any]] = []
+            while self._buffer:
+                batch.append(self._buffer.popleft())
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            data = "".join(json.dumps(span, default=str, ensure_ascii=False) + "\n" for span in batch).encode("utf-8")
+            self._rotate_if_needed(len(data))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(data)
+            self._size = (self._size or 0) + len(data)
+            _count(exported=len(batch), batches=1, export_ms=(time.perf_counter() - started) * 1000)
+            return len(batch)
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        if self._size is None:
+            self._size = self.path.stat().st_size if self.path.exists() else 0
+        if not self._size or self._size + incoming <= self.max_bytes:
+            return
+        if self.backups <= 0:
+            self.path.unlink()
+        else:
+            for i in range(self.backups - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{i}")
+                if older.exists():
+                    older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        self._size = 0
+
+    def close(self) -> None:
+        if not self._closed.is_set():
+            self._closed.set()
+            self._wake.set()
+            self._thread.join(timeout=5)
+        self.flush()
+
+_EXPORTER: Optional[LocalSpanExporter] = None
+
+def get_exporter() -> LocalSpanExporter:
+    global _EXPORTER
+    if _EXPORTER is None:
+        with _LOCK:
+            if _EXPORTER is None:
+                _EXPORTER = LocalSpanExporter()
+    return _EXPORTER
+
+def flush_traces() -> int:
+    return _EXPORTER.flush() if _EXPORTER is not None else 0
+
+def tracing_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        stats = dict(TRACE_STATS)
+    stats["exporter"] = get_tracing_config().exporter
+    stats["buffered"] = len(_EXPORTER._buffer) if _EXPORTER is not None else 0
+    return stats
+
+# ===========================
+# Spans
+# ===========================
+# (trace_id, sampled, current span id) of the request being traced.
+_CURRENT: contextvars.ContextVar[Optional[Tuple[str, bool, Optional[str]]]] = contextvars.ContextVar(
+    "trace_current", default=None
+)
+
+def _new_id() -> str:
+    return os.urandom(8).hex()
+
+class _Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "run_type", "started", "t0", "tokens", "token")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, run_type: str):
+        self.trace_id, self.parent_id, self.name, self.run_type = trace_id, parent_id, name, run_type
+        self.span_id = _new_id()
+        self.started = time.time()
+        record = current_step() if run_type == "llm" else None
+        self.tokens = (record, record.prompt_tokens, record.completion_tokens) if record else None
+        self.token = _CURRENT.set((trace_id, True, self.span_id))
+        self.t0 = time.perf_counter()
+
+def _open(name: str, run_type: str) -> Optional[_Span]:
+    """A started span, or None when tracing is off or this call is not sampled."""
+    config = get_tracing_config()
+    if not config.enabled:
+        return None
+    current = _CURRENT.get()
+    if current is None:
+        trace_id, sampled, parent_id = None, config.sample_request(), None
+    else:
+        trace_id, sampled, parent_id = current
+    if not sampled or not config.sample_agent(name):
+        with _STATS_LOCK:
+            TRACE_STATS["sampled_out"] += 1
+        return None
+    return _Span(trace_id or _new_id(), parent_id, name, run_type)
+
+def _close(span: _Span, result: Any = None, error: Optional[BaseException] = None) -> None:
+    elapsed_ms = (time.perf_counter() - span.t0) * 1000
+    _CURRENT.reset(span.token)
+    with _STATS_LOCK:
+        TRACE_STATS["spans"] += 1
+    config = get_tracing_config()
+    if not config.local:
+        return
+    record: Dict[str, Any] = {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "run_type": span.run_type,
+        "start": span.started,
+        "duration_ms": round(elapsed_ms, 3),
+    }
+    if span.tokens:
+        step, prompt_tokens, completion_tokens = span.tokens
+        record["prompt_tokens"] = step.prompt_tokens - prompt_tokens
+        record["completion_tokens"] = step.completion_tokens - completion_tokens
+    if isinstance(result, dict):
+        record["output_keys"] = list(result)
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"
+    get_exporter().export(record)
+
+def traced(run_type: str = "chain", name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator for sync and async agents; see the module docstring for sampling and export."""
+    if run_type not in RUN_TYPES:
+        raise ValueError(f"run_type must be one of {RUN_TYPES}")
+
+    def decorate(fn: Callable) -> Callable:
+        span_name = name or fn.__name__
+        langsmith_fn: List[Callable] = []
+
+        def target() -> Callable:
+            if not get_tracing_config().langsmith:
+                return fn
+            if not langsmith_fn:
+                from langsmith import traceable
+                langsmith_fn.append(traceable(run_type=run_type, name=span_name)(fn))
+            return langsmith_fn[0]
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                span = _open(span_name, run_type)
+                if span is None:
+                    return await fn(*args, **kwargs)
+                try:
+                    result = await target()(*args, **kwargs)
+                except BaseException as exc:
+                    _close(span, error=exc)
+                    raise
+                _close(span, result)
+                return result
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            span = _open(span_name, run_type)
+            if span is None:
+                return fn(*args, **kwargs)
+            try:
+                result = target()(*args, **kwargs)
+            except BaseException as exc:
+                _close(span, error=exc)
+                raise
+            _close(span, result)
+            return result
+        return wrapper
+
+    return decorate
+
+@contextmanager
+def trace_request(name: str, sampled: Optional[bool] = None) -> Iterator[Optional[str]]:
+    """
+    Opens a request: one sampling decision (TRACE_SAMPLE_RATE unless `sampled`
+    is given) and a root span for everything traced inside. Yields the trace
+    id, or None when the request is not traced. Nested requests join the outer one.
+    """
+    config = get_tracing_config()
+    current = _CURRENT.get()
+    if not config.enabled or current is not None:
+        yield current[0] if current and current[1] else None
+        return
+    trace_id = _new_id()
+    if not (config.sample_request() if sampled is None else sampled):
+        with _STATS_LOCK:
+            TRACE_STATS["sampled_out"] += 1
+        token = _CURRENT.set((trace_id, False, None))
+        try:
+            yield None
+        finally:
+            _CURRENT.reset(token)
+        return
+    span = _Span(trace_id, None, name, "chain")
+    try:
+        yield trace_id
+    except BaseException as exc:
+        _close(span, error=exc)
+        raise
+    _close(span)
+
+# ===========================
+# CLI
+# ===========================
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize locally exported trace spans.")
+    parser.add_argument("--path", default=os.environ.get("TRACE_PATH", str(DEFAULT_TRACE_PATH)))
+    parser.add_argument("--tail", type=int, default=0, help="also print the last N spans")
+    args = parser.parse_args(argv)
+
+    spans = []
+    with open(args.path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                spans.append(json.loads(line))
+    by_name: Dict[str, List[float]] = {}
+    for span in spans:
+        by_name.setdefault(f"{span['name']} ({span['run_type']})", []).append(span["duration_ms"])
+    print(f"{len(spans)} spans in {len({s['trace_id'] for s in spans})} traces ({args.path})")
+    for label, durations in sorted(by_name.items()):
+        durations.sort()
+        print(f"  {label:<45} n={len(durations):<6} p50 {durations[len(durations) // 2]:>9.2f} ms")
+    for span in spans[-args.tail:] if args.tail else []:
+        print(json.dumps(span))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# integrations/transcription.py
+"""
+Voice-input transcription with a content-addressed cache.
+
+- Transcripts are cached by the SHA-256 of the audio bytes (plus backend, model
+  and language), in memory and in SQLite, so Streamlit reruns and repeated
+  uploads of the same recording never hit the API again.
+- Audio is handled as bytes end to end; no temporary files.
+- Recordings longer than TRANSCRIBE_CHUNK_SECONDS are split into overlapping
+  WAV chunks that are transcribed in parallel and stitched back together. The
+  length is read from the WAV or MP4/M4A header without decoding; other
+  formats are decoded to find it.
+- Backends are pluggable: "openai" (default, gpt-4o-transcribe) or "whisper"
+  (local openai-whisper model, works offline). register_backend() adds more.
+
+Environment:
+    TRANSCRIPTION_BACKEND       openai | whisper (default openai)
+    TRANSCRIPTION_MODEL         backend model (gpt-4o-transcribe / base)
+    TRANSCRIPT_CACHE_PATH       SQLite file (default <repo>/.cache/transcripts.sqlite3)
+    TRANSCRIBE_CHUNK_SECONDS    chunk length for long recordings (default 120)
+    TRANSCRIBE_WORKERS          parallel chunk requests (default 4)
+
+Decoding compressed formats (m4a, mp3, mp4) for chunking or for the whisper
+backend needs the ffmpeg binary; WAV is read with the standard library.
+
+Usage (from src/):
+    python -m integrations.transcription example_voice_intents/*.m4a --backend whisper
+    python -m integrations.transcription long_recording.wav --chunk-seconds 30 --no-cache
+"""
+import argparse
+import array
+import hashlib
+import io
+import os
+import struct
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from integrations.llm_cache import LLMCache
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / ".cache" / "transcripts.sqlite3"
+SAMPLE_RATE = 16000
+# Overlap between chunks so words cut at a boundary appear whole in one of them.
+CHUNK_OVERLAP_SECONDS = 1.5
+# Top-level MP4 boxes, for reading the duration of m4a/mp4 uploads.
+_MP4_CONTAINERS = {b"moov"}
+
+def audio_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_seconds() -> float:
+    return float(os.environ.get("TRANSCRIBE_CHUNK_SECONDS", "120"))
+
+def max_workers() -> int:
+    return int(os.environ.get("TRANSCRIBE_WORKERS", "4"))
+
+# ===========================
+# Audio decoding / chunking
+# ===========================
+def _is_wav(data: bytes) -> bool:
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+def _mp4_boxes(data: bytes, start: int, end: int):
+    """(type, payload start, payload end) of the boxes between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+def _mp4_duration(data: bytes) -> Optional[float]:
+    for kind, start, end in _mp4_boxes(data, 0, len(data)):
+        if kind not in _MP4_CONTAINERS:
+            continue
+        for child, body, body_end in _mp4_boxes(data, start, end):
+            if child != b"mvhd" or body_end - body < 20:
+                continue
+            if data[body] == 1:
+                if body_end - body < 32:
+                    return None
+                timescale, duration = struct.unpack(">IQ", data[body + 20:body + 32])
+            else:
+                timescale, duration = struct.unpack(">II", data[body + 12:body + 20])
+            return duration / timescale if timescale else None
+    return None
+
+def probe_duration(data: bytes) -> Optional[float]:
+    """Length in seconds from the WAV or MP4/M4A header, or None for other formats."""
+    if _is_wav(data):
+        try:
+            with wave.open(io.BytesIO(data), "rb") as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        except (wave.Error, EOFError, ZeroDivisionError):
+            return None
+    if data[4:8] == b"ftyp":
+        try:
+            return _mp4_duration(data)
+        except struct.error:
+            return None
+    return None
+
+def decode_pcm(data: bytes) -> Tuple[bytes, int]:
+    """(mono 16-bit little-endian PCM, sample rate). WAV via `wave`, anything else via ffmpeg."""
+    if _is_wav(data):
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            if wav.getsampwidth() == 2:
+                frames = wav.readframes(wav.getnframes())
+                channels = wav.getnchannels()
+                if channels > 1:
+                    # Keep the first channel; voice memos carry the same speech on both.
+                    frames = array.array("h", frames)[::channels].tobytes()
+                return frames, wav.getframerate()
+    proc = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        input=data, capture_output=True, check=True,
+    )
+    return proc.stdout, SAMPLE_RATE
+
+def encode_wav(pcm: bytes, rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+def split_pcm(pcm: bytes, rate: int, seconds: float, overlap: float = CHUNK_OVERLAP_SECONDS) -> List[bytes]:
+    """WAV chunks of `seconds` each, overlapping by `overlap` seconds."""
+    size, step = int(seconds * rate) * 2, int(max(seconds - overlap, 1.0) * rate) * 2
+    chunks = []
+    for start in range(0, len(pcm), step):
+        chunks.append(encode_wav(pcm[start:start + size], rate))
+        if start + size >= len(pcm):
+            break
+    return chunks
+
+def stitch(texts: List[str], max_overlap_words: int = 12) -> str:
+    """Joins chunk transcripts, dropping words repeated across the chunk overlap."""
+    words: List[str] = []
+    for text in texts:
+        nxt = text.split()
+        if not nxt:
+            continue
+        drop = 0
+        for n in range(min(max_overlap_words, len(words), len(nxt)), 0, -1):
+            tail = [w.lower().strip(".,!?;:") for w in words[-n:]]
+            head = [w.lower().strip(".,!?;:") for w in nxt[:n]]
+            if tail == head:
+                drop = n
+                break
+        words.extend(nxt[drop:])
+    return " ".join(words)
+
+# ===========================
+# Backends
+# ===========================
+class TranscriptionBackend:
+    name = "base"
+    model = ""
+
+    def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+class OpenAIBackend(TranscriptionBackend):
+    name = "openai"
+
+    def __init__(self, model: str = "gpt-4o-transcribe"):
+        self.model = model
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import openai
+            from integrations.llm_client import get_http_client
+            self._client = openai.OpenAI(http_client=get_http_client())
+        return self._client
+
+    def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> str:
+        kwargs = {"language": language} if language else {}
+        # (filename, bytes) uploads from memory; the name tells the API the format.
+        transcript = self._get_client().audio.transcriptions.create(
+            file=(filename, audio), model=self.model, **kwargs
+        )
+        return getattr(transcript, "text", "") or ""
+
+class WhisperBackend(TranscriptionBackend):
+    """Local openai-whisper model; no network access after the model download."""
+    name = "whisper"
+
+    def __init__(self, model: str = "base"):
+        self.model = model
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import whisper
+                self._model = whisper.load_model(self.model)
+            return self._model
+
+    def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> str:
+        import numpy as np
+
+        pcm, rate = decode_pcm(audio)
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if rate != SAMPLE_RATE:
+            target = np.linspace(0, len(samples) - 1, int(len(samples) * SAMPLE_RATE / rate))
+            samples = np.interp(target, np.arange(len(samples)), samples).astype(np.float32)
+        model = self._load()
+        # The PyTorch model is not safe to run from several threads at once.
+        with self._lock:
+            result = model.transcribe(samples, language=language, fp16=False)
+        return (result.get("text") or "").strip()
+
+BACKENDS: Dict[str, Callable[..., TranscriptionBackend]] = {
+    "openai": OpenAIBackend,
+    "whisper": WhisperBackend,
+}
+_INSTANCES: Dict[Tuple[str, str], TranscriptionBackend] = {}
+_LOCK = threading.Lock()
+
+def register_backend(name: str, factory: Callable[..., TranscriptionBackend]) -> None:
+    BACKENDS[name] = factory
+
+def get_backend(name: Optional[str] = None, model: Optional[str] = None) -> TranscriptionBackend:
+    name = name or os.environ.get("TRANSCRIPTION_BACKEND", "openai")
+    model = model or os.environ.get("TRANSCRIPTION_MODEL") or ""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}; choose from {sorted(BACKENDS)}")
+    with _LOCK:
+        backend = _INSTANCES.get((name, model))
+        if backend is None:
+            backend = BACKENDS[name](model) if model else BACKENDS[name]()
+            _INSTANCES[(name, model)] = backend
+        return backend
+
+# ===========================
+# Cache + entry point
+# ===========================
+_CACHE: Optional[LLMCache] = None
+
+def get_transcript_cache() -> LLMCache:
+    global _CACHE
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = LLMCache(
+                path=Path(os.environ.get("TRANSCRIPT_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+                ttl_seconds=30 * 24 * 3600,
+                max_memory_items=64,
+                max_disk_items=5000,
+            )
+        return _CACHE
+
+def transcribe_audio(
+    data: bytes,
+    filename: str = "audio.wav",
+    language: Optional[str] = "en",
+    backend: Optional[TranscriptionBackend] = None,
+    use_cache: bool = True,
+) -> str:
+    """Transcript of `data`, from cache when this exact audio was seen before."""
+    backend = backend or get_backend()
+    key = f"{backend.name}:{backend.model}:{language or ''}:{audio_hash(data)}"
+    cache = get_transcript_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(key, "transcription")
+        if cached is not None:
+            return cached
+
+    text = _transcribe_chunked(data, filename, language, backend)
+    if cache is not None:
+        cache.set(key, text)
+    return text
+
+def _transcribe_chunked(data: bytes, filename: str, language: Optional[str], backend: TranscriptionBackend) -> str:
+    seconds = chunk_seconds()
+    chunks: List[bytes] = []
+    duration = probe_duration(data)
+    # Short recordings (by their header) go out whole; unknown formats are decoded to measure them.
+    if duration is None or duration > seconds * 1.25:
+        try:
+            pcm, rate = decode_pcm(data)
+        except (OSError, subprocess.CalledProcessError):
+            pcm, rate = b"", 0  # no ffmpeg / undecodable: send the recording whole
+        if rate and len(pcm) / 2 > seconds * rate * 1.25:
+            chunks = split_pcm(pcm, rate, seconds)
+    if len(chunks) <= 1:
+        return backend.transcribe(data, filename, language)
+
+    stem = Path(filename).stem
+    with ThreadPoolExecutor(max_workers=min(max_workers(), len(chunks))) as pool:
+        texts = list(pool.map(
+            lambda item: backend.transcribe(item[1], f"{stem}-{item[0]}.wav", language),
+            enumerate(chunks),
+        ))
+    return stitch(texts)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Transcribe audio files (cached by content hash).")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--chunk-seconds", type=float, default=None)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.chunk_seconds:
+        os.environ["TRANSCRIBE_CHUNK_SECONDS"] = str(args.chunk_seconds)
+    backend = get_backend(args.backend, args.model)
+    for name in args.files:
+        data = Path(name).read_bytes()
+        start = time.perf_counter()
+        text = transcribe_audio(data, Path(name).name, args.language, backend, use_cache=not args.no_cache)
+        print(f"{name} ({len(data) / 1e6:.1f} MB, {time.perf_counter() - start:.2f}s):\n  {text}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+github_sync.py
+
+Background write-behind sync of user profiles to GitHub.
+
+Upserts only mark the store dirty; a worker thread takes one snapshot and
+commits it when either `interval` seconds have passed since the first
+unsynced change or `max_changes` changes have piled up, so a burst of
+upserts becomes a single commit. Failed pushes are retried with exponential
+backoff and jitter, and pending changes are flushed on shutdown.
+
+LocalRepoTarget is a stand-in for PyGithub that writes into a local
+directory, for tests and offline runs.
+"""
+import atexit
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# ===========================
+# Sync targets
+# ===========================
+class SyncTarget:
+    def push(self, content: str, message: str) -> None:
+        raise NotImplementedError
+
+class GithubTarget(SyncTarget):
+    """
+    Commits the file through the GitHub contents API (PyGithub). Nothing
+    touches the network until the first push, which runs on the sync worker;
+    a failed repo lookup is retried there like any other failed push.
+    """
+
+    def __init__(self, token: str, repo_name: str, path_in_repo: str):
+        self.token = token
+        self.repo_name = repo_name
+        self.path_in_repo = path_in_repo
+        self.repo = None
+        self._sha: Optional[str] = None
+
+    def _get_repo(self):
+        if self.repo is None:
+            try:
+                from github import Github
+            except ImportError:
+                raise ImportError(
+                    "PyGithub is required for GitHub sync. Install via: pip install PyGithub"
+                )
+            self.repo = Github(self.token).get_repo(self.repo_name)
+        return self.repo
+
+    def push(self, content: str, message: str) -> None:
+        self._get_repo()
+        if self._sha is None:
+            try:
+                self._sha = self.repo.get_contents(self.path_in_repo).sha
+            except Exception:
+                result = self.repo.create_file(path=self.path_in_repo, message=message, content=content)
+                self._sha = result["content"].sha
+                return
+        try:
+            result = self.repo.update_file(path=self.path_in_repo, message=message, content=content, sha=self._sha)
+        except Exception:
+            # Stale sha (someone else committed); refetch on the retry.
+            self._sha = None
+            raise
+        self._sha = result["content"].sha
+
+class LocalRepoTarget(SyncTarget):
+    """Writes the file into a local directory and records each commit."""
+
+    def __init__(self, root: Path, path_in_repo: str, fail_times: int = 0):
+        self.root = Path(root)
+        self.path_in_repo = path_in_repo
+        self.commits: List[Dict[str, Any]] = []
+        self.fail_times = fail_times
+
+    def push(self, content: str, message: str) -> None:
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("simulated push failure")
+        target = self.root / self.path_in_repo
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content, encoding="utf-8")
+        self.commits.append({"message": message, "at": time.time(), "bytes": len(content)})
+
+# ===========================
+# Worker
+# ===========================
+class SyncWorker:
+    def __init__(
+        self,
+        target: SyncTarget,
+        snapshot: Callable[[], Dict[str, Any]],
+        interval: float = 10.0,
+        max_changes: int = 20,
+        backoff_base: float = 1.0,
+        backoff_max: float = 120.0,
+    ):
+        self.target = target
+        self.snapshot = snapshot
+        self.interval = interval
+        self.max_changes = max_changes
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first_pending_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._attempt = 0
+        self._syncing = False
+        self._stopped = False
+        self._flush_requested = False
+        self.syncs = 0
+        self.failures = 0
+        self.last_sync_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        self._thread = threading.Thread(target=self._run, name="github-sync", daemon=True)
+        self._thread.start()
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def notify(self) -> None:
+        """Records one change; cheap enough to call from every upsert."""
+        with self._cond:
+            self._pending += 1
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Syncs pending changes now; returns True when nothing is left pending."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._pending:
+                return True
+            self._flush_requested = True
+            self._retry_at = None
+            self._cond.notify_all()
+            while self._pending or self._syncing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+                if self.failures and self._retry_at is not None and not self._flush_requested:
+                    return False
+            return True
+
+    def stop(self, flush: bool = True, timeout: float = 30.0) -> None:
+        if flush:
+            self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lag = time.monotonic() - self._first_pending_at if self._first_pending_at is not None else 0.0
+            return {
+                "queue_depth": self._pending,
+                "last_sync_lag_s": round(lag, 3),
+                "last_sync_at": self.last_sync_at,
+                "syncs": self.syncs,
+                "failures": self.failures,
+                "last_error": self.last_error,
+            }
+
+    # -----------------------------
+    # Worker loop
+    # -----------------------------
+    def _due_in(self, now: float) -> Optional[float]:
+        """Seconds until the next sync should start (0 = now), None if idle."""
+        if not self._pending:
+            return None
+        if self._retry_at is not None:
+            return max(0.0, self._retry_at - now)
+        if self._flush_requested or self._stopped or self._pending >= self.max_changes:
+            return 0.0
+        return max(0.0, self._first_pending_at + self.interval - now)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    due = self._due_in(time.monotonic())
+                    if due == 0.0:
+                        break
+                    if self._stopped and due is None:
+                        return
+                    self._cond.wait(due)
+                batch = self._pending
+                self._syncing = True
+
+            error = None
+            try:
+                content = json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+                self.target.push(content, f"Update user_profiles.json ({batch} change{'s' if batch != 1 else ''})")
+            except Exception as exc:
+                error = exc
+
+            with self._cond:
+                self._syncing = False
+                if error is None:
+                    # Changes made while pushing stay pending for the next commit.
+                    self._pending -= batch
+                    self._first_pending_at = time.monotonic() if self._pending else None
+                    self._retry_at = None
+                    self._attempt = 0
+                    self.syncs += 1
+                    self.last_sync_at = time.time()
+                    self.last_error = None
+                    if not self._pending:
+                        self._flush_requested = False
+                else:
+                    self.failures += 1
+                    self._attempt += 1
+                    self.last_error = f"{type(error).__name__}: {error}"
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (self._attempt - 1))
+                    self._retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                    self._flush_requested = False
+                    if self._stopped:
+                        self._cond.notify_all()
+                        return
+                self._cond.notify_all()
+
+def register_shutdown_flush(worker: SyncWorker, timeout: float = 30.0) -> None:
+    atexit.register(worker.stop, True, timeout)
@@ -1,83 +1,184 @@
 """
 json_memory.py
 
-JSON-backed memory store for user profiles and past drafts.
-Automatically syncs updates to GitHub.
+Memory store for user profiles and past drafts.
+The storage backend is pluggable (see stores.py): SQLite by default, or the
+original JSON file with PROFILE_STORE=json. Automatically syncs updates to GitHub.
+
+Does not depend on Streamlit: GitHub credentials come from the environment, or
+from Streamlit secrets when running inside the Streamlit app.
 """
 import json
+import os
+import sys
+import threading
 from pathlib import Path
-from typing import Dict, Any
-import streamlit as st
-
-try:
-    from github import Github
-except ImportError:
-    raise ImportError(
-        "PyGithub is required for GitHub sync. Install via: pip install PyGithub"
-    )
+from typing import Dict, Any, Optional, Tuple
+
+from memory.stores import JSONProfileStore, ProfileStore, SentArchive, SQLiteProfileStore
+from memory.sent_index import get_sent_index, index_appended
+from memory.github_sync import (
+    GithubTarget,
+    LocalRepoTarget,
+    SyncWorker,
+    register_shutdown_flush,
+)
 
 # -----------------------------
 # Local JSON path
 # -----------------------------
 MEMORY_PATH = Path(__file__).parent / "user_profiles.json"
+DB_PATH = Path(os.environ.get("PROFILE_DB_PATH", str(Path(__file__).parent / "user_profiles.sqlite3")))
+ARCHIVE_PATH = Path(os.environ.get("SENT_ARCHIVE_PATH", str(Path(__file__).parent / "sent_archive.jsonl")))
+
+# Retention: keep the newest SENT_HISTORY_LIMIT sent_examples in the profile and
+# archive older ones. Compaction runs once the live list exceeds the limit by
+# SENT_HISTORY_SLACK, so it happens in batches rather than on every send.
+SENT_HISTORY_LIMIT = int(os.environ.get("SENT_HISTORY_LIMIT", "50"))
+SENT_HISTORY_SLACK = int(os.environ.get("SENT_HISTORY_SLACK", "10"))
+
+# Few-shot style examples handed to draft_writer_agent.
+FEW_SHOT_K = int(os.environ.get("FEW_SHOT_K", "3"))
+FEW_SHOT_TOKEN_BUDGET = int(os.environ.get("FEW_SHOT_TOKEN_BUDGET", "600"))
 
 # -----------------------------
-# GitHub config (via Streamlit secrets)
+# GitHub config (env, else Streamlit secrets)
 # -----------------------------
-GITHUB_TOKEN = st.secrets.get("GITHUB_TOKEN")
-REPO_NAME = st.secrets.get("GITHUB_REPO")
+def _secret(name: str) -> Optional[str]:
+    value = os.environ.get(name)
+    if value:
+        return value
+    # Only consult Streamlit when the app already imported it; batch jobs and
+    # workers never pay for (or require) the import.
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+def github_config() -> Tuple[Optional[str], Optional[str]]:
+    """(token, repo) from GITHUB_TOKEN / GITHUB_REPO."""
+    return _secret("GITHUB_TOKEN"), _secret("GITHUB_REPO")
+
 FILE_PATH_IN_REPO = "src/memory/user_profiles.json"
+# Write-behind sync: one commit per GITHUB_SYNC_INTERVAL seconds or
+# GITHUB_SYNC_MAX_CHANGES upserts, whichever comes first. GITHUB_SYNC_LOCAL_DIR
+# swaps GitHub for a local stand-in repo directory.
+SYNC_INTERVAL = float(os.environ.get("GITHUB_SYNC_INTERVAL", "10"))
+SYNC_MAX_CHANGES = int(os.environ.get("GITHUB_SYNC_MAX_CHANGES", "20"))
+SYNC_LOCAL_DIR = os.environ.get("GITHUB_SYNC_LOCAL_DIR")
 
 # -----------------------------
 # Local JSON helpers
 # -----------------------------
 def load_profiles() -> Dict[str, Any]:
-    if not MEMORY_PATH.exists():
-        return {}
-    with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return JSONProfileStore(MEMORY_PATH).load()
 
 def save_profiles(data: Dict[str, Any]) -> None:
-    with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    JSONProfileStore(MEMORY_PATH).save(data)
 
-def get_profile(user_id: str = "default") -> Dict[str, Any]:
-    data = load_profiles()
-    return data.get(user_id, {})
+# -----------------------------
+# Storage backend
+# -----------------------------
+_STORE: Optional[ProfileStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_store() -> ProfileStore:
+    """SQLite store (migrated once from user_profiles.json) unless PROFILE_STORE=json."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            archive = SentArchive(ARCHIVE_PATH)
+            if os.environ.get("PROFILE_STORE", "sqlite").lower() == "json":
+                _STORE = JSONProfileStore(MEMORY_PATH, archive=archive)
+            else:
+                _STORE = SQLiteProfileStore(DB_PATH, migrate_from=MEMORY_PATH, archive=archive)
+        return _STORE
+
+def get_profile(user_id: str = "default", include_history: bool = True) -> Dict[str, Any]:
+    """
+    Served from an in-process cache that is invalidated when the store changes.
+    Pass include_history=False when sent_examples are not needed.
+    """
+    return get_store().get_profile(user_id, include_history=include_history)
+
+def get_sent_history(user_id: str = "default") -> list:
+    """Full sent history including archived examples (the archive is read lazily)."""
+    return get_store().sent_history(user_id)
+
+def retrieve_style_examples(
+    user_id: str,
+    query: str,
+    intent: Optional[str] = None,
+    k: int = FEW_SHOT_K,
+    token_budget: int = FEW_SHOT_TOKEN_BUDGET,
+) -> list:
+    """Most similar past sent emails that fit the token budget (see sent_index.py)."""
+    return get_sent_index(user_id, get_sent_history).search(query, intent=intent, k=k, token_budget=token_budget)
 
 # -----------------------------
 # GitHub sync
 # -----------------------------
 def push_to_github(data: Dict[str, Any]) -> None:
-    if not GITHUB_TOKEN or not REPO_NAME:
+    """Synchronous one-off push (the upsert path uses the background worker)."""
+    token, repo = github_config()
+    if not token or not repo:
         print("GitHub token or repo not set. Skipping GitHub sync.")
         return
+    GithubTarget(token, repo, FILE_PATH_IN_REPO).push(
+        json.dumps(data, indent=2, ensure_ascii=False), "Update user_profiles.json"
+    )
 
-    g = Github(GITHUB_TOKEN)
-    repo = g.get_repo(REPO_NAME)
+_SYNC_WORKER: Optional[SyncWorker] = None
+_SYNC_DISABLED = False
+_SYNC_LOCK = threading.Lock()
 
-    # Try to update the existing file
-    try:
-        contents = repo.get_contents(FILE_PATH_IN_REPO)
-        repo.update_file(
-            path=FILE_PATH_IN_REPO,
-            message="Update user_profiles.json",
-            content=json.dumps(data, indent=2, ensure_ascii=False),
-            sha=contents.sha
-        )
-    except Exception:
-        # If file doesn't exist, create it
-        repo.create_file(
-            path=FILE_PATH_IN_REPO,
-            message="Create user_profiles.json",
-            content=json.dumps(data, indent=2, ensure_ascii=False)
-        )
+def get_sync_worker() -> Optional[SyncWorker]:
+    """Background sync worker, or None when no sync target is configured."""
+    global _SYNC_WORKER, _SYNC_DISABLED
+    with _SYNC_LOCK:
+        if _SYNC_WORKER is None and not _SYNC_DISABLED:
+            token, repo = github_config()
+            if SYNC_LOCAL_DIR:
+                target = LocalRepoTarget(Path(SYNC_LOCAL_DIR), FILE_PATH_IN_REPO)
+            elif token and repo:
+                target = GithubTarget(token, repo, FILE_PATH_IN_REPO)
+            else:
+                print("GitHub token or repo not set. Skipping GitHub sync.")
+                _SYNC_DISABLED = True
+                return None
+            _SYNC_WORKER = SyncWorker(
+                target,
+                snapshot=lambda: get_store().export_all(),
+                interval=SYNC_INTERVAL,
+                max_changes=SYNC_MAX_CHANGES,
+            )
+            register_shutdown_flush(_SYNC_WORKER)
+        return _SYNC_WORKER
+
+def sync_stats() -> Dict[str, Any]:
+    worker = get_sync_worker()
+    return worker.stats() if worker else {"queue_depth": 0, "enabled": False}
+
+def _schedule_sync() -> None:
+    worker = get_sync_worker()
+    if worker:
+        worker.notify()
 
 # -----------------------------
 # Upsert profile
 # -----------------------------
 def upsert_profile(user_id: str, profile: Dict[str, Any]) -> None:
-    data = load_profiles()
-    data[user_id] = profile
-    save_profiles(data)        # update local JSON
-    push_to_github(data)       # sync to GitHub
+    get_store().upsert_profile(user_id, profile)
+    _schedule_sync()          # coalesced background sync to GitHub
+
+def append_sent_example(user_id: str, example: Dict[str, Any]) -> None:
+    """Appends one sent email without rewriting the rest of the profile."""
+    store = get_store()
+    count = store.append_sent_example(user_id, example)
+    if count > SENT_HISTORY_LIMIT + SENT_HISTORY_SLACK:
+        store.compact(user_id, SENT_HISTORY_LIMIT)
+    index_appended(user_id, example)
+    _schedule_sync()
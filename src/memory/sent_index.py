@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+sent_index.py
+
+Local, incremental BM25 index over a user's sent emails, used to pick a few
+past emails as style examples for draft_writer_agent. No network calls: the
+index lives in process, is built lazily from the stored history and updated
+in place whenever json_memory appends a sent example.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9'-]+")
+STOPWORDS = frozenset(
+    "the a an and or but of to in on for with at by from as is are was were be been it this that "
+    "these those i you he she we they me my your our their his her its im ive id please thanks "
+    "thank hi hello dear regards best email write draft".split()
+)
+# Lookup cost is bounded by scoring query terms rarest first and stopping once
+# this many postings have been visited; very common terms add little to BM25.
+MAX_POSTINGS = 1500
+# Score multiplier for past emails saved with the same intent.
+INTENT_BOOST = 1.3
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+class SentIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_len: List[int] = []
+        self.docs: List[Dict[str, Any]] = []
+        self.total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, example: Dict[str, Any]) -> None:
+        text = f"{example.get('subject', '')} {example.get('body', '')}"
+        tokens = tokenize(text)
+        with self._lock:
+            doc_id = len(self.docs)
+            self.docs.append({
+                "subject": example.get("subject", ""),
+                "body": example.get("body", ""),
+                "intent": example.get("intent"),
+                "tokens": estimate_tokens(text),
+            })
+            self.doc_len.append(len(tokens))
+            self.total_len += len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings[term][doc_id] = tf
+
+    def search(
+        self,
+        query: str,
+        intent: Optional[str] = None,
+        k: int = 3,
+        token_budget: int = 600,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k past emails by BM25 score that together fit in `token_budget`.
+        Examples that would overflow the budget are skipped, not truncated.
+        """
+        with self._lock:
+            n = len(self.docs)
+            if not n:
+                return []
+            avg_len = self.total_len / n or 1.0
+            terms = [t for t in set(tokenize(query)) if t in self.postings]
+            terms.sort(key=lambda t: len(self.postings[t]))
+            scores: Dict[int, float] = defaultdict(float)
+            k1, doc_len = self.k1, self.doc_len
+            base = k1 * (1 - self.b)
+            slope = k1 * self.b / avg_len
+            visited = 0
+            for term in terms:
+                posting = self.postings[term]
+                if visited and visited + len(posting) > MAX_POSTINGS:
+                    break
+                visited += len(posting)
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                scale = idf * (k1 + 1)
+                for doc_id, tf in posting.items():
+                    scores[doc_id] += scale * tf / (tf + base + slope * doc_len[doc_id])
+            if intent:
+                for doc_id in scores:
+                    if self.docs[doc_id]["intent"] == intent:
+                        scores[doc_id] *= INTENT_BOOST
+            ranked = heapq.nlargest(k * 4, scores.items(), key=lambda item: item[1])
+
+            picked, used = [], 0
+            for doc_id, score in ranked:
+                doc = self.docs[doc_id]
+                if used + doc["tokens"] > token_budget:
+                    continue
+                picked.append({"subject": doc["subject"], "body": doc["body"], "score": round(score, 3)})
+                used += doc["tokens"]
+                if len(picked) == k:
+                    break
+            return picked
+
+# ===========================
+# Per-user registry
+# ===========================
+_INDEXES: Dict[str, SentIndex] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def get_sent_index(user_id: str, load_history: Callable[[str], List[Dict[str, Any]]]) -> SentIndex:
+    """Index for `user_id`, built from `load_history(user_id)` on first use."""
+    with _REGISTRY_LOCK:
+        index = _INDEXES.get(user_id)
+        if index is None:
+            index = SentIndex()
+            for example in load_history(user_id):
+                if isinstance(example, dict):
+                    index.add(example)
+            _INDEXES[user_id] = index
+        return index
+
+def index_appended(user_id: str, example: Dict[str, Any]) -> None:
+    """Incremental update; a not-yet-built index will pick the example up when built."""
+    with _REGISTRY_LOCK:
+        index = _INDEXES.get(user_id)
+    if index is not None and isinstance(example, dict):
+        index.add(example)
+
+def invalidate_index(user_id: str) -> None:
+    with _REGISTRY_LOCK:
+        _INDEXES.pop(user_id, None)
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+stores.py
+
+Pluggable storage backends behind json_memory's get_profile / upsert_profile API.
+
+- JSONProfileStore:   the original single-file store (whole-file rewrites).
+- SQLiteProfileStore: one row per user, an append-only sent_examples table,
+                      WAL mode, and a one-time migration from the JSON file.
+
+Both keep an in-process read cache (invalidated by file mtime / database
+version) and can compact old sent_examples into a SentArchive file that is
+only parsed when the full history is requested.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+def _copy_profile(profile: Dict[str, Any], include_history: bool) -> Dict[str, Any]:
+    """Copy handed to callers so they can mutate it without touching the cache."""
+    if not profile:
+        return {}
+    out = {k: v for k, v in profile.items() if k != "sent_examples"}
+    if include_history:
+        out["sent_examples"] = list(profile.get("sent_examples") or [])
+    return out
+
+# ===========================
+# Archive of compacted history
+# ===========================
+class SentArchive:
+    """Append-only JSONL file of archived sent examples, parsed lazily."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._cache_key: Optional[Tuple[int, int]] = None
+
+    def append(self, user_id: str, examples: List[Dict[str, Any]]) -> None:
+        if not examples:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for example in examples:
+                    f.write(json.dumps({"user_id": user_id, "example": example}, ensure_ascii=False) + "\n")
+
+    def load(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                return []
+            key = (stat.st_mtime_ns, stat.st_size)
+            if key != self._cache_key:
+                cache: Dict[str, List[Dict[str, Any]]] = {}
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            row = json.loads(line)
+                            cache.setdefault(row["user_id"], []).append(row["example"])
+                self._cache, self._cache_key = cache, key
+            return list(self._cache.get(user_id, []))
+
+class ProfileStore:
+    """Interface every backend implements."""
+
+    archive: Optional[SentArchive] = None
+
+    def get_profile(self, user_id: str, include_history: bool = True) -> Dict[str, Any]:
+        """
+        Profile fields plus the live (non-archived) sent_examples. Pass
+        include_history=False when the history is not needed.
+        """
+        raise NotImplementedError
+
+    def upsert_profile(self, user_id: str, profile: Dict[str, Any]) -> None:
+        """
+        Replaces the profile fields. A "sent_examples" key in `profile` is
+        ignored and the stored history is kept: a caller's list may be stale
+        (another session appended, or compaction archived rows), so replacing
+        it would lose sends. New sends go through append_sent_example.
+        """
+        raise NotImplementedError
+
+    def append_sent_example(self, user_id: str, example: Dict[str, Any]) -> int:
+        """Appends one example and returns the number of live examples."""
+        raise NotImplementedError
+
+    def compact(self, user_id: str, keep: int) -> int:
+        """Moves all but the newest `keep` examples to the archive; returns how many moved."""
+        raise NotImplementedError
+
+    def sent_history(self, user_id: str) -> List[Dict[str, Any]]:
+        """Full history: archived examples (loaded lazily) followed by live ones."""
+        archived = self.archive.load(user_id) if self.archive else []
+        return archived + self.get_profile(user_id).get("sent_examples", [])
+
+    def export_all(self) -> Dict[str, Any]:
+        """All profiles in the user_profiles.json layout (used for GitHub sync)."""
+        raise NotImplementedError
+
+# ===========================
+# JSON file backend
+# ===========================
+class JSONProfileStore(ProfileStore):
+    def __init__(self, path: Path, archive: Optional[SentArchive] = None):
+        self.path = Path(path)
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Any] = {}
+        self._cache_key: Optional[Tuple[int, int]] = None
+
+    def load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, data: Dict[str, Any]) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        self._remember(data)
+
+    def _file_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _remember(self, data: Dict[str, Any]) -> None:
+        self._cache, self._cache_key = data, self._file_key()
+
+    def _data(self) -> Dict[str, Any]:
+        """Parsed file, re-read only when its mtime/size changed."""
+        key = self._file_key()
+        if key is None:
+            return {}
+        if key != self._cache_key:
+            self._cache, self._cache_key = self.load(), key
+        return self._cache
+
+    def get_profile(self, user_id: str, include_history: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            return _copy_profile(self._data().get(user_id, {}), include_history)
+
+    def upsert_profile(self, user_id: str, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            data = self.load()
+            profile = {k: v for k, v in profile.items() if k != "sent_examples"}
+            if "sent_examples" in data.get(user_id, {}):
+                profile["sent_examples"] = data[user_id]["sent_examples"]
+            data[user_id] = profile
+            self.save(data)
+
+    def append_sent_example(self, user_id: str, example: Dict[str, Any]) -> int:
+        with self._lock:
+            data = self.load()
+            examples = data.setdefault(user_id, {}).setdefault("sent_examples", [])
+            examples.append(example)
+            self.save(data)
+            return len(examples)
+
+    def compact(self, user_id: str, keep: int) -> int:
+        if self.archive is None:
+            return 0
+        with self._lock:
+            data = self.load()
+            examples = data.get(user_id, {}).get("sent_examples", [])
+            old = examples[:max(0, len(examples) - keep)]
+            if not old:
+                return 0
+            self.archive.append(user_id, old)
+            data[user_id]["sent_examples"] = examples[len(old):]
+            self.save(data)
+            return len(old)
+
+    def export_all(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self._data()))
+
+# ===========================
+# SQLite backend
+# ===========================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id    TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sent_examples (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id    TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sent_examples_user ON sent_examples(user_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class SQLiteProfileStore(ProfileStore):
+    def __init__(self, path: Path, migrate_from: Path = None, archive: Optional[SentArchive] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.archive = archive
+        self._lock = threading.Lock()
+        # Read cache: user_id -> (version, value). The version combines SQLite's
+        # data_version (bumped by commits from other connections) with a local
+        # counter bumped by our own writes.
+        self._local_version = 0
+        self._fields_cache: Dict[str, Tuple[Tuple[int, int], Optional[Dict[str, Any]]]] = {}
+        self._history_cache: Dict[str, Tuple[Tuple[int, int], List[Dict[str, Any]]]] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        if migrate_from is not None:
+            self.migrate_from_json(Path(migrate_from))
+
+    def _write(self):
+        """BEGIN IMMEDIATE so concurrent writers queue instead of overwriting each other."""
+        self._local_version += 1
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def _version(self) -> Tuple[int, int]:
+        (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+        return (data_version, self._local_version)
+
+    def migrate_from_json(self, json_path: Path) -> bool:
+        """Imports user_profiles.json once; later calls are no-ops."""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done or not json_path.exists():
+                return False
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._write()
+            try:
+                for user_id, profile in data.items():
+                    self._put_profile(user_id, profile)
+                    for example in profile.get("sent_examples", []) or []:
+                        self._put_example(user_id, example)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(json_path),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return True
+
+    def _put_profile(self, user_id: str, profile: Dict[str, Any]) -> None:
+        fields = {k: v for k, v in profile.items() if k != "sent_examples"}
+        self._conn.execute(
+            "INSERT INTO profiles (user_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (user_id, json.dumps(fields, ensure_ascii=False), time.time()),
+        )
+
+    def _put_example(self, user_id: str, example: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT INTO sent_examples (user_id, data, created_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(example, ensure_ascii=False), time.time()),
+        )
+
+    def _examples(self, user_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT data FROM sent_examples WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_profile(self, user_id: str, include_history: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            version = self._version()
+            cached = self._fields_cache.get(user_id)
+            if cached is None or cached[0] != version:
+                row = self._conn.execute("SELECT data FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+                cached = (version, json.loads(row[0]) if row else None)
+                self._fields_cache[user_id] = cached
+            fields = cached[1]
+            examples = None
+            if include_history:
+                history = self._history_cache.get(user_id)
+                if history is None or history[0] != version:
+                    history = (version, self._examples(user_id))
+                    self._history_cache[user_id] = history
+                examples = history[1]
+        if fields is None and not examples:
+            return {}
+        profile = dict(fields or {})
+        if include_history:
+            profile["sent_examples"] = list(examples)
+        return profile
+
+    def upsert_profile(self, user_id: str, profile: Dict[str, Any]) -> None:
+        # _put_profile drops "sent_examples"; the history table is left alone.
+        with self._lock:
+            self._write()
+            try:
+                self._put_profile(user_id, profile)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append_sent_example(self, user_id: str, example: Dict[str, Any]) -> int:
+        with self._lock:
+            self._write()
+            try:
+                self._put_example(user_id, example)
+                (count,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM sent_examples WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return count
+
+    def compact(self, user_id: str, keep: int) -> int:
+        if self.archive is None:
+            return 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM sent_examples WHERE user_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (user_id, keep),
+            ).fetchall()
+            if not rows:
+                return 0
+            # Archive first: a crash in between duplicates rather than loses history.
+            self.archive.append(user_id, [json.loads(data) for _, data in reversed(rows)])
+            self._write()
+            try:
+                self._conn.execute(
+                    "DELETE FROM sent_examples WHERE user_id = ? AND id <= ?", (user_id, rows[0][0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return len(rows)
+
+    def export_all(self) -> Dict[str, Any]:
+        with self._lock:
+            users = self._conn.execute("SELECT user_id, data FROM profiles").fetchall()
+            rows = self._conn.execute("SELECT user_id, data FROM sent_examples ORDER BY id").fetchall()
+        data = {user_id: json.loads(fields) for user_id, fields in users}
+        for user_id, example in rows:
+            data.setdefault(user_id, {}).setdefault("sent_examples", []).append(json.loads(example))
+        return data
@@ -2,42 +2,132 @@
 """
 Streamlit app for Email Assistant with live agent trace.
 Shows only the currently executing agent's output.
+
+Streamlit reruns main() on every interaction, so the LLM router and its
+clients and the transcription backend are st.cache_resource objects shared
+by all sessions. The profile snapshot and the tone samples are st.cache_data
+entries keyed by user and by file version. The sidebar reports what each
+rerun costs, split into idle reruns, busy reruns (other sessions' pipelines in
+flight) and reruns that generated.
 """
 
 import os
-import tempfile
+import queue
+import time
+from collections import deque
+from typing import Any, Dict, List
+
 import streamlit as st
-import openai
 
-from memory.json_memory import get_profile, upsert_profile
+from agents.agents import TONE_SAMPLES_PATH, get_tone_samples
+from integrations.model_routing import get_model_router
+from integrations.rate_limiter import priority
+from integrations.transcription import audio_hash, get_backend, transcribe_audio
+from memory.json_memory import append_sent_example, get_profile, upsert_profile
 from workflow.langgraph_flow import run_email_workflow
+from workflow.scheduler import in_flight
+
+# Seconds before a cached profile snapshot is re-read even without a save here
+# (picks up edits made by other processes).
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", "300"))
+RERUN_HISTORY = 50
+
+# ===========================
+# Cached resources and data
+# ===========================
+@st.cache_resource(show_spinner=False)
+def llm_router():
+    """Per-agent model router; its LLM clients are created once and shared by all sessions."""
+    return get_model_router()
+
+@st.cache_resource(show_spinner=False)
+def transcription_backend():
+    return get_backend()
+
+@st.cache_data(show_spinner=False)
+def tone_samples(version: int) -> Dict[str, str]:
+    """Keyed by the file's mtime, so edits to tone_samples.json reach the app and the agents."""
+    get_tone_samples.cache_clear()
+    return get_tone_samples()
+
+@st.cache_data(ttl=PROFILE_CACHE_TTL, show_spinner=False)
+def profile_snapshot(user_id: str) -> Dict[str, Any]:
+    return get_profile(user_id, include_history=False)
+
+def record_rerun(started: float, kind: str) -> None:
+    """Keeps this session's recent rerun times per kind and shows them in the sidebar."""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    history = st.session_state.setdefault("rerun_ms", {})
+    history.setdefault(kind, deque(maxlen=RERUN_HISTORY)).append(elapsed_ms)
+    parts = []
+    for name in ("idle", "busy", "generate"):
+        values = sorted(history.get(name) or [])
+        if values:
+            parts.append(f"{name} p50 {values[len(values) // 2]:.0f} ms (n={len(values)})")
+    st.sidebar.caption(f"This rerun: {elapsed_ms:.0f} ms ({kind}). " + ", ".join(parts))
+
+def _shown_variant(tone_choice, profile):
+    """The cached tone variant matching the selectbox, or None without variants."""
+    variants = st.session_state.get("variants")
+    if not variants:
+        return None, None
+    states = variants["states"]
+    tone = tone_choice if tone_choice != "(profile)" else profile.get("preferred_tone", "formal")
+    if tone not in states:
+        tone = next(iter(states))
+    return tone, states[tone]
 
 def main():
+    rerun_started = time.perf_counter()
+    # Other sessions' runs on the shared pipeline loop make this rerun "busy".
+    rerun_kind = "busy" if in_flight() else "idle"
     st.set_page_config(page_title="Email Generator", layout="wide")
     st.title("Email Generator")
+    user_id = st.session_state.get("user_id", "default")
 
     # -------------------------
     # Sidebar: User Profile
     # -------------------------
     st.sidebar.header("User Profile")
-    profile = get_profile("default")
+    profile = profile_snapshot(user_id)
     name = st.sidebar.text_input("Sender name", value=profile.get("name", "Manasa"))
     company = st.sidebar.text_input("Company", value=profile.get("company", "Stealth Startup"))
     signature = st.sidebar.text_area("Signature", value=profile.get("signature", "Best,\nManasa"))
 
     if st.sidebar.button("Save profile"):
         upsert_profile(
-            "default",
+            user_id,
             {
                 "name": name,
                 "company": company,
                 "signature": signature,
                 "preferred_tone": profile.get("preferred_tone", "formal"),
-                "sent_examples": profile.get("sent_examples", []),
             },
         )
+        profile_snapshot.clear()
         st.sidebar.success("Saved.")
 
+    # -------------------------
+    # Sidebar: last run breakdown
+    # -------------------------
+    last_run = st.session_state.get("last_result")
+    if last_run and last_run.get("flow"):
+        st.sidebar.header("Last run")
+        totals = last_run.get("run_metrics", {})
+        st.sidebar.caption(
+            f"{totals.get('prompt_tokens', 0)} prompt + {totals.get('completion_tokens', 0)} completion tokens, "
+            f"{totals.get('llm_calls', 0)} LLM calls, {totals.get('cache_hits', 0)} cache hits"
+        )
+        st.sidebar.table([
+            {
+                "agent": entry["agent"].replace("_agent", ""),
+                "ms": entry.get("metrics", {}).get("elapsed_ms", 0),
+                "tokens": entry.get("metrics", {}).get("prompt_tokens", 0)
+                + entry.get("metrics", {}).get("completion_tokens", 0),
+            }
+            for entry in last_run["flow"]
+        ])
+
     # -------------------------
     # Main layout
     # -------------------------
@@ -60,31 +150,40 @@ def main():
 
             audio_file = st.file_uploader("Upload audio", type=["wav", "mp3", "m4a", "mp4"])
             if audio_file:
-                suffix = "." + audio_file.name.split(".")[-1]
-                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                    tmp.write(audio_file.read())
-                    audio_path = tmp.name
-
-                client = openai.OpenAI()
-                with open(audio_path, "rb") as f:
-                    transcript = client.audio.transcriptions.create(
-                        file=f,
-                        model="gpt-4o-transcribe",
-                        language="en",
-                    )
-                st.session_state["voice_text"] = getattr(transcript, "text", "")
+                audio = audio_file.getvalue()
+                digest = audio_hash(audio)
+                # Reruns keep the same upload attached; only transcribe new audio.
+                if st.session_state.get("voice_hash") != digest:
+                    with st.spinner("Transcribing..."):
+                        st.session_state["voice_text"] = transcribe_audio(
+                            audio, audio_file.name, language="en", backend=transcription_backend()
+                        )
+                    st.session_state["voice_hash"] = digest
                 st.write("Transcription:")
                 st.write(st.session_state["voice_text"])
 
             user_text = st.session_state["voice_text"]
 
-        tone_choice = st.selectbox("Tone (optional)", ["(profile)", "formal", "casual", "assertive"], index=0)
+        tones = tone_samples(TONE_SAMPLES_PATH.stat().st_mtime_ns)
+        tone_choice = st.selectbox("Tone (optional)", ["(profile)", *tones], index=0)
+        fast_mode = st.checkbox(
+            "Fast mode (single LLM call)",
+            value=False,
+            help="Detects intent, drafts and self-reviews in one structured call instead of three.",
+        )
+        all_tones = st.checkbox(
+            "All tones (formal, casual, assertive)",
+            value=False,
+            help="Drafts every tone in one run, sharing intent detection; switching tone afterwards "
+            "or comparing variants needs no further LLM calls.",
+        )
 
         if st.button("Generate email"):
             if not user_text:
                 st.warning("Enter text or upload voice input.")
             else:
-                extra = f"\n\ntone: {tone_choice}" if tone_choice != "(profile)" else ""
+                rerun_kind = "generate"
+                extra = f"\n\ntone: {tone_choice}" if tone_choice != "(profile)" and not all_tones else ""
                 full_text = user_text + extra
 
                 # -------------------------
@@ -94,39 +193,81 @@ def main():
                 spinner_placeholder.info("Generating draft...")
                 trace_placeholder = st.empty()
 
-                # Initialize state
-                state = {"messages": [{"content": full_text}], "flow": []}
-
-                # Agents called in order (same as run_email_workflow)
-                from workflow.langgraph_flow import (
-                    input_parser_agent,
-                    intent_detection_agent,
-                    tone_stylist_agent,
-                    draft_writer_agent,
-                    personalization_agent,
-                    review_agent,
-                    router_agent,
-                    make_openai_llm
-                )
-                llm = make_openai_llm()
-                agents = [
-                    ("input_parser_agent", input_parser_agent),
-                    ("intent_detection_agent", lambda s: intent_detection_agent(s, llm)),
-                    ("tone_stylist_agent", tone_stylist_agent),
-                    ("draft_writer_agent", lambda s: draft_writer_agent(s, llm)),
-                    ("personalization_agent", personalization_agent),
-                    ("review_agent", lambda s: review_agent(s, llm)),
-                    ("router_agent", router_agent),
-                ]
-
-                for i, (name, fn) in enumerate(agents):
-                    output = fn(state)
-                    state.update(output)
-                    state["flow"].append({"agent": name, "output": output})
-
-                    # Show only the currently executing agent
-                    trace_placeholder.markdown(f"### {name}")
-                    trace_placeholder.json(output)
+                # The draft streams into the "Draft & Actions" column while
+                # it is written; review runs once the stream has finished.
+                live_caption = col2.empty()
+                live_subject = col2.empty()
+                live_body = col2.empty()
+
+                # Agents run as a DAG (same pipeline as run_email_workflow):
+                # intent detection and tone styling overlap. The run happens on
+                # the shared pipeline loop so pooled LLM connections survive
+                # reruns; finished steps are handed back to this script thread.
+                from workflow.langgraph_flow import arun_email_workflow
+                from workflow.scheduler import submit
+                from workflow.variants import arun_tone_variants
+
+                events = queue.Queue()
+                gen_started = time.perf_counter()
+                first_token_s = None
+                # Interactive runs go ahead of batch jobs at the LLM rate limiter.
+                with priority("interactive"):
+                    if all_tones:
+                        # Variants draft concurrently, so there is no single draft to stream.
+                        future = submit(arun_tone_variants(
+                            full_text,
+                            llm=llm_router(),
+                            on_step=lambda name, output: events.put(("step", name, output)),
+                            mode="fused" if fast_mode else "pipeline",
+                        ))
+                    else:
+                        future = submit(arun_email_workflow(
+                            full_text,
+                            llm=llm_router(),
+                            on_step=lambda name, output: events.put(("step", name, output)),
+                            on_draft=lambda fields: events.put(("draft", None, fields)),
+                            mode="fused" if fast_mode else "pipeline",
+                        ))
+                # Streamed draft text arrives as deltas; the live view is
+                # redrawn once per batch of queued events, not per token.
+                live_draft: Dict[str, List[str]] = {"subject": [], "body": []}
+                while not (future.done() and events.empty()):
+                    try:
+                        batch = [events.get(timeout=0.05)]
+                    except queue.Empty:
+                        continue
+                    while not events.empty():
+                        batch.append(events.get_nowait())
+                    drafted = False
+                    for kind, name, output in batch:
+                        if kind == "draft":
+                            for field, text in output.items():
+                                if text:
+                                    live_draft[field].append(text)
+                                else:
+                                    live_draft[field] = []
+                            drafted = True
+                            continue
+                        # Show only the most recently finished agent
+                        trace_placeholder.markdown(f"### {name}")
+                        trace_placeholder.json(output)
+                    if drafted:
+                        if first_token_s is None and any("".join(parts) for parts in live_draft.values()):
+                            first_token_s = time.perf_counter() - gen_started
+                            live_caption.caption(f"Drafting... first token after {first_token_s:.2f}s")
+                        for field in live_draft:
+                            live_draft[field] = ["".join(live_draft[field])]
+                        live_subject.markdown(f"**{live_draft['subject'][0]}**")
+                        live_body.text(live_draft["body"][0])
+                state = future.result()
+                if all_tones:
+                    st.session_state["variants"] = {"states": state["variants"], "stats": state["stats"]}
+                    state = _shown_variant(tone_choice, profile)[1]
+                else:
+                    st.session_state.pop("variants", None)
+                for placeholder in (live_caption, live_subject, live_body):
+                    placeholder.empty()
+                st.session_state["last_ttft"] = first_token_s
 
                 # Hide spinner when the last agent finishes
                 spinner_placeholder.empty()
@@ -137,7 +278,24 @@ def main():
     # -------------------------
     with col2:
         st.subheader("Draft & Actions")
+        shown_tone, variant = _shown_variant(tone_choice, profile)
+        if variant is not None:
+            # Switching tone only picks another cached variant.
+            st.session_state["last_result"] = variant
+            stats = st.session_state["variants"]["stats"]
+            st.caption(
+                f"Showing the {shown_tone} variant of {len(stats['tones'])} "
+                f"({stats['llm_calls']} LLM calls for all, {stats['llm_calls_saved']} saved by sharing intent)"
+            )
         last = st.session_state.get("last_result")
+        if last and st.session_state.get("last_ttft") is not None:
+            st.caption(f"Time to first visible token: {st.session_state['last_ttft']:.2f}s")
+        if last and last.get("rewrite_stats"):
+            rewrites = last["rewrite_stats"]
+            st.caption(
+                f"Revised {rewrites['rewrites']}x after review "
+                f"(~{rewrites['tokens_saved']} tokens saved vs. full redrafts)"
+            )
 
         if last:
             draft = last.get("personalized_draft") or last.get("draft") or {}
@@ -159,20 +317,26 @@ def main():
             disabled=not bool(subject_edit or body_edit),
         )
 
+        variants = st.session_state.get("variants")
+        if variants:
+            with st.expander("Compare tones side by side"):
+                for column, (tone, state) in zip(st.columns(len(variants["states"])), variants["states"].items()):
+                    variant_draft = state.get("personalized_draft") or state.get("draft") or {}
+                    column.markdown(f"**{tone}**")
+                    column.markdown(f"*{variant_draft.get('subject', '')}*")
+                    column.text(variant_draft.get("body", ""))
+
         if st.button("Save to profile history", disabled=not last):
-            prof = get_profile("default")
-            prof.setdefault("sent_examples", []).append({"subject": subject_edit, "body": body_edit})
-            upsert_profile("default", prof)
+            append_sent_example(user_id, {"subject": subject_edit, "body": body_edit})
             st.success("Saved.")
 
         if st.button("Simulate send", disabled=not last):
-            prof = get_profile("default")
-            prof.setdefault("sent_examples", []).append({"subject": subject_edit, "body": body_edit})
-            upsert_profile("default", prof)
+            append_sent_example(user_id, {"subject": subject_edit, "body": body_edit})
             st.success("Email sent (simulation).")
 
     st.markdown("---")
     st.markdown("~ Because writing emails manually is a 2010 problem. 😄")
+    record_rerun(rerun_started, rerun_kind)
 
 if __name__ == "__main__":
     main()
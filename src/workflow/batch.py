@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+batch.py
+
+Batch generation mode: streams prompts in from a JSONL file, runs many email
+workflows at once (bounded by a concurrency limit) and streams results out as
+JSONL, either in input order or in completion order.
+
+Usage (from src/):
+    python -m workflow.batch prompts.jsonl -o drafts.jsonl --concurrency 8 --order input
+
+Each input line is either a JSON string (the prompt) or an object with a
+"prompt" (or "text") field and an optional "id".
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from integrations.rate_limiter import priority
+from workflow.langgraph_flow import MODES, arun_email_workflow
+from workflow.scheduler import run_sync
+
+ORDERS = ("input", "completion")
+
+# ===========================
+# Batch stats
+# ===========================
+@dataclass
+class BatchStats:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Completed drafts per second."""
+        return self.succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed, 3),
+            "drafts_per_sec": round(self.throughput, 3),
+        }
+
+# ===========================
+# Input / output helpers
+# ===========================
+def read_prompts(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily yields {"id", "prompt"} items from a JSONL stream. A line that is
+    not valid JSON, or not a string or an object with a string prompt, yields
+    an item with an "error" instead, which the batch reports as a failure.
+    """
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as exc:
+            yield {"id": index, "prompt": "", "error": f"invalid JSON on line {index + 1}: {exc}"}
+            continue
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict):
+            yield {"id": index, "prompt": "", "error": f"line {index + 1} is a JSON {type(item).__name__}, "
+                                                      "expected a string or an object"}
+            continue
+        prompt = item.get("prompt") or item.get("text") or ""
+        item_id = item.get("id", index)
+        if not isinstance(prompt, str):
+            yield {"id": item_id, "prompt": "", "error": f"prompt on line {index + 1} is not a string"}
+            continue
+        yield {"id": item_id, "prompt": prompt}
+
+def result_record(item: Dict[str, Any], state: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    draft = state.get("personalized_draft") or state.get("draft") or {}
+    return {
+        "id": item["id"],
+        "ok": True,
+        "intent": state.get("intent"),
+        "tone": state.get("tone"),
+        "subject": draft.get("subject", ""),
+        "body": draft.get("body", ""),
+        "review": state.get("review", {}),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+def error_record(item: Dict[str, Any], exc: BaseException, elapsed: float) -> Dict[str, Any]:
+    return {
+        "id": item["id"],
+        "ok": False,
+        "error": f"{type(exc).__name__}: {exc}",
+        "elapsed_s": round(elapsed, 3),
+    }
+
+# ===========================
+# Batch runner
+# ===========================
+async def arun_batch(
+    prompts: Iterable[Dict[str, Any]],
+    sink: Callable[[Dict[str, Any]], None],
+    concurrency: int = 8,
+    order: str = "input",
+    workflow: Callable[[str], Any] = arun_email_workflow,
+    max_pending: Optional[int] = None,
+) -> BatchStats:
+    """
+    Runs `workflow` over every prompt with at most `concurrency` runs in flight.
+    Coroutine workflows (the default, arun_email_workflow) run on the event loop;
+    plain functions such as run_email_workflow run in a worker thread pool.
+
+    Results are passed to `sink` as soon as they can be emitted. In "input" order,
+    finished results wait in a reorder buffer until every earlier item has been
+    emitted; `max_pending` bounds that buffer so memory stays flat on huge inputs.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {ORDERS}")
+    concurrency = max(1, concurrency)
+    max_pending = max(concurrency, max_pending or concurrency * 4)
+
+    loop = asyncio.get_running_loop()
+    is_async = inspect.iscoroutinefunction(workflow)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="email-batch")
+    running = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(max_pending)
+    stats = BatchStats()
+    buffer: Dict[int, Dict[str, Any]] = {}
+    next_index = 0
+    tasks = set()
+
+    def emit(position: int, record: Dict[str, Any]) -> None:
+        nonlocal next_index
+        if order == "completion":
+            sink(record)
+            window.release()
+            return
+        buffer[position] = record
+        while next_index in buffer:
+            sink(buffer.pop(next_index))
+            next_index += 1
+            window.release()
+
+    async def run_one(position: int, item: Dict[str, Any]) -> None:
+        async with running:
+            start = time.perf_counter()
+            try:
+                if "error" in item:
+                    raise ValueError(item["error"])
+                # Batch calls yield to interactive ones at the LLM rate limiter.
+                with priority("batch"):
+                    if is_async:
+                        state = await workflow(item["prompt"])
+                    else:
+                        ctx = contextvars.copy_context()
+                        state = await loop.run_in_executor(executor, ctx.run, workflow, item["prompt"])
+                record = result_record(item, state, time.perf_counter() - start)
+                stats.succeeded += 1
+            except Exception as exc:
+                record = error_record(item, exc, time.perf_counter() - start)
+                stats.failed += 1
+                stats.failures.append({"id": item["id"], "error": record["error"]})
+        emit(position, record)
+
+    try:
+        for position, item in enumerate(prompts):
+            await window.acquire()
+            stats.total += 1
+            task = asyncio.create_task(run_one(position, item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        # Reading the input failed (or the batch was cancelled): do not leave
+        # runs orphaned on the shared loop.
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=False)
+        stats.finished_at = time.perf_counter()
+    return stats
+
+def run_batch(
+    prompts: Iterable[Dict[str, Any]],
+    sink: Callable[[Dict[str, Any]], None],
+    concurrency: int = 8,
+    order: str = "input",
+    workflow: Callable[[str], Any] = arun_email_workflow,
+) -> BatchStats:
+    """
+    Synchronous wrapper around arun_batch for use from plain Python code. The
+    batch runs on the shared pipeline loop (scheduler.run_sync), like every
+    other entry point, so its runs share the loop's LLM client connections and
+    rate limiter with interactive runs; `sink` is called on that loop.
+    """
+    return run_sync(arun_batch(prompts, sink, concurrency=concurrency, order=order, workflow=workflow))
+
+# ===========================
+# CLI
+# ===========================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate email drafts for a JSONL file of prompts.")
+    parser.add_argument("input", help="JSONL file of prompts ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file ('-' for stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="max workflows in flight")
+    parser.add_argument("--order", choices=ORDERS, default="input", help="output ordering")
+    parser.add_argument("--mode", choices=MODES, default="pipeline",
+                        help="'fused' does intent, draft and review in one LLM call")
+    parser.add_argument("--progress-every", type=int, default=100, help="log progress every N results")
+    args = parser.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    written = 0
+    started = time.perf_counter()
+
+    def sink(record: Dict[str, Any]) -> None:
+        nonlocal written
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        written += 1
+        if not record["ok"]:
+            print(f"[batch] item {record['id']} failed: {record['error']}", file=sys.stderr)
+        if args.progress_every and written % args.progress_every == 0:
+            rate = written / max(time.perf_counter() - started, 1e-9)
+            print(f"[batch] {written} results ({rate:.2f}/s)", file=sys.stderr)
+
+    try:
+        workflow = functools.partial(arun_email_workflow, mode=args.mode)
+        stats = run_batch(read_prompts(src), sink, concurrency=args.concurrency, order=args.order, workflow=workflow)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(json.dumps(stats.summary()), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+checkpoints.py
+
+Persistent, bounded checkpoints for both ways of running the pipeline.
+
+- BoundedSqliteSaver: LangGraph checkpointer for the compiled email_planner.
+  Keeps only the newest CHECKPOINT_KEEP_PER_THREAD checkpoints of a thread and
+  evicts whole threads that are older than CHECKPOINT_MAX_AGE or beyond the
+  newest CHECKPOINT_MAX_THREADS.
+- RunCheckpoints: per-step snapshots of run_email_workflow's DAG state, so a
+  run that died half way (e.g. after drafting, before review) resumes from its
+  last completed step instead of paying for the same LLM calls again. Writes
+  go through one background writer thread, so the shared pipeline loop never
+  waits on SQLite.
+
+Both live in one SQLite file (CHECKPOINT_DB_PATH, default
+<repo>/.cache/checkpoints.sqlite3).
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent.parent / ".cache" / "checkpoints.sqlite3"
+
+KEEP_PER_THREAD = int(os.environ.get("CHECKPOINT_KEEP_PER_THREAD", "4"))
+MAX_THREADS = int(os.environ.get("CHECKPOINT_MAX_THREADS", "500"))
+MAX_AGE_SECONDS = float(os.environ.get("CHECKPOINT_MAX_AGE", str(7 * 24 * 3600)))
+# Thread eviction is a full scan, so it runs every N checkpoint writes.
+EVICT_EVERY = 100
+
+def db_path() -> Path:
+    return Path(os.environ.get("CHECKPOINT_DB_PATH", str(DEFAULT_DB_PATH)))
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+# ===========================
+# LangGraph checkpointer
+# ===========================
+class BoundedSqliteSaver(SqliteSaver):
+    """SqliteSaver with per-thread retention and eviction of old threads."""
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        keep_per_thread: int = KEEP_PER_THREAD,
+        max_threads: int = MAX_THREADS,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+    ):
+        super().__init__(conn)
+        # The latest checkpoint plus its parent are needed to resume a thread.
+        self.keep_per_thread = max(2, keep_per_thread)
+        self.max_threads = max_threads
+        self.max_age_seconds = max_age_seconds
+        self._puts = 0
+
+    @classmethod
+    def from_path(cls, path: Optional[Path] = None, **kwargs) -> "BoundedSqliteSaver":
+        return cls(_connect(Path(path) if path else db_path()), **kwargs)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_threads ("
+            "thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO checkpoint_threads (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (thread_id, time.time()),
+            )
+            self._prune_thread(cur, thread_id, checkpoint_ns)
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+        return saved
+
+    def _prune_thread(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str) -> None:
+        # Checkpoint ids are time-ordered (uuid6), newest sorts last.
+        old = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?"
+        )
+        args = (thread_id, checkpoint_ns, self.keep_per_thread)
+        cur.execute(
+            f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({old})",
+            (thread_id, checkpoint_ns) + args,
+        )
+        cur.execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({old})",
+            (thread_id, checkpoint_ns) + args,
+        )
+
+    def evict(self) -> int:
+        """Drops threads older than max_age_seconds or beyond the newest max_threads."""
+        with self.cursor() as cur:
+            cur.execute(
+                "SELECT thread_id FROM checkpoint_threads WHERE updated_at < ? "
+                "UNION SELECT thread_id FROM ("
+                "  SELECT thread_id FROM checkpoint_threads ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (time.time() - self.max_age_seconds, self.max_threads),
+            )
+            stale = [row[0] for row in cur.fetchall()]
+            for thread_id in stale:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM checkpoint_threads WHERE thread_id = ?", (thread_id,))
+        return len(stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoint_threads WHERE thread_id = ?", (str(thread_id),))
+
+    def stats(self) -> Dict[str, int]:
+        with self.cursor(transaction=False) as cur:
+            counts = {}
+            for table in ("checkpoint_threads", "checkpoints", "writes"):
+                counts[table] = cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return {"threads": counts["checkpoint_threads"], "checkpoints": counts["checkpoints"],
+                "writes": counts["writes"]}
+
+# ===========================
+# DAG run checkpoints
+# ===========================
+RUNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dag_runs (
+    run_id     TEXT PRIMARY KEY,
+    phase      INTEGER NOT NULL,
+    done       TEXT NOT NULL,
+    state      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dag_runs_updated ON dag_runs(updated_at);
+"""
+
+class RunCheckpoints:
+    """
+    State of run_email_workflow runs after every completed step. `phase` is
+    0 for the main DAG and n for the n-th review/rewrite pass; `done` lists the
+    steps finished in that phase.
+
+    save() only snapshots the state and hands the row to the writer thread;
+    when a run saves faster than rows are written, only its newest row is
+    kept. load() and delete() flush pending rows first.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        max_runs: int = MAX_THREADS,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+    ):
+        self.conn = _connect(Path(path) if path else db_path())
+        self.conn.executescript(RUNS_SCHEMA)
+        self.max_runs = max_runs
+        self.max_age_seconds = max_age_seconds
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        # run_id -> newest row not written yet.
+        self._pending: Dict[str, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def save(self, run_id: str, phase: int, done: Iterable[str], state: Dict[str, Any], status: str = "running") -> None:
+        """Called on the pipeline loop: serializes the snapshot and queues it, nothing else."""
+        row = (run_id, phase, json.dumps(sorted(done)), json.dumps(state, default=str), status, time.time())
+        with self._pending_lock:
+            self._pending[run_id] = row
+        self._wake.set()
+
+    def finish(self, run_id: str, state: Dict[str, Any]) -> None:
+        self.save(run_id, -1, (), state, status="done")
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                self.last_error = str(e)
+
+    def flush(self) -> int:
+        """Writes every queued row in one transaction; returns the number written."""
+        with self._write_lock:
+            with self._pending_lock:
+                rows, self._pending = list(self._pending.values()), {}
+            if not rows:
+                return 0
+            with self._lock:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO dag_runs (run_id, phase, done, state, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.conn.commit()
+                evict = self._writes // EVICT_EVERY != (self._writes + len(rows)) // EVICT_EVERY
+                self._writes += len(rows)
+            if evict:
+                self.evict()
+            return len(rows)
+
+    def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT phase, done, state, status FROM dag_runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"phase": row[0], "done": set(json.loads(row[1])), "state": json.loads(row[2]), "status": row[3]}
+
+    def delete(self, run_id: str) -> None:
+        self.flush()
+        with self._lock:
+            self.conn.execute("DELETE FROM dag_runs WHERE run_id = ?", (run_id,))
+            self.conn.commit()
+
+    def evict(self) -> int:
+        with self._lock:
+            cur = self.conn.execute(
+                "DELETE FROM dag_runs WHERE updated_at < ? OR run_id IN ("
+                "  SELECT run_id FROM dag_runs ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (time.time() - self.max_age_seconds, self.max_runs),
+            )
+            self.conn.commit()
+            return cur.rowcount
+
+    def close(self) -> None:
+        if not self._closed.is_set():
+            self._closed.set()
+            self._wake.set()
+            self._thread.join(timeout=5)
+        self.flush()
+
+_RUNS: Optional[RunCheckpoints] = None
+_RUNS_LOCK = threading.Lock()
+
+def get_run_checkpoints() -> RunCheckpoints:
+    global _RUNS
+    with _RUNS_LOCK:
+        if _RUNS is None:
+            _RUNS = RunCheckpoints()
+        return _RUNS
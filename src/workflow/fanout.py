@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+fanout.py
+
+Multi-recipient fan-out: one intent prompt, many recipients. Intent detection,
+tone styling, drafting and review run once to produce a template with
+recipient slots ({{first_name}}, {{full_name}}, {{role}}, {{company}} or any
+other CSV column), which personalize_recipients then fills in for every
+recipient without further LLM calls. Only recipients flagged as needing it get
+an LLM touch-up (touch_up_agent):
+
+- the row sets a truthy `touch_up` column,
+- the row has `notes` (recipient-specific context the template cannot carry),
+- the template uses a slot the row has no value for.
+
+The template is reviewed on a preview rendered for the first recipient, so the
+review gate and reviewer see a real email rather than the slots.
+
+Usage (from src/):
+    python -m workflow.fanout recipients.csv --prompt "Announce the new office hours" -o drafts.jsonl
+    python -m workflow.fanout recipients.csv --prompt-file intent.txt --touch-up none
+
+recipients.csv needs a header row, e.g. name,role,company,email,notes,touch_up.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from agents.agents import (
+    areview_agent,
+    arewrite_agent,
+    atouch_up_agent,
+    personalize_recipients,
+    recipient_values,
+)
+from integrations.metrics import run_summary, step_metrics
+from integrations.model_routing import get_model_router, llm_for
+from integrations.rate_limiter import priority
+from integrations.tracing import trace_request
+from workflow.langgraph_flow import MAX_REWRITES, MODES, REWRITE_MODE, build_email_steps, build_rewrite_steps
+from workflow.scheduler import Step, StepCallback, run_dag, run_sync
+
+TOUCH_UP_POLICIES = ("flagged", "none", "all")
+
+TEMPLATE_INSTRUCTIONS = (
+    "\n\nThis email goes to many recipients. Write it once as a template: greet the recipient with "
+    "{{first_name}} and use {{role}} and {{company}} wherever their details belong. Keep these "
+    "placeholders exactly as written and do not invent facts about any individual recipient."
+)
+
+# ===========================
+# Fan-out stats
+# ===========================
+@dataclass
+class FanoutStats:
+    recipients: int = 0
+    flagged: int = 0
+    touched_up: int = 0
+    touch_up_failed: int = 0
+    template_llm_calls: int = 0
+    touch_up_llm_calls: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def summary(self) -> Dict[str, Any]:
+        llm_calls = self.template_llm_calls + self.touch_up_llm_calls
+        return {
+            "recipients": self.recipients,
+            "flagged": self.flagged,
+            "touched_up": self.touched_up,
+            "touch_up_failed": self.touch_up_failed,
+            "llm_calls": llm_calls,
+            # What one full run per recipient would have cost.
+            "llm_calls_saved": max(self.recipients * self.template_llm_calls - llm_calls, 0),
+            "elapsed_s": round(self.elapsed, 3),
+        }
+
+# ===========================
+# Recipients
+# ===========================
+def read_recipients(stream: TextIO) -> Iterator[Dict[str, str]]:
+    """Rows of a recipients CSV with lower-cased column names; blank rows are skipped."""
+    for row in csv.DictReader(stream):
+        row = {str(k).strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        if any(row.values()):
+            yield row
+
+def _truthy(value: Any) -> bool:
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y", "x")
+
+def touch_up_reasons(recipient: Dict[str, Any], missing: List[str]) -> List[str]:
+    reasons = []
+    if _truthy(recipient.get("touch_up")):
+        reasons.append("requested")
+    if (recipient.get("notes") or "").strip():
+        reasons.append("notes")
+    if missing:
+        reasons.append("missing " + ", ".join(missing))
+    return reasons
+
+def templatize(draft: Dict[str, str], values: Dict[str, str]) -> Dict[str, str]:
+    """Turns one recipient's values in a rendered email back into slots (longest value first)."""
+    pairs = sorted(
+        ((values.get(slot), slot) for slot in ("full_name", "first_name", "role", "company") if values.get(slot)),
+        key=lambda pair: len(pair[0]), reverse=True,
+    )
+
+    def fill(text: str) -> str:
+        for value, slot in pairs:
+            text = re.sub(rf"(?<!\w){re.escape(value)}(?!\w)", "{{" + slot + "}}", text)
+        return text
+
+    return {"subject": fill(draft.get("subject", "")), "body": fill(draft.get("body", ""))}
+
+# ===========================
+# Template (one pipeline run)
+# ===========================
+def _with_preview(steps: List[Step], llm, sample: Dict[str, str], rewrite_mode: str) -> List[Step]:
+    """Reviews a preview rendered for `sample` and keeps rewrites in template form."""
+    values = recipient_values(sample)
+
+    async def review(state: Dict[str, Any]) -> Dict[str, Any]:
+        preview = personalize_recipients(state, [sample])[0]["personalized_draft"]
+        return await areview_agent({**state, "personalized_draft": preview}, llm_for(llm, "review"))
+
+    async def rewrite(state: Dict[str, Any]) -> Dict[str, Any]:
+        res = await arewrite_agent(state, llm_for(llm, "rewrite"), mode=rewrite_mode)
+        # A reviewer's full-body suggestion was written for the preview.
+        return {**res, "draft": templatize(res["draft"], values)}
+
+    replaced = {"review_agent": review, "rewrite_agent": rewrite}
+    return [Step(step.name, replaced.get(step.name, step.fn), step.requires) for step in steps]
+
+async def abuild_template(
+    user_text: str,
+    sample: Dict[str, str],
+    llm,
+    on_step: Optional[StepCallback] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+) -> Dict[str, Any]:
+    """The agent DAG and review loop of arun_email_workflow, run once for the whole list."""
+    state: Dict[str, Any] = {"messages": [{"content": user_text + TEMPLATE_INSTRUCTIONS}], "flow": [], "mode": mode}
+    # No cascade: the template is reviewed on a preview, not the draft itself.
+    steps = build_email_steps(llm, mode=mode, max_retries=max_retries, cascade=False)
+    await run_dag(_with_preview(steps, llm, sample, rewrite_mode), state, on_step=on_step)
+    while state.get("route") == "rewrite":
+        steps = build_rewrite_steps(llm, rewrite_mode, max_retries)
+        await run_dag(_with_preview(steps, llm, sample, rewrite_mode), state, on_step=on_step)
+    return state
+
+# ===========================
+# Fan-out runner
+# ===========================
+async def arun_fanout(
+    user_text: str,
+    recipients: List[Dict[str, Any]],
+    llm=None,
+    touch_up: str = "flagged",
+    concurrency: int = 8,
+    on_step: Optional[StepCallback] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+) -> Dict[str, Any]:
+    """
+    Returns {"template", "results", "stats"}. `results` has one record per
+    recipient, in input order, with the rendered subject/body, the touch-up
+    reasons ("flags") and whether the LLM touch-up ran. A failed touch-up keeps
+    the rendered email and records the error.
+
+    Runs in the rate limiter's "batch" lane, behind interactive generations.
+    """
+    with priority("batch"), trace_request("email_fanout"):
+        return await _fanout(user_text, recipients, llm, touch_up, concurrency, on_step, mode, rewrite_mode, max_retries)
+
+async def _fanout(
+    user_text: str,
+    recipients: List[Dict[str, Any]],
+    llm,
+    touch_up: str,
+    concurrency: int,
+    on_step: Optional[StepCallback],
+    mode: str,
+    rewrite_mode: str,
+    max_retries: int,
+) -> Dict[str, Any]:
+    if touch_up not in TOUCH_UP_POLICIES:
+        raise ValueError(f"touch_up must be one of {TOUCH_UP_POLICIES}")
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    stats = FanoutStats(recipients=len(recipients))
+    if not recipients:
+        stats.finished_at = time.perf_counter()
+        return {"template": None, "results": [], "stats": stats.summary()}
+    llm = llm or get_model_router()
+
+    state = await abuild_template(user_text, recipients[0], llm, on_step=on_step, mode=mode,
+                                  rewrite_mode=rewrite_mode, max_retries=max_retries)
+    stats.template_llm_calls = run_summary(state["flow"])["llm_calls"]
+
+    results = []
+    for index, (recipient, rendered) in enumerate(zip(recipients, personalize_recipients(state, recipients))):
+        flags = touch_up_reasons(recipient, rendered["missing"])
+        stats.flagged += bool(flags)
+        results.append({
+            "id": recipient.get("id") or recipient.get("email") or index,
+            "recipient": recipient,
+            **rendered["personalized_draft"],
+            "flags": flags,
+            "touched_up": False,
+        })
+
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def polish(record: Dict[str, Any]) -> None:
+        async with slots:
+            draft = {"subject": record["subject"], "body": record["body"]}
+            with step_metrics("touch_up") as metrics:
+                try:
+                    res = await atouch_up_agent(
+                        {"personalized_draft": draft, "recipient": record["recipient"], "flags": record["flags"]}, llm_for(llm, "touch_up"))
+                except Exception as exc:
+                    record["touch_up_error"] = f"{type(exc).__name__}: {exc}"
+                    stats.touch_up_failed += 1
+                    return
+            stats.touch_up_llm_calls += metrics.llm_calls
+        record.update(res["personalized_draft"], touched_up=True)
+        stats.touched_up += 1
+
+    if touch_up != "none":
+        await asyncio.gather(*(polish(r) for r in results if touch_up == "all" or r["flags"]))
+    stats.finished_at = time.perf_counter()
+    return {"template": state, "results": results, "stats": stats.summary()}
+
+def run_fanout(
+    user_text: str,
+    recipients: List[Dict[str, Any]],
+    llm=None,
+    touch_up: str = "flagged",
+    concurrency: int = 8,
+    on_step: Optional[StepCallback] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+) -> Dict[str, Any]:
+    return run_sync(arun_fanout(
+        user_text, recipients, llm=llm, touch_up=touch_up, concurrency=concurrency, on_step=on_step,
+        mode=mode, rewrite_mode=rewrite_mode, max_retries=max_retries,
+    ))
+
+# ===========================
+# CLI
+# ===========================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Draft one email and personalize it for every recipient in a CSV.")
+    parser.add_argument("recipients", help="CSV with a header row ('-' for stdin)")
+    prompt = parser.add_mutually_exclusive_group(required=True)
+    prompt.add_argument("--prompt", help="intent prompt")
+    prompt.add_argument("--prompt-file", help="file containing the intent prompt")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file ('-' for stdout)")
+    parser.add_argument("--touch-up", choices=TOUCH_UP_POLICIES, default="flagged",
+                        help="which recipients get an LLM touch-up pass")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="touch-up calls in flight")
+    parser.add_argument("--mode", choices=MODES, default="pipeline",
+                        help="'fused' does intent, draft and review in one LLM call")
+    args = parser.parse_args(argv)
+
+    user_text = args.prompt
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            user_text = f.read()
+    src = sys.stdin if args.recipients == "-" else open(args.recipients, "r", encoding="utf-8", newline="")
+    try:
+        recipients = list(read_recipients(src))
+    finally:
+        if src is not sys.stdin:
+            src.close()
+
+    result = run_fanout(user_text, recipients, touch_up=args.touch_up, concurrency=args.concurrency, mode=args.mode)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for record in result["results"]:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(json.dumps(result["stats"]), file=sys.stderr)
+    return 1 if result["stats"]["touch_up_failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
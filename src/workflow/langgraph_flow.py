@@ -3,12 +3,19 @@
 langgraph_flow.py
 
 Wires agents into a LangGraph StateGraph and exposes a run_email_workflow helper.
-Uses OpenAI LLM for email drafting workflow.
+Each agent uses the OpenAI model configured for it in integrations/model_routing.py.
+
+Importing this module has no side effects: the graph's LLM client, the
+compiled `email_planner` and its checkpointer are created on first use, and
+`LLM`, `workflow`, `checkpointer` and `email_planner` stay available as module
+attributes. run_email_workflow never builds the graph.
 """
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_core.messages import HumanMessage, BaseMessage
-from typing import TypedDict, List, Optional
+import asyncio
+import os
+import threading
+import time
+from langchain_core.messages import BaseMessage
+from typing import Any, Callable, Dict, TypedDict, List, Optional
 
 from agents.agents import (
     input_parser_agent,
@@ -17,10 +24,20 @@ from agents.agents import (
     draft_writer_agent,
     personalization_agent,
     review_agent,
-    router_agent
+    router_agent,
+    aintent_detection_agent,
+    adraft_writer_agent,
+    areview_agent,
+    afused_generation_agent,
+    rewrite_agent,
+    arewrite_agent,
+    REWRITE_MODES,
 )
-from integrations.llm_client import make_openai_llm
-from memory.json_memory import get_profile, upsert_profile
+from integrations.metrics import current_step
+from integrations.model_routing import ModelRouter, cascade_report, escalation_reason, get_model_router, llm_for
+from integrations.tracing import trace_request
+from memory.json_memory import append_sent_example, get_profile, retrieve_style_examples
+from workflow.scheduler import Step, StepCallback, run_dag, run_sync
 
 # ===========================
 # Workflow state
@@ -35,24 +52,40 @@ class EmailState(TypedDict):
     personalized_draft: dict
     review: dict
     user_profile: dict
-    next_agent: Optional[str]
+    style_examples: list
+    route: str
+    issues: list
+    retry_count: int
+    rewrite: dict
+    rewrite_stats: dict
 
 # ===========================
-# Instantiate OpenAI LLM
+# Per-agent LLMs (created on first use)
 # ===========================
-LLM = make_openai_llm(model="gpt-3.5-turbo", temperature=0.15)
+_GRAPH_LOCK = threading.RLock()
+_LAZY: Dict[str, Any] = {}
+
+def get_graph_llm(agent: str = "draft_writer"):
+    """LLM used by a graph node, per the agent's model in integrations/model_routing.py."""
+    return get_model_router().for_agent(agent)
+
+# Review -> rewrite loop: at most MAX_REWRITES revisions per email, each done as
+# a targeted edit of the current draft unless REWRITE_MODE says otherwise
+# ("targeted", "edit_only" or "redraft"; see rewrite_agent).
+MAX_REWRITES = int(os.environ.get("MAX_REWRITES", "3"))
+REWRITE_MODE = os.environ.get("REWRITE_MODE", "targeted")
 
 # ===========================
 # Workflow nodes
 # ===========================
 def node_input_parser(state: EmailState):
     res = input_parser_agent(state)
-    state["user_profile"] = get_profile("default")
+    state["user_profile"] = get_profile("default", include_history=False)
     state.update(res)
     return {"messages": state.get("messages"), **res}
 
 def node_intent_detection(state: EmailState):
-    res = intent_detection_agent(state, LLM)
+    res = intent_detection_agent(state, get_graph_llm("intent_detection"))
     state.update(res)
     return {"messages": state.get("messages"), **res}
 
@@ -61,100 +94,322 @@ def node_tone_stylist(state: EmailState):
     state.update(res)
     return {"messages": state.get("messages"), **res}
 
+def style_retrieval(state) -> Dict[str, Any]:
+    """Few-shot style examples: similar past sent emails within a token budget."""
+    parsed = state.get("parsed") or {}
+    examples = retrieve_style_examples("default", parsed.get("prompt_text", ""), intent=state.get("intent"))
+    return {"style_examples": [{"subject": ex["subject"], "body": ex["body"]} for ex in examples]}
+
 def node_draft_writer(state: EmailState):
-    res = draft_writer_agent(state, LLM)
+    if "style_examples" not in state:
+        state.update(style_retrieval(state))
+    res = draft_writer_agent(state, get_graph_llm())
     state.update(res)
     return {"messages": state.get("messages"), **res}
 
 def node_personalization(state: EmailState):
     res = personalization_agent(state)
     state.update(res)
-    profile = state.get("user_profile", {})
-    profile.setdefault("sent_examples", []).append(state.get("personalized_draft"))
-    upsert_profile("default", profile)
     return {"messages": state.get("messages"), **res}
 
 def node_review(state: EmailState):
-    res = review_agent(state, LLM)
+    res = review_agent(state, get_graph_llm("review"))
     state.update(res)
     return {"messages": state.get("messages"), **res}
 
 def node_router(state: EmailState):
-    res = router_agent(state)
+    res = router_agent(state, max_retries=MAX_REWRITES)
+    state.update(res)
+    return {"messages": state.get("messages"), **res}
+
+def node_rewrite(state: EmailState):
+    res = rewrite_agent(state, get_graph_llm("rewrite"), mode=REWRITE_MODE)
     state.update(res)
-    return {"messages": state.get("messages"), "next_agent": state.get("next_agent")}
+    return {"messages": state.get("messages"), **res}
 
 def node_end(state: EmailState):
-    """Dummy end node."""
+    """Stores the final draft once review and rewrites are done."""
+    # Store the intent with the draft so the local intent classifier can train on it
+    example = {**state.get("personalized_draft", {}), "intent": state.get("intent")}
+    append_sent_example("default", example)
     return {"messages": state.get("messages")}
 
-# ===========================
-# Build workflow
-# ===========================
-workflow = StateGraph(EmailState)
-
-workflow.add_node("input_parser", node_input_parser)
-workflow.add_node("intent_detection", node_intent_detection)
-workflow.add_node("tone_stylist", node_tone_stylist)
-workflow.add_node("draft_writer", node_draft_writer)
-workflow.add_node("personalization", node_personalization)
-workflow.add_node("review", node_review)
-workflow.add_node("router", node_router)
-workflow.add_node("end", node_end)
-
-workflow.set_entry_point("input_parser")
-workflow.add_edge("input_parser", "intent_detection")
-workflow.add_edge("intent_detection", "tone_stylist")
-workflow.add_edge("tone_stylist", "draft_writer")
-workflow.add_edge("draft_writer", "personalization")
-workflow.add_edge("personalization", "review")
-workflow.add_edge("review", "router")
-
 # ===========================
 # Router logic
 # ===========================
 def router_decision(state: EmailState):
-    nxt = state.get("next_agent")
-    if nxt == "rewrite":
-        return "draft_writer"
+    if state.get("route") == "rewrite":
+        return "rewrite"
     return "end"
 
-workflow.add_conditional_edges(
-    "router",
-    router_decision,
-    {
-        "draft_writer": "draft_writer",
-        "end": "end"
-    }
-)
+# ===========================
+# Build workflow
+# ===========================
+def build_workflow():
+    from langgraph.graph import StateGraph
+
+    workflow = StateGraph(EmailState)
+
+    workflow.add_node("input_parser", node_input_parser)
+    workflow.add_node("intent_detection", node_intent_detection)
+    workflow.add_node("tone_stylist", node_tone_stylist)
+    workflow.add_node("draft_writer", node_draft_writer)
+    workflow.add_node("personalization", node_personalization)
+    workflow.add_node("review", node_review)
+    workflow.add_node("router", node_router)
+    workflow.add_node("rewrite", node_rewrite)
+    workflow.add_node("end", node_end)
+
+    workflow.set_entry_point("input_parser")
+    workflow.add_edge("input_parser", "intent_detection")
+    workflow.add_edge("intent_detection", "tone_stylist")
+    workflow.add_edge("tone_stylist", "draft_writer")
+    workflow.add_edge("draft_writer", "personalization")
+    workflow.add_edge("personalization", "review")
+    workflow.add_edge("review", "router")
+    # A rewrite edits the current draft, so it re-enters at personalization.
+    workflow.add_edge("rewrite", "personalization")
+
+    workflow.add_conditional_edges(
+        "router",
+        router_decision,
+        {
+            "rewrite": "rewrite",
+            "end": "end"
+        }
+    )
+    return workflow
 
 # ===========================
 # Checkpointer
 # ===========================
-checkpointer = InMemorySaver()
-email_planner = workflow.compile(checkpointer=checkpointer)
+def make_checkpointer():
+    """SQLite-backed and bounded (see checkpoints.py); CHECKPOINTER=memory keeps the old in-process saver."""
+    if os.environ.get("CHECKPOINTER", "sqlite").lower() == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    from workflow.checkpoints import BoundedSqliteSaver
+    return BoundedSqliteSaver.from_path()
+
+def get_email_planner():
+    """The compiled graph, built and compiled once on first use."""
+    with _GRAPH_LOCK:
+        if "email_planner" not in _LAZY:
+            _LAZY["workflow"] = build_workflow()
+            _LAZY["checkpointer"] = make_checkpointer()
+            _LAZY["email_planner"] = _LAZY["workflow"].compile(checkpointer=_LAZY["checkpointer"])
+        return _LAZY["email_planner"]
+
+_LAZY_ATTRS = {
+    "LLM": get_graph_llm,
+    "email_planner": get_email_planner,
+    "workflow": lambda: (get_email_planner(), _LAZY["workflow"])[1],
+    "checkpointer": lambda: (get_email_planner(), _LAZY["checkpointer"])[1],
+}
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def resume_graph_run(thread_id: str) -> Dict[str, Any]:
+    """
+    Continues an interrupted email_planner run from its last completed node;
+    nodes that already finished (and their LLM calls) are not run again.
+    Returns the final state, or the stored one if the run had completed.
+    """
+    email_planner = get_email_planner()
+    config = {"configurable": {"thread_id": thread_id}}
+    snapshot = email_planner.get_state(config)
+    if not snapshot.next:
+        return snapshot.values
+    return email_planner.invoke(None, config=config)
 
 # ===========================
 # Run workflow helper
 # ===========================
-def run_email_workflow(user_text: str):
-    state = {"messages": [{"content": user_text}], "flow": []}
-    
-    # Agents called in order
-    agents = [
-        ("input_parser_agent", input_parser_agent),
-        ("intent_detection_agent", lambda s: intent_detection_agent(s, llm=make_openai_llm())),
-        ("tone_stylist_agent", tone_stylist_agent),
-        ("draft_writer_agent", lambda s: draft_writer_agent(s, llm=make_openai_llm())),
-        ("personalization_agent", personalization_agent),
-        ("review_agent", lambda s: review_agent(s, llm=make_openai_llm())),
-        ("router_agent", router_agent)
+MODES = ("pipeline", "fused")
+
+def _flow_metrics(state: Dict[str, Any], step: str) -> Dict[str, Any]:
+    for entry in reversed(state.get("flow") or []):
+        if entry.get("agent") == step:
+            return entry.get("metrics") or {}
+    return {}
+
+async def cascade_escalation(
+    state: Dict[str, Any],
+    router: ModelRouter,
+    on_draft: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Cascade mode: keeps the fast model's draft unless the review gate rejected
+    it or its JSON fell back, in which case the strong model drafts again and
+    the new draft is personalized and reviewed. state["cascade"] records the
+    decision and the latency / cost of both drafts.
+    """
+    reason = escalation_reason(state)
+    fast = _flow_metrics(state, "draft_writer_agent")
+    if reason is None:
+        return {"cascade": cascade_report(router, None, fast)}
+    record = current_step()
+    tokens = (record.prompt_tokens, record.completion_tokens) if record else (0, 0)
+    started = time.perf_counter()
+    out = await adraft_writer_agent(state, router.strong_llm(), on_partial=on_draft)
+    strong = {
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+        "prompt_tokens": record.prompt_tokens - tokens[0] if record else 0,
+        "completion_tokens": record.completion_tokens - tokens[1] if record else 0,
+    }
+    escalated = {**state, **out}
+    out.update(personalization_agent(escalated))
+    escalated.update(out)
+    out.update(await areview_agent(escalated, router.for_agent("review")))
+    out["cascade"] = cascade_report(router, reason, fast, strong)
+    return out
+
+def build_email_steps(
+    llm,
+    on_draft: Optional[Callable[[Dict[str, str]], None]] = None,
+    mode: str = "pipeline",
+    max_retries: int = MAX_REWRITES,
+    cascade: Optional[bool] = None,
+) -> List[Step]:
+    """
+    Agent DAG used by run_email_workflow. Intent detection and tone styling
+    both only need the parsed prompt, so they run side by side. `on_draft`
+    receives the text added to the draft's subject/body while it is being
+    written (see agents._stream_fields).
+
+    `llm` is a ModelRouter (each agent gets its configured model) or a single
+    chat model used by every agent. With a router in cascade mode a
+    cascade_escalation step runs after the review (pipeline mode only;
+    cascade=False leaves it out).
+
+    mode="fused" replaces intent detection, drafting and review with a single
+    structured-output call; the resulting state has the same keys.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if mode == "fused":
+        return [
+            Step("input_parser_agent", input_parser_agent),
+            Step("tone_stylist_agent", tone_stylist_agent, ("input_parser_agent",)),
+            Step("style_retrieval", style_retrieval, ("input_parser_agent",)),
+            Step("fused_generation_agent", lambda s: afused_generation_agent(s, llm_for(llm, "fused_generation")),
+                 ("tone_stylist_agent", "style_retrieval")),
+            Step("personalization_agent", personalization_agent, ("fused_generation_agent",)),
+            Step("router_agent", lambda s: router_agent(s, max_retries=max_retries), ("personalization_agent",)),
+        ]
+    steps = [
+        Step("input_parser_agent", input_parser_agent),
+        Step("intent_detection_agent", lambda s: aintent_detection_agent(s, llm_for(llm, "intent_detection")),
+             ("input_parser_agent",)),
+        Step("tone_stylist_agent", tone_stylist_agent, ("input_parser_agent",)),
+        Step("style_retrieval", style_retrieval, ("intent_detection_agent",)),
+        Step("draft_writer_agent", lambda s: adraft_writer_agent(s, llm_for(llm, "draft_writer"), on_partial=on_draft),
+             ("intent_detection_agent", "tone_stylist_agent", "style_retrieval")),
+        Step("personalization_agent", personalization_agent, ("draft_writer_agent",)),
+        Step("review_agent", lambda s: areview_agent(s, llm_for(llm, "review")), ("personalization_agent",)),
     ]
-    
-    for name, fn in agents:
-        output = fn(state)
-        state.update(output)
-        state["flow"].append({"agent": name, "output": output})
-    
+    if cascade is not False and isinstance(llm, ModelRouter) and llm.cascade:
+        steps.append(Step("cascade_escalation", lambda s: cascade_escalation(s, llm, on_draft), ("review_agent",)))
+    steps.append(Step("router_agent", lambda s: router_agent(s, max_retries=max_retries), (steps[-1].name,)))
+    return steps
+
+def build_rewrite_steps(llm, rewrite_mode: str = REWRITE_MODE, max_retries: int = MAX_REWRITES) -> List[Step]:
+    """One pass of the review loop: revise the draft, then personalize, review and route again."""
+    if rewrite_mode not in REWRITE_MODES:
+        raise ValueError(f"rewrite_mode must be one of {REWRITE_MODES}")
+    return [
+        Step("rewrite_agent", lambda s: arewrite_agent(s, llm_for(llm, "rewrite"), mode=rewrite_mode)),
+        Step("personalization_agent", personalization_agent, ("rewrite_agent",)),
+        Step("review_agent", lambda s: areview_agent(s, llm_for(llm, "review")), ("personalization_agent",)),
+        Step("router_agent", lambda s: router_agent(s, max_retries=max_retries), ("review_agent",)),
+    ]
+
+async def arun_email_workflow(
+    user_text: str,
+    llm=None,
+    on_step: Optional[StepCallback] = None,
+    on_draft: Optional[Callable[[Dict[str, str]], None]] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+    run_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Runs the agent DAG, then the review loop: while the router asks for a
+    rewrite (at most `max_retries` times) the draft is revised with
+    rewrite_agent and reviewed again. state["rewrite_stats"] reports the
+    tokens used and saved compared with full redrafts.
+
+    With a `run_id` the state is checkpointed after every step (see
+    checkpoints.py). Calling again with the same run_id resumes an
+    interrupted run from its last completed step, or returns the stored
+    result of a finished one.
+    """
+    with trace_request("email_workflow"):
+        return await _email_workflow(user_text, llm, on_step, on_draft, mode, rewrite_mode, max_retries, run_id)
+
+async def _email_workflow(
+    user_text: str,
+    llm,
+    on_step: Optional[StepCallback],
+    on_draft: Optional[Callable[[Dict[str, str]], None]],
+    mode: str,
+    rewrite_mode: str,
+    max_retries: int,
+    run_id: Optional[str],
+) -> Dict[str, Any]:
+    checkpoints = saved = None
+    if run_id:
+        # Opening the database and reading the run are blocking SQLite calls; keep them off the loop.
+        from workflow.checkpoints import get_run_checkpoints
+        checkpoints = await asyncio.to_thread(get_run_checkpoints)
+        saved = await asyncio.to_thread(checkpoints.load, run_id)
+    if saved and saved["status"] == "done":
+        return saved["state"]
+    if saved:
+        state, phase, completed = saved["state"], saved["phase"], saved["done"]
+    else:
+        state, phase, completed = {"messages": [{"content": user_text}], "flow": [], "mode": mode}, 0, set()
+    llm = llm or get_model_router()
+
+    def step_hook(current_phase: int, done: set) -> StepCallback:
+        def hook(name: str, output: Dict[str, Any]) -> None:
+            done.add(name)
+            if checkpoints:
+                checkpoints.save(run_id, current_phase, done, state)
+            if on_step:
+                on_step(name, output)
+        return hook
+
+    if phase == 0:
+        done = set(completed)
+        steps = build_email_steps(llm, on_draft=on_draft, mode=state.get("mode", mode), max_retries=max_retries)
+        await run_dag(steps, state, on_step=step_hook(0, done), completed=done)
+        phase, completed = 1, set()
+    while state.get("route") == "rewrite":
+        done = set(completed)
+        await run_dag(build_rewrite_steps(llm, rewrite_mode, max_retries), state,
+                      on_step=step_hook(phase, done), completed=done)
+        phase, completed = phase + 1, set()
+    if checkpoints:
+        checkpoints.finish(run_id, state)
+        await asyncio.to_thread(checkpoints.flush)
     return state
 
+def run_email_workflow(
+    user_text: str,
+    llm=None,
+    on_step: Optional[StepCallback] = None,
+    on_draft: Optional[Callable[[Dict[str, str]], None]] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+    run_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    return run_sync(arun_email_workflow(
+        user_text, llm=llm, on_step=on_step, on_draft=on_draft, mode=mode,
+        rewrite_mode=rewrite_mode, max_retries=max_retries, run_id=run_id,
+    ))
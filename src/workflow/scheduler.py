@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+scheduler.py
+
+Minimal asyncio DAG scheduler for the agent pipeline. Each step declares the
+steps it depends on and starts as soon as all of them have finished, so
+independent agents (e.g. intent detection and tone styling) overlap and the
+end-to-end latency is the critical path through the graph.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from integrations.metrics import StepRecord, run_summary, step_metrics
+
+StepFn = Callable[[Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+StepCallback = Callable[[str, Dict[str, Any]], None]
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    fn: StepFn
+    requires: Tuple[str, ...] = ()
+
+def validate_steps(steps: Sequence[Step]) -> None:
+    """Raises ValueError on duplicate names, unknown dependencies or cycles."""
+    names = [step.name for step in steps]
+    if len(names) != len(set(names)):
+        raise ValueError("duplicate step names in pipeline")
+    known = set(names)
+    for step in steps:
+        missing = [dep for dep in step.requires if dep not in known]
+        if missing:
+            raise ValueError(f"step {step.name!r} depends on unknown steps {missing}")
+
+    # Kahn's algorithm: everything must be reachable in topological order.
+    pending = {step.name: set(step.requires) for step in steps}
+    while pending:
+        ready = [name for name, deps in pending.items() if not deps]
+        if not ready:
+            raise ValueError(f"cycle detected between steps {sorted(pending)}")
+        for name in ready:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(ready)
+
+async def _call(step: Step, state: Dict[str, Any]) -> Tuple[Dict[str, Any], StepRecord]:
+    # Runs inside the step's own task, so the metrics context stays per step
+    # even when steps overlap.
+    with step_metrics(step.name) as record:
+        result = step.fn(state)
+        if inspect.isawaitable(result):
+            result = await result
+    return result or {}, record
+
+async def run_dag(
+    steps: Sequence[Step],
+    state: Dict[str, Any],
+    on_step: Optional[StepCallback] = None,
+    completed: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """
+    Runs `steps` against `state`, starting each one as soon as its dependencies
+    are done. Step outputs are merged into `state` and appended to state["flow"]
+    in completion order, each with its latency/token metrics; state["run_metrics"]
+    holds the totals. Sync steps run inline on the loop (the local agents are
+    pure CPU and microseconds long); async steps run concurrently as tasks.
+
+    Steps named in `completed` are treated as already done (their outputs are
+    expected in `state`), which is how a checkpointed run resumes.
+    """
+    validate_steps(steps)
+    state.setdefault("flow", [])
+    done: set = set(completed)
+    running: Dict[asyncio.Task, Step] = {}
+    waiting: List[Step] = [step for step in steps if step.name not in done]
+
+    def launch_ready() -> None:
+        for step in list(waiting):
+            if all(dep in done for dep in step.requires):
+                waiting.remove(step)
+                running[asyncio.ensure_future(_call(step, state))] = step
+
+    launch_ready()
+    try:
+        while running:
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                step = running.pop(task)
+                output, record = task.result()
+                state.update(output)
+                state["flow"].append({"agent": step.name, "output": output, "metrics": record.as_dict()})
+                done.add(step.name)
+                if on_step:
+                    on_step(step.name, output)
+            launch_ready()
+    finally:
+        for task in running:
+            task.cancel()
+    state["run_metrics"] = run_summary(state["flow"])
+    return state
+
+# ===========================
+# Shared background loop
+# ===========================
+# Sync callers (run_email_workflow, Streamlit reruns, worker threads) submit
+# their pipelines to one long-lived loop instead of calling asyncio.run each
+# time, so the loop-bound async HTTP pool in integrations.llm_client keeps its
+# connections alive between runs.
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_THREAD: Optional[threading.Thread] = None
+_LOOP_LOCK = threading.Lock()
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP, _LOOP_THREAD
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            _LOOP = asyncio.new_event_loop()
+            _LOOP_THREAD = threading.Thread(target=_LOOP.run_forever, name="email-pipeline-loop", daemon=True)
+            _LOOP_THREAD.start()
+        return _LOOP
+
+# Coroutines submitted and not finished yet (the loop is "busy" while > 0).
+_IN_FLIGHT = 0
+
+def in_flight() -> int:
+    return _IN_FLIGHT
+
+async def _in_context(coro: Coroutine[Any, Any, Any], ctx: contextvars.Context) -> Any:
+    global _IN_FLIGHT
+    for var, value in ctx.items():
+        var.set(value)
+    # Only ever changed on the loop thread, so no lock is needed.
+    _IN_FLIGHT += 1
+    try:
+        return await coro
+    finally:
+        _IN_FLIGHT -= 1
+
+def submit(coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+    """
+    Schedules `coro` on the shared background loop and returns a thread-safe
+    future. The caller's context variables (e.g. the rate limiter's priority
+    lane) are carried over to the loop.
+    """
+    if threading.current_thread() is _LOOP_THREAD:
+        coro.close()
+        raise RuntimeError("submit() called from the pipeline loop itself; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), background_loop())
+
+def run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Runs `coro` on the shared background loop and blocks until it finishes."""
+    return submit(coro).result()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+service.py
+
+Standalone asyncio HTTP entry point around run_email_workflow, for calling the
+generator from other services (stdlib only, no web framework).
+
+- Identical in-flight requests (same prompt and mode) share one pipeline run.
+- At most `concurrency` runs execute at once; up to `max_queue` more wait.
+  Beyond that new requests get 429 with a Retry-After header.
+- Each request waits at most `timeout` seconds (504); a run nobody is waiting
+  for any more is cancelled.
+- GET /metrics exposes queue / in-flight gauges plus the per-agent and LLM
+  rate-limiter metrics.
+
+Usage (from src/):
+    python -m workflow.service --port 8080 --concurrency 8 --max-queue 64 --timeout 60
+    python -m workflow.service --fake --fake-latency-ms 200      # offline, FakeChatOpenAI
+
+    curl -s localhost:8080/generate -d '{"prompt": "Follow up with Sam about the proposal"}'
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+MAX_BODY_BYTES = 64 * 1024
+
+class Overloaded(Exception):
+    """The queue is full; the caller should retry later."""
+
+def request_key(prompt: str, mode: str) -> str:
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{mode}\n{normalized}".encode("utf-8")).hexdigest()
+
+def response_body(state: Dict[str, Any]) -> Dict[str, Any]:
+    draft = state.get("personalized_draft") or state.get("draft") or {}
+    return {
+        "subject": draft.get("subject", ""),
+        "body": draft.get("body", ""),
+        "intent": state.get("intent"),
+        "tone": state.get("tone"),
+        "review": state.get("review"),
+        "rewrite_stats": state.get("rewrite_stats"),
+        "run_metrics": state.get("run_metrics"),
+    }
+
+# ===========================
+# Coalescing, bounded runner
+# ===========================
+@dataclass
+class _Run:
+    task: asyncio.Task
+    waiters: int = 0
+
+@dataclass
+class ServiceStats:
+    requests: int = 0
+    coalesced: int = 0
+    rejected: int = 0
+    timeouts: int = 0
+    completed: int = 0
+    errors: int = 0
+    queued: int = 0
+    running: int = 0
+    latency_sum_s: float = 0.0
+    started_at: float = field(default_factory=time.time)
+
+class GenerationService:
+    def __init__(
+        self,
+        workflow: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+        concurrency: int = 8,
+        max_queue: int = 64,
+        timeout: float = 60.0,
+    ):
+        if workflow is None:
+            from workflow.langgraph_flow import arun_email_workflow
+            workflow = arun_email_workflow
+        self.workflow = workflow
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.stats = ServiceStats()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._runs: Dict[str, _Run] = {}
+
+    def gauges(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "queue_depth": s.queued,
+            "in_flight": s.running,
+            "distinct_runs": len(self._runs),
+            "waiters": sum(run.waiters for run in self._runs.values()),
+            "requests_total": s.requests,
+            "coalesced_total": s.coalesced,
+            "rejected_total": s.rejected,
+            "timeouts_total": s.timeouts,
+            "completed_total": s.completed,
+            "errors_total": s.errors,
+            "run_seconds_sum": round(s.latency_sum_s, 3),
+        }
+
+    async def _execute(self, prompt: str, mode: str) -> Dict[str, Any]:
+        self.stats.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats.queued -= 1
+        self.stats.running += 1
+        start = time.perf_counter()
+        try:
+            state = await self.workflow(prompt, mode=mode)
+            self.stats.completed += 1
+            return state
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            self.stats.latency_sum_s += time.perf_counter() - start
+            self.stats.running -= 1
+            self._slots.release()
+
+    async def generate(self, prompt: str, mode: str = "pipeline") -> Tuple[Dict[str, Any], bool]:
+        """(final state, whether this request joined an existing run)."""
+        self.stats.requests += 1
+        key = request_key(prompt, mode)
+        run = self._runs.get(key)
+        coalesced = run is not None
+        if coalesced:
+            self.stats.coalesced += 1
+        else:
+            # Counted synchronously: queued runs have not started their task yet.
+            if len(self._runs) >= self.concurrency + self.max_queue:
+                self.stats.rejected += 1
+                raise Overloaded()
+            run = _Run(asyncio.ensure_future(self._execute(prompt, mode)))
+            self._runs[key] = run
+            run.task.add_done_callback(lambda _t, key=key, run=run: self._forget(key, run))
+        run.waiters += 1
+        try:
+            state = await asyncio.wait_for(asyncio.shield(run.task), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            run.waiters -= 1
+            if run.waiters == 0 and not run.task.done():
+                run.task.cancel()
+        return state, coalesced
+
+    def _forget(self, key: str, run: _Run) -> None:
+        if self._runs.get(key) is run:
+            del self._runs[key]
+        if run.task.cancelled():
+            return
+        # Retrieve the exception so an unawaited failure is not logged as lost.
+        run.task.exception()
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for name, value in self.gauges().items():
+            kind = "counter" if name.endswith(("_total", "_sum")) else "gauge"
+            lines.append(f"# TYPE email_service_{name} {kind}")
+            lines.append(f"email_service_{name} {value}")
+        from integrations.metrics import REGISTRY
+        from integrations.rate_limiter import get_rate_limiter
+        return "\n".join(lines) + "\n" + REGISTRY.prometheus_text() + get_rate_limiter().prometheus_text()
+
+# ===========================
+# HTTP
+# ===========================
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           429: "Too Many Requests", 500: "Internal Server Error", 504: "Gateway Timeout"}
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("empty request")
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("payload too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+def _response(status: int, payload: Any, content_type: str = "application/json",
+              extra_headers: Optional[Dict[str, str]] = None) -> bytes:
+    body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload, default=str).encode("utf-8")
+    headers = {"Content-Type": content_type, "Content-Length": str(len(body)), "Connection": "close",
+               **(extra_headers or {})}
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    return head.encode("latin-1") + b"\r\n" + body
+
+async def handle_request(service: GenerationService, method: str, path: str, body: bytes) -> bytes:
+    if path == "/healthz":
+        return _response(200, {"ok": True})
+    if path == "/stats":
+        return _response(200, service.gauges())
+    if path == "/metrics":
+        return _response(200, service.prometheus_text(), "text/plain; version=0.0.4")
+    if path != "/generate":
+        return _response(404, {"error": "not found"})
+    if method != "POST":
+        return _response(405, {"error": "use POST"})
+    try:
+        payload = json.loads(body or b"{}")
+        prompt = str(payload.get("prompt") or payload.get("text") or "").strip()
+        mode = payload.get("mode", "pipeline")
+    except (ValueError, AttributeError):
+        return _response(400, {"error": "body must be a JSON object"})
+    if not prompt:
+        return _response(400, {"error": "missing prompt"})
+    from workflow.langgraph_flow import MODES
+    if mode not in MODES:
+        return _response(400, {"error": f"mode must be one of {MODES}"})
+    try:
+        state, coalesced = await service.generate(prompt, mode)
+    except Overloaded:
+        # Roughly how long until a queue slot frees up.
+        retry_after = max(1, int(service.timeout / max(service.concurrency, 1)))
+        return _response(429, {"error": "queue full"}, extra_headers={"Retry-After": str(retry_after)})
+    except asyncio.TimeoutError:
+        return _response(504, {"error": f"timed out after {service.timeout}s"})
+    except Exception as exc:
+        return _response(500, {"error": f"{type(exc).__name__}: {exc}"})
+    return _response(200, {**response_body(state), "coalesced": coalesced})
+
+async def serve(service: GenerationService, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, _, body = await _read_request(reader)
+            except ValueError as exc:
+                status = 413 if "too large" in str(exc) else 400
+                writer.write(_response(status, {"error": str(exc)}))
+            else:
+                writer.write(await handle_request(service, method, path, body))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="HTTP email generation service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Pipeline runs executing at once.")
+    parser.add_argument("--max-queue", type=int, default=64, help="Runs allowed to wait; beyond this -> 429.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds (504).")
+    parser.add_argument("--fake", action="store_true", help="Use the offline FakeChatOpenAI.")
+    parser.add_argument("--fake-latency-ms", type=float, default=0.0)
+    parser.add_argument("--fake-jitter-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        os.environ["LLM_FAKE"] = "1"
+        os.environ["LLM_FAKE_LATENCY_MS"] = str(args.fake_latency_ms)
+        os.environ["LLM_FAKE_JITTER_MS"] = str(args.fake_jitter_ms)
+
+    async def run() -> None:
+        service = GenerationService(concurrency=args.concurrency, max_queue=args.max_queue, timeout=args.timeout)
+        server = await serve(service, args.host, args.port)
+        print(f"Serving on http://{args.host}:{args.port} (POST /generate, GET /metrics, /stats, /healthz)")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+variants.py
+
+Multi-tone variants: one prompt, a finished email per tone. The steps that do
+not depend on the tone (input parsing, intent detection, style retrieval) run
+once; tone styling, drafting, personalization, review and the review loop
+then run for every tone in parallel on copies of that shared state. Each
+variant is a complete run_email_workflow state, so a UI can switch between
+tones, or show them side by side, without further LLM calls.
+
+Usage (from src/):
+    python -m workflow.variants --prompt "Follow up with Alice about Tuesday's meeting"
+    python -m workflow.variants --prompt-file intent.txt --tones formal,casual -o variants.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from agents.agents import get_tone_samples
+from integrations.metrics import run_summary
+from integrations.model_routing import get_model_router
+from integrations.tracing import trace_request
+from workflow.langgraph_flow import MAX_REWRITES, MODES, REWRITE_MODE, build_email_steps, build_rewrite_steps
+from workflow.scheduler import StepCallback, run_dag, run_sync
+
+TONES = ("formal", "casual", "assertive")
+
+# Steps whose output is the same for every tone.
+SHARED_STEPS = ("input_parser_agent", "intent_detection_agent", "style_retrieval")
+
+async def _variant(
+    shared: Dict[str, Any],
+    tone: str,
+    llm,
+    on_step: Optional[StepCallback],
+    mode: str,
+    rewrite_mode: str,
+    max_retries: int,
+) -> Dict[str, Any]:
+    state = {
+        **shared,
+        "parsed": {**(shared.get("parsed") or {}), "preferred_tone": tone},
+        "flow": [],
+        "mode": mode,
+    }
+    hook = (lambda name, output: on_step(f"{name} [{tone}]", output)) if on_step else None
+    steps = build_email_steps(llm, mode=mode, max_retries=max_retries)
+    completed = [step.name for step in steps if step.name in SHARED_STEPS]
+    await run_dag(steps, state, on_step=hook, completed=completed)
+    while state.get("route") == "rewrite":
+        await run_dag(build_rewrite_steps(llm, rewrite_mode, max_retries), state, on_step=hook)
+    return state
+
+async def arun_tone_variants(
+    user_text: str,
+    llm=None,
+    tones: Sequence[str] = TONES,
+    on_step: Optional[StepCallback] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+) -> Dict[str, Any]:
+    """
+    Returns {"shared", "variants", "stats"}. `variants` maps each tone to its
+    final state (personalized_draft, review, flow, run_metrics, ...); `shared`
+    is the state of the tone-independent steps, whose LLM calls are counted
+    once in stats["llm_calls"].
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    unknown = [tone for tone in tones if tone not in get_tone_samples()]
+    if unknown:
+        raise ValueError(f"Unknown tones {unknown}; choose from {sorted(get_tone_samples())}")
+    with trace_request("tone_variants"):
+        return await _tone_variants(user_text, llm or get_model_router(), tones, on_step, mode, rewrite_mode, max_retries)
+
+async def _tone_variants(
+    user_text: str,
+    llm,
+    tones: Sequence[str],
+    on_step: Optional[StepCallback],
+    mode: str,
+    rewrite_mode: str,
+    max_retries: int,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+
+    shared: Dict[str, Any] = {"messages": [{"content": user_text}], "flow": [], "mode": mode}
+    steps = [step for step in build_email_steps(llm, mode=mode, max_retries=max_retries) if step.name in SHARED_STEPS]
+    await run_dag(steps, shared, on_step=on_step)
+
+    states = await asyncio.gather(*(
+        _variant(shared, tone, llm, on_step, mode, rewrite_mode, max_retries) for tone in tones
+    ))
+    variants = dict(zip(tones, states))
+    shared_calls = run_summary(shared["flow"])["llm_calls"]
+    variant_calls = sum(state["run_metrics"]["llm_calls"] for state in states)
+    stats = {
+        "tones": list(tones),
+        "llm_calls": shared_calls + variant_calls,
+        # What one full run per tone would have cost.
+        "llm_calls_saved": shared_calls * (len(tones) - 1),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+    return {"shared": shared, "variants": variants, "stats": stats}
+
+def run_tone_variants(
+    user_text: str,
+    llm=None,
+    tones: Sequence[str] = TONES,
+    on_step: Optional[StepCallback] = None,
+    mode: str = "pipeline",
+    rewrite_mode: str = REWRITE_MODE,
+    max_retries: int = MAX_REWRITES,
+) -> Dict[str, Any]:
+    return run_sync(arun_tone_variants(
+        user_text, llm=llm, tones=tones, on_step=on_step, mode=mode,
+        rewrite_mode=rewrite_mode, max_retries=max_retries,
+    ))
+
+# ===========================
+# CLI
+# ===========================
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Draft one email in several tones at once.")
+    prompt = parser.add_mutually_exclusive_group(required=True)
+    prompt.add_argument("--prompt", help="intent prompt")
+    prompt.add_argument("--prompt-file", help="file containing the intent prompt")
+    parser.add_argument("--tones", default=",".join(TONES), help="comma-separated tones")
+    parser.add_argument("--mode", choices=MODES, default="pipeline",
+                        help="'fused' does the draft and review of each tone in one LLM call")
+    parser.add_argument("-o", "--output", default="-", help="JSON output file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    user_text = args.prompt
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            user_text = f.read()
+    tones = [tone.strip() for tone in args.tones.split(",") if tone.strip()]
+    result = run_tone_variants(user_text, tones=tones, mode=args.mode)
+
+    drafts = {tone: state.get("personalized_draft") or state.get("draft") or {}
+              for tone, state in result["variants"].items()}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        out.write(json.dumps(drafts, indent=2, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(result["stats"]), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())